@@ -1,7 +1,6 @@
 import os
 
 from langchain_core.tools import tool
-from langchain_core.output_parsers import StrOutputParser
 from langchain.prompts import ChatPromptTemplate
 from langgraph.types import interrupt
 from langchain_core.runnables.config import RunnableConfig
@@ -13,6 +12,7 @@ from typing_extensions import TypedDict, Annotated
 
 from giga_agent.utils.lang import LANG
 from giga_agent.utils.llm import load_llm
+from giga_agent.utils.llm_cache import cached_ainvoke
 
 llm = load_llm().with_config(tags=["nostream"])
 
@@ -86,8 +86,13 @@ async def ask_llm(state: LeanGraphState, question: str, config: RunnableConfig)
         language=LANG
     )
 
-    chain = prompt | llm | StrOutputParser()
-    return await chain.ainvoke({"state": state_to_string(state), "question": question})
+    messages = prompt.format_messages(
+        state=state_to_string(state), question=question
+    )
+    thread_id = (config.get("configurable") or {}).get("thread_id")
+    return (
+        await cached_ainvoke(llm, messages, site="lean_canvas", scope=thread_id)
+    ).content
 
 
 async def customer_segments(state: LeanGraphState, config: RunnableConfig):
@@ -21,5 +21,6 @@ class PodcastState(TypedDict):
     question: str
     tone: Literal["entertaining", "formal"]
     length: Literal["short", "medium"]
-    audio: str
+    # sha256 mp3 в blob store (giga_agent.utils.blob_store)
+    audio_blob: str
     transcript: str
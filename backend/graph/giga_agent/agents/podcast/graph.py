@@ -1,5 +1,4 @@
 import asyncio
-import base64
 import os
 import uuid
 from typing import Optional, Annotated
@@ -31,6 +30,7 @@ from giga_agent.agents.podcast.tts_sber import (
     get_sber_tts_token,
 )
 from giga_agent.agents.podcast.utils import parse_url, generate_script
+from giga_agent.utils.blob_store import get_blob_store
 from giga_agent.utils.lang import LANG
 from giga_agent.utils.env import load_project_env
 from giga_agent.utils.messages import filter_tool_calls
@@ -134,8 +134,9 @@ async def audio_gen(state: PodcastState):
     audio_file = await asyncio.to_thread(combined_audio.export, format="mp3")
     audio_bytes = await asyncio.to_thread(audio_file.read)
 
-    audio = base64.b64encode(audio_bytes).decode("ascii")
-    return {"audio": audio, "transcript": transcript}
+    # MP3 не попадает в чекпоинты: в состоянии только его sha256
+    audio_blob = await get_blob_store().aput(audio_bytes)
+    return {"audio_blob": audio_blob, "transcript": transcript}
 
 
 workflow = StateGraph(PodcastState, ConfigSchema)
@@ -214,7 +215,7 @@ async def podcast_generate(
         "transcript": state.get("transcript"),
         "message": f'В результате выполнения было сгенерирован аудио-файл {file_id}. Покажи его пользователю через "![Аудио](audio:{file_id})" и напиши ответ с краткой информацией по подкасту',
         "giga_attachments": [
-            {"type": "audio/mp3", "file_id": file_id, "data": state.get("audio")}
+            {"type": "audio/mp3", "file_id": file_id, "blob": state.get("audio_blob")}
         ],
     }
 
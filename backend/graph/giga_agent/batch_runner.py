@@ -0,0 +1,395 @@
+"""
+Пакетный запуск демо-задач tasks_app через граф `chat`.
+
+Каждая задача выполняется в своем треде LangGraph API, одновременно — не больше
+`GIGA_AGENT_BATCH_CONCURRENCY` задач:
+- сообщение и файлы задачи отправляются так же, как их отправляет DemoChat;
+- `steps` — бюджет шагов: число ответов узла `agent`; после его исчерпания
+  запуск отменяется, как фронтенд завершает демо после `steps` ответов;
+- вызовы, для которых граф спрашивает подтверждение, решаются политикой
+  `GIGA_AGENT_BATCH_APPROVAL_POLICY` (формат — как у `GIGA_AGENT_APPROVAL_POLICY`):
+  allow — подтверждаем, иначе отклоняем с комментарием. Без политики
+  разрешены только инструменты только для чтения (`GIGA_AGENT_SPECULATIVE_TOOLS`),
+  остальные — запуск кода, GitHub, календарь и т.п. — отклоняются;
+- по каждой задаче пишутся время, шаги, вызовы инструментов и токены LLM,
+  по пакету — пропускная способность и перцентили времени.
+
+Запуск из консоли (задачи и граф берутся из LangGraph API):
+    python -m giga_agent.batch_runner --url http://127.0.0.1:2024 --concurrency 4
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+from uuid import uuid4
+
+from langgraph_sdk import get_client
+
+from giga_agent.utils import metrics
+from giga_agent.utils.approval import ALLOW, DENY, ApprovalPolicy, ApprovalRule
+from giga_agent.utils.env import load_project_env
+from giga_agent.utils.speculation import SPECULATIVE_TOOLS
+
+load_project_env()
+
+BATCH_CONCURRENCY = int(os.getenv("GIGA_AGENT_BATCH_CONCURRENCY", 4))
+BATCH_ASSISTANT = os.getenv("GIGA_AGENT_BATCH_ASSISTANT", "chat")
+BATCH_USER_ID = "batch"
+# Задачи идут минутами, поэтому корзины до 30 минут
+TASK_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+
+
+def load_batch_policy() -> ApprovalPolicy:
+    value = os.getenv("GIGA_AGENT_BATCH_APPROVAL_POLICY")
+    if not value:
+        return ApprovalPolicy(
+            rules=[
+                ApprovalRule(tool=name, action=ALLOW)
+                for name in sorted(SPECULATIVE_TOOLS)
+            ],
+            default=DENY,
+        )
+    return ApprovalPolicy.from_env(value)
+
+
+def task_input(json_data: dict) -> dict:
+    """Первое сообщение задачи в том же виде, что отправляет DemoChat."""
+    message = json_data.get("message", "")
+    return {
+        "messages": [
+            {
+                "type": "human",
+                "content": message,
+                "additional_kwargs": {
+                    "user_input": message,
+                    "files": json_data.get("attachments", []),
+                },
+            }
+        ]
+    }
+
+
+def message_usage(message: dict) -> tuple[int, int]:
+    """Токены (входные, выходные) из usage_metadata или token_usage ответа LLM."""
+    usage = message.get("usage_metadata") or {}
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (message.get("response_metadata") or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class TaskResult:
+    def __init__(self, task_id: str, steps_budget: int):
+        self.task_id = task_id
+        self.steps_budget = steps_budget
+        self.thread_id: Optional[str] = None
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.wall_time: Optional[float] = None
+        self.steps = 0
+        self.tool_calls: Counter = Counter()
+        self.approvals: Counter = Counter()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        # id сообщений, уже учтенных: после resume узел может вернуть их снова
+        self._seen: set = set()
+
+    def record_message(self, message: dict):
+        message_id = message.get("id")
+        if message_id is not None:
+            if message_id in self._seen:
+                return
+            self._seen.add(message_id)
+        if message.get("type") not in ("ai", "AIMessageChunk"):
+            return
+        input_tokens, output_tokens = message_usage(message)
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        for tool_call in message.get("tool_calls") or []:
+            self.tool_calls[tool_call.get("name")] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "task_id": self.task_id,
+            "thread_id": self.thread_id,
+            "status": self.status,
+            "error": self.error,
+            "wall_time": self.wall_time,
+            "steps": self.steps,
+            "steps_budget": self.steps_budget,
+            "tool_calls": sum(self.tool_calls.values()),
+            "tool_calls_by_name": dict(self.tool_calls),
+            "approvals": dict(self.approvals),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.input_tokens + self.output_tokens,
+        }
+
+
+class BatchRun:
+    """Пакетный запуск: результаты по задачам и сводка."""
+
+    def __init__(self, tasks: list, concurrency: int = BATCH_CONCURRENCY):
+        if concurrency < 1:
+            raise ValueError(f"concurrency должен быть не меньше 1: {concurrency}")
+        self.id = str(uuid4())
+        self.concurrency = concurrency
+        self.tasks = tasks
+        self.results = [
+            TaskResult(task["id"], int(task.get("steps") or 10)) for task in tasks
+        ]
+        self.status = "queued"
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "cancelled")
+
+    def summary(self) -> dict:
+        finished = [r for r in self.results if r.wall_time is not None]
+        times = sorted(r.wall_time for r in finished)
+        wall = (self.finished or time.time()) - self.started if self.started else 0
+        total_tokens = sum(r.input_tokens + r.output_tokens for r in self.results)
+        return {
+            "tasks": len(self.results),
+            "finished": len(finished),
+            "by_status": dict(Counter(r.status for r in self.results)),
+            "wall_time": wall,
+            "tasks_per_minute": len(finished) / wall * 60 if wall else 0,
+            "task_time_p50": statistics.median(times) if times else None,
+            "task_time_p95": times[int(0.95 * (len(times) - 1))] if times else None,
+            "steps": sum(r.steps for r in self.results),
+            "tool_calls": sum(sum(r.tool_calls.values()) for r in self.results),
+            "input_tokens": sum(r.input_tokens for r in self.results),
+            "output_tokens": sum(r.output_tokens for r in self.results),
+            "tokens_per_second": total_tokens / wall if wall else 0,
+        }
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "concurrency": self.concurrency,
+            "summary": self.summary(),
+        }
+        if include_results:
+            data["results"] = [result.to_dict() for result in self.results]
+        return data
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        assistant_id: str = BATCH_ASSISTANT,
+        policy: Optional[ApprovalPolicy] = None,
+        run_timeout: Optional[float] = None,
+    ):
+        # Без url — клиент к LangGraph API того же процесса (внутри tasks_app)
+        self.client = get_client(url=url) if url else get_client()
+        self.assistant_id = assistant_id
+        self.policy = policy or load_batch_policy()
+        self.run_timeout = run_timeout
+
+    def _config(self, steps_left: int) -> dict:
+        configurable = {"user_id": BATCH_USER_ID}
+        if self.run_timeout:
+            configurable["run_timeout"] = self.run_timeout
+        # agent и tool_call — два шага графа на один ответ модели;
+        # лимит рекурсии — страховка, основной бюджет считается по ответам agent
+        return {"recursion_limit": 2 * steps_left + 4, "configurable": configurable}
+
+    def _resume_value(self, result: TaskResult, pending: Optional[dict]) -> dict:
+        name = (pending or {}).get("name", "")
+        action = self.policy.evaluate(name, (pending or {}).get("args"), BATCH_USER_ID)
+        result.approvals[action] += 1
+        if action == ALLOW:
+            return {"type": "approve"}
+        return {
+            "type": "comment",
+            "message": "Вызов отклонен политикой пакетного запуска, продолжай без него.",
+        }
+
+    async def _run_task(self, task: dict, result: TaskResult):
+        result.status = "running"
+        result.started = time.time()
+        thread = await self.client.threads.create(
+            metadata={"batch": True, "task_id": task["id"]}
+        )
+        result.thread_id = thread["thread_id"]
+        json_data = task["json_data"]
+        if isinstance(json_data, str):
+            json_data = json.loads(json_data)
+        payload = {"input": task_input(json_data)}
+        while True:
+            pending = None
+            interrupted = False
+            exhausted = False
+            stream = self.client.runs.stream(
+                result.thread_id,
+                self.assistant_id,
+                stream_mode=["updates"],
+                config=self._config(result.steps_budget - result.steps),
+                # Закрытие потока отменяет запуск на сервере
+                on_disconnect="cancel",
+                **payload,
+            )
+            async with contextlib.aclosing(stream):
+                async for chunk in stream:
+                    if chunk.event == "error":
+                        raise RuntimeError(
+                            json.dumps(chunk.data, ensure_ascii=False)
+                        )
+                    if chunk.event != "updates" or not isinstance(chunk.data, dict):
+                        continue
+                    for node, update in chunk.data.items():
+                        if node == "__interrupt__":
+                            interrupted = True
+                            continue
+                        messages = (update or {}).get("messages") or []
+                        if isinstance(messages, dict):
+                            messages = [messages]
+                        calls = None
+                        for message in messages:
+                            result.record_message(message)
+                            if message.get("tool_calls"):
+                                calls = message["tool_calls"]
+                        if node == "agent":
+                            result.steps += 1
+                            pending = calls[0] if calls else None
+                            # Ответ без вызовов завершает граф сам, иначе — обрываем
+                            exhausted = (
+                                bool(calls) and result.steps >= result.steps_budget
+                            )
+                    if exhausted:
+                        break
+            if exhausted:
+                result.status = "budget_exhausted"
+                return
+            if not interrupted:
+                result.status = "done"
+                return
+            payload = {"command": {"resume": self._resume_value(result, pending)}}
+
+    async def _run_one(self, batch: BatchRun, index: int, semaphore: asyncio.Semaphore):
+        task, result = batch.tasks[index], batch.results[index]
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await self._run_task(task, result)
+            except asyncio.CancelledError:
+                result.status = "cancelled"
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                result.status = "error"
+                result.error = str(e)
+            finally:
+                result.wall_time = time.perf_counter() - start
+                metrics.observe(
+                    "batch_task_seconds",
+                    result.wall_time,
+                    TASK_BUCKETS,
+                    status=result.status,
+                )
+
+    async def run(self, batch: BatchRun) -> BatchRun:
+        batch.status = "running"
+        batch.started = time.time()
+        semaphore = asyncio.Semaphore(batch.concurrency)
+        try:
+            await asyncio.gather(
+                *(
+                    self._run_one(batch, index, semaphore)
+                    for index in range(len(batch.tasks))
+                )
+            )
+            batch.status = "done"
+        except asyncio.CancelledError:
+            batch.status = "cancelled"
+            raise
+        finally:
+            batch.finished = time.time()
+        return batch
+
+    def start(self, batch: BatchRun) -> BatchRun:
+        """Запускает пакет в фоне (для tasks_app)."""
+        batch.task = asyncio.create_task(self.run(batch))
+        return batch
+
+
+class BatchStore:
+    """Пакетные запуски процесса; хранятся последние `limit`."""
+
+    def __init__(self, limit: int = 20):
+        self.limit = limit
+        self._runs: dict[str, BatchRun] = {}
+
+    def add(self, batch: BatchRun):
+        self._runs[batch.id] = batch
+        finished = [run_id for run_id, run in self._runs.items() if run.done]
+        while len(self._runs) > self.limit and finished:
+            self._runs.pop(finished.pop(0))
+
+    def get(self, batch_id: str) -> Optional[BatchRun]:
+        return self._runs.get(batch_id)
+
+    def list(self) -> list[BatchRun]:
+        return list(self._runs.values())
+
+
+async def fetch_tasks(url: str, task_ids: Optional[list] = None) -> list[dict]:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        response = await client.get("/tasks/", params={"active": "true"})
+        response.raise_for_status()
+        tasks = response.json()
+    if task_ids:
+        tasks = [task for task in tasks if task["id"] in set(task_ids)]
+    return tasks
+
+
+async def main(args):
+    tasks = await fetch_tasks(args.url, args.task)
+    tasks = tasks * args.repeat
+    if args.limit:
+        tasks = tasks[: args.limit]
+    runner = BatchRunner(url=args.url, run_timeout=args.run_timeout)
+    batch = BatchRun(tasks, concurrency=args.concurrency)
+    print(f"Задач: {len(tasks)}, параллельно: {batch.concurrency}")
+    await runner.run(batch)
+    print(f"{'задача':<38} {'статус':<18} {'время, с':>9} {'шаги':>5} {'вызовы':>7} {'токены':>8}")
+    for result in batch.results:
+        data = result.to_dict()
+        print(
+            f"{data['task_id']:<38} {data['status']:<18} {data['wall_time'] or 0:>9.1f} "
+            f"{data['steps']:>5} {data['tool_calls']:>7} {data['total_tokens']:>8}"
+        )
+    print(json.dumps(batch.summary(), ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(batch.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--url", default=os.getenv("LANGGRAPH_API_URL", "http://127.0.0.1:2024")
+    )
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--task", action="append", help="id задачи (можно несколько)")
+    parser.add_argument("--repeat", type=int, default=1, help="повторить каждую задачу")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--run-timeout", type=float, default=None)
+    parser.add_argument("--output", help="JSON с результатами")
+    asyncio.run(main(parser.parse_args()))
@@ -53,7 +53,19 @@ class AgentState(TypedDict):  # noqa: D101
     file_ids: Annotated[List[str], add]
     kernel_id: str
     tool_call_index: int
-    tools: list
+    # Версия каталога инструментов, сами схемы в giga_agent.utils.tool_catalogue
+    tools_version: str
+    # Версия заглушек инструментов, установленных в ядро
+    kernel_bootstrap: str
+
+
+# Поля состояния, которые передаются в ядро и tool server
+TOOL_CONTEXT_KEYS = ("kernel_id", "file_ids", "tool_call_index")
+
+
+def build_tool_context(state: dict) -> dict:
+    """Минимальный контекст вызова инструмента без сообщений и каталога."""
+    return {key: state[key] for key in TOOL_CONTEXT_KEYS if key in state}
 
 
 llm = load_llm()
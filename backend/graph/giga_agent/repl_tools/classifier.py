@@ -0,0 +1,137 @@
+"""
+Классификатор тональности, вынесенный из event loop:
+модель загружается лениво один раз в каждом воркере пула процессов,
+предсказание идет векторизованно чанками float32.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import joblib
+import numpy as np
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+SENTIMENT_MODEL_PATH = os.path.join(
+    __location__,
+    os.getenv("GIGA_AGENT_SENTIMENT_MODEL", "models/sentiment_gigachat.joblib"),
+)
+# Число процессов для инференса, 0 — считать в потоке текущего процесса
+SENTIMENT_WORKERS = int(os.getenv("GIGA_AGENT_SENTIMENT_WORKERS", 1))
+SENTIMENT_CHUNK_SIZE = int(os.getenv("GIGA_AGENT_SENTIMENT_CHUNK_SIZE", 2048))
+
+# Модель внутри процесса (воркера пула или основного процесса)
+_clf = None
+
+
+def probs_to_labels(probas, classes):
+    """
+    Получает матрицу вероятностей (n × k) и список классов,
+    возвращает массив меток длиной n.
+    """
+    idx = np.argmax(probas, axis=1)  # позиция максимальной вероятности по строке
+    return classes[idx]
+
+
+def _load_model(model_path: str):
+    global _clf
+    if _clf is None:
+        _clf = joblib.load(model_path)
+    return _clf
+
+
+def _predict_proba_chunk(model_path: str, X: np.ndarray) -> np.ndarray:
+    clf = _load_model(model_path)
+    return clf.predict_proba(X).astype("float32", copy=False)
+
+
+def _model_classes(model_path: str) -> np.ndarray:
+    return _load_model(model_path).classes_
+
+
+class SentimentClassifier:
+    def __init__(
+        self,
+        model_path: str = SENTIMENT_MODEL_PATH,
+        workers: int = SENTIMENT_WORKERS,
+        chunk_size: int = SENTIMENT_CHUNK_SIZE,
+    ):
+        self.model_path = model_path
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._executor: Optional[Executor] = None
+        self._classes: Optional[np.ndarray] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn: fork процесса с потоками (to_thread, uvicorn) может зависнуть
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_load_model,
+                    initargs=(self.model_path,),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor
+
+    @property
+    def classes(self) -> list[str]:
+        """Метки классов; до первого предсказания модель загружается здесь."""
+        if self._classes is None:
+            self.preload()
+        return [str(c) for c in self._classes]
+
+    def preload(self):
+        """
+        Загружает модель в текущем процессе: метки классов и инференс при
+        workers=0. Воркеры пула (spawn) загружают модель сами при старте.
+        """
+        self._classes = _load_model(self.model_path).classes_
+
+    async def apredict(
+        self, X: np.ndarray, return_probabilities: bool = False
+    ) -> tuple[list[str], Optional[np.ndarray]]:
+        """Возвращает метки и (опционально) матрицу вероятностей n × k."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        if self._classes is None:
+            self._classes = await loop.run_in_executor(
+                executor, _model_classes, self.model_path
+            )
+        X = np.ascontiguousarray(X, dtype="float32")
+        if len(X) == 0:
+            empty = np.zeros((0, len(self._classes)), dtype="float32")
+            return [], empty if return_probabilities else None
+        chunks = [X[i : i + self.chunk_size] for i in range(0, len(X), self.chunk_size)]
+        probas = np.vstack(
+            await asyncio.gather(
+                *[
+                    loop.run_in_executor(
+                        executor, _predict_proba_chunk, self.model_path, chunk
+                    )
+                    for chunk in chunks
+                ]
+            )
+        )
+        labels = probs_to_labels(probas, self._classes).tolist()
+        return labels, probas if return_probabilities else None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_CLASSIFIER_SINGLETON: Optional[SentimentClassifier] = None
+
+
+def get_sentiment_classifier() -> SentimentClassifier:
+    global _CLASSIFIER_SINGLETON
+
+    if _CLASSIFIER_SINGLETON is None:
+        _CLASSIFIER_SINGLETON = SentimentClassifier()
+    return _CLASSIFIER_SINGLETON
@@ -1,6 +1,67 @@
+import logging
+import os
+
 from langchain_core.output_parsers.json import JsonOutputParser
 
 from giga_agent.utils.llm import load_llm
+from giga_agent.utils.llm_cache import cached_ainvoke
+
+logger = logging.getLogger(__name__)
+
+# Сколько токенов текстов отправлять в один вызов LLM при суммаризации
+SUMMARIZE_CHUNK_TOKENS = int(os.getenv("GIGA_AGENT_SUMMARIZE_CHUNK_TOKENS", 6000))
+# Сколько частей суммаризировать параллельно
+SUMMARIZE_CONCURRENCY = int(os.getenv("GIGA_AGENT_SUMMARIZE_CONCURRENCY", 4))
+
+TEXTS_SEPARATOR = "\n----\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов: ~3 символа на токен для русского текста."""
+    return len(text) // 3 + 1
+
+
+def chunk_texts(texts: list[str], max_tokens: int) -> list[list[str]]:
+    """
+    Жадно группирует тексты в части, каждая из которых помещается в `max_tokens`.
+    Слишком длинные тексты режутся на куски.
+    """
+    max_chars = max_tokens * 3
+    chunks = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        pieces = [text[i : i + max_chars] for i in range(0, len(text), max_chars)] or [
+            text
+        ]
+        for piece in pieces:
+            tokens = estimate_tokens(piece) + estimate_tokens(TEXTS_SEPARATOR)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(current)
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += tokens
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
+
+
+async def _summarize_chunks(llm, chunks: list[list[str]], prompt: str, level: int):
+    inputs = [
+        [("system", prompt + TEXTS_SEPARATOR.join(chunk))] for chunk in chunks
+    ]
+    summaries = [None] * len(inputs)
+    done = 0
+    async for idx, message in llm.abatch_as_completed(
+        inputs, config={"max_concurrency": SUMMARIZE_CONCURRENCY}
+    ):
+        summaries[idx] = message.content
+        done += 1
+        logger.info(
+            "summarize: уровень %s, готово %s/%s частей", level, done, len(inputs)
+        )
+    return summaries
 
 
 async def summarize(texts: list[str], addition: str = "") -> str:
@@ -14,25 +75,47 @@ async def summarize(texts: list[str], addition: str = "") -> str:
     llm = load_llm(tag="fast")
     if addition:
         addition = f"\nОбрати особое внимание на {addition}\n"
-    texts = "\n----\n".join(texts)
+    # Тексты дописываются в конец промпта без str.format: в `addition` и
+    # текстах могут быть фигурные скобки
+    map_prompt = f"""Суммаризируй текста ниже{addition}\n"""
+    reduce_prompt = f"""Ниже приведены суммаризации частей большого набора текстов. Объедини их в одну общую суммаризацию{addition}\n"""
+
+    # Map-reduce: суммаризируем части параллельно, затем суммаризации частей,
+    # пока всё не поместится в один вызов
+    chunks = chunk_texts(texts, SUMMARIZE_CHUNK_TOKENS)
+    prompt = map_prompt
+    level = 0
+    while len(chunks) > 1:
+        level += 1
+        summaries = await _summarize_chunks(llm, chunks, prompt, level)
+        next_chunks = chunk_texts(summaries, SUMMARIZE_CHUNK_TOKENS)
+        if len(next_chunks) >= len(chunks):
+            # Суммаризации не стали короче — объединяем попарно, чтобы редукция сошлась
+            next_chunks = [summaries[i : i + 2] for i in range(0, len(summaries), 2)]
+        chunks = next_chunks
+        prompt = reduce_prompt
     return (
-        await llm.ainvoke(
-            [("system", f"""Суммаризируй текста ниже{addition}\n{texts}""")]
+        await cached_ainvoke(
+            llm,
+            [("system", prompt + TEXTS_SEPARATOR.join(chunks[0]))],
+            site="summarize",
         )
     ).content
 
 
 async def ask(prompt: str) -> str:
     llm = load_llm(tag="fast")
-    return (await llm.ainvoke(input=[("system", prompt)])).content
+    return (await cached_ainvoke(llm, [("system", prompt)], site="ask")).content
 
 
 async def ask_structure(prompt: str, json_schema: str) -> dict:
     llm = load_llm(tag="fast")
     return parse_partial_json(
         (
-            await llm.ainvoke(
-                input=[("system", f"{prompt}. Ответь в формате JSON: {json_schema}")]
+            await cached_ainvoke(
+                llm,
+                [("system", f"{prompt}. Ответь в формате JSON: {json_schema}")],
+                site="ask_structure",
             )
         ).content
     )
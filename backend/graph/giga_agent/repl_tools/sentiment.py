@@ -1,44 +1,30 @@
-import os
+from giga_agent.repl_tools.classifier import get_sentiment_classifier
+from giga_agent.utils.embeddings import get_embeddings_service
 
-import joblib
-import numpy as np
 
-from giga_agent.utils.llm import load_embeddings
-
-
-def probs_to_labels(probas, classes):
-    """
-    Получает матрицу вероятностей (n × k) и список классов,
-    возвращает массив меток длиной n.
-    """
-    idx = np.argmax(probas, axis=1)  # позиция максимальной вероятности по строке
-    return classes[idx]
-
-
-__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
-
-clf = joblib.load(
-    os.path.join(
-        __location__,
-        os.getenv("GIGA_AGENT_SENTIMENT_MODEL", "models/sentiment_gigachat.joblib"),
-    )
-)
-
-
-async def predict_sentiments(texts: list[str]) -> list[str]:
+async def predict_sentiments(
+    texts: list[str], return_probabilities: bool = False
+) -> list[str] | list[dict]:
     """
     Определяет настроение текста в одну из этих меток: ["positive", "negative", "neutral"] Используй в том случае, если нужно определить настроение массива текстов
     Помни, что ты должен вызывать функцию только с именованными агрументами. Пример: predict_sentiments(texts=['текст'])
 
     Args:
         texts: Список текстов на анализ
+        return_probabilities: Если True, для каждого текста вернется словарь {"label": метка, "probabilities": {метка: вероятность}}
     """
     if not all([isinstance(text, str) for text in texts]):
         raise ValueError("All texts must be strings.")
-    emb = load_embeddings()
-    embs = await emb.aembed_documents(texts)
-    X = np.vstack(embs).astype("float32")
-    return list(probs_to_labels(clf.predict_proba(X), clf.classes_))
+    X = await get_embeddings_service().aembed(texts)
+    classifier = get_sentiment_classifier()
+    labels, probas = await classifier.apredict(X, return_probabilities)
+    if not return_probabilities:
+        return labels
+    classes = classifier.classes
+    return [
+        {"label": label, "probabilities": dict(zip(classes, row.tolist()))}
+        for label, row in zip(labels, probas)
+    ]
 
 
 async def get_embeddings(texts: list[str]) -> list[list[float]]:
@@ -50,6 +36,4 @@ async def get_embeddings(texts: list[str]) -> list[list[float]]:
     """
     if not all([isinstance(text, str) for text in texts]):
         raise ValueError("All texts must be strings.")
-    emb = load_embeddings()
-    embs = await emb.aembed_documents(texts)
-    return embs
+    return (await get_embeddings_service().aembed(texts)).tolist()
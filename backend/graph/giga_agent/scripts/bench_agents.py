@@ -0,0 +1,520 @@
+"""
+Сквозной бенчмарк агентов на записанных ответах LLM и инструментов.
+
+Граф чата (`tool_graph`) и подагенты lean_canvas, meme, presentation и landing
+выполняются в этом процессе, а GigaChat, генерация изображений, tool server и REPL
+заменены заглушкой `giga_agent.scripts.replay_stub_server` в отдельном процессе.
+Она отвечает записями из `bench_fixtures/<сценарий>.json`, поэтому прогоны
+повторяемы и не зависят от сети и квот.
+
+Для каждого сценария (медиана по `--repeat` запускам после прогрева):
+- время запуска целиком и время каждого узла графа;
+- байты чекпоинтов (InMemorySaver с сериализацией LangGraph);
+- блокировки event loop: суммарное опоздание пробной задачи сверх
+  LOOP_BLOCK_THRESHOLD и максимальное опоздание;
+- пик памяти Python (tracemalloc) — в отдельном прогоне, он замедляет код.
+
+Результаты сравниваются с baseline: метрика, выросшая больше допуска, —
+регрессия, скрипт завершается с кодом 1. В репозитории (`bench_fixtures/baseline.json`)
+лежат только метрики, не зависящие от машины: байты чекпоинтов, число вызовов
+LLM и interrupt. Времена, блокировки loop и память сравниваются с локальным
+`bench_fixtures/baseline.local.json` (не коммитится), если он снят на этой машине.
+`--update-baseline` перезаписывает оба файла.
+
+podcast, city_explore, calendar, pc и tinkoff ходят в свои внешние API
+(SaluteSpeech, 2GIS, Google Calendar, локальная система, Tinkoff Invest)
+мимо LLM и tool server, поэтому в бенчмарк не входят.
+
+Новый сценарий можно записать с настоящими сервисами: файл с `name`, `graph`
+и `input`, затем
+    python -m giga_agent.scripts.bench_agents --scenarios my --record \\
+        --upstream-gigachat https://gigachat.devices.sberbank.ru/api/v1
+(credentials GigaChat берутся из окружения, как обычно).
+
+Запуск:
+    python -m giga_agent.scripts.bench_agents
+    python -m giga_agent.scripts.bench_agents --scenarios chat meme --repeat 5
+    python -m giga_agent.scripts.bench_agents --update-baseline
+"""
+import argparse
+import asyncio
+import glob
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from uuid import uuid4
+
+import aiohttp
+import requests
+from langchain_core.callbacks import BaseCallbackHandler
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "bench_fixtures")
+BASELINE_PATH = os.path.join(FIXTURES_DIR, "baseline.json")
+LOCAL_BASELINE_PATH = os.path.join(FIXTURES_DIR, "baseline.local.json")
+# Метрики, одинаковые на любой машине: только они попадают в baseline.json
+PORTABLE_METRICS = ("checkpoint_bytes", "interrupts", "llm_calls")
+
+# Имя графа из langgraph.json -> (модуль, StateGraph до compile)
+GRAPHS = {
+    "chat": ("giga_agent.tool_graph", "workflow"),
+    "lean_canvas": ("giga_agent.agents.lean_canvas", "graph"),
+    "meme": ("giga_agent.agents.meme_agent.graph", "workflow"),
+    "presentation": ("giga_agent.agents.presentation_agent.graph", "workflow"),
+    "landing": ("giga_agent.agents.landing_agent.graph", "workflow"),
+}
+
+LOOP_PROBE_INTERVAL = 0.005
+# Опоздание пробной задачи больше порога считается блокировкой loop
+LOOP_BLOCK_THRESHOLD = 0.01
+MAX_INTERRUPTS = 20
+
+# метрика -> (относительный допуск, абсолютный порог): рост меньше порога — шум
+TOLERANCES = {
+    "wall_ms": (0.25, 100),
+    "checkpoint_bytes": (0.05, 2048),
+    "llm_calls": (0.0, 0),
+    "loop_blocked_ms": (0.5, 100),
+    "peak_mb": (0.2, 2),
+}
+NODE_TOLERANCE = (0.25, 50)
+
+
+def configure_env(stub_url: str, record: bool, blob_dir: str):
+    """Переводит LLM, генерацию изображений, tool server и REPL на заглушку.
+
+    Вызывается до импорта графов: модели создаются при импорте модулей.
+    """
+    # Записи сделаны для модели GigaChat (заглушка отвечает и в протоколе OpenAI)
+    for name in ("GIGA_AGENT_LLM", "GIGA_AGENT_LLM_FAST"):
+        if not os.getenv(name, "").startswith("gigachat:"):
+            os.environ[name] = "gigachat:GigaChat-2-Max"
+    os.environ.setdefault("GIGA_AGENT_EMBEDDINGS", "gigachat:Embeddings")
+    os.environ.update(
+        {
+            "GIGACHAT_BASE_URL": f"{stub_url}/gigachat",
+            "IMAGE_GEN_NAME": "openai:dall-e-3",
+            "OPENAI_BASE_URL": f"{stub_url}/openai",
+            "OPENAI_API_KEY": "bench",
+            "TOOL_CLIENT_API": f"{stub_url}/tools",
+            "JUPYTER_CLIENT_API": f"{stub_url}/repl",
+            "GIGA_AGENT_BLOB_DIR": blob_dir,
+            # Кэш LLM отдал бы ответ без запроса к заглушке
+            "GIGA_AGENT_LLM_CACHE": "",
+        }
+    )
+    if not record:
+        # Фиктивные credentials: токен выдает OAuth заглушки
+        os.environ.update(
+            {
+                "GIGACHAT_CREDENTIALS": "bench",
+                "MAIN_GIGACHAT_CREDENTIALS": "bench",
+                "GIGACHAT_AUTH_URL": f"{stub_url}/gigachat/oauth",
+                "GIGACHAT_TOKEN_INFO_URL": f"{stub_url}/gigachat/token",
+            }
+        )
+
+
+def load_scenarios(names: list[str] | None) -> list[dict]:
+    scenarios = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json"))):
+        if os.path.basename(path).startswith("baseline"):
+            continue
+        with open(path, encoding="utf-8") as f:
+            scenario = json.load(f)
+        if names and scenario["name"] not in names:
+            continue
+        scenarios.append(scenario)
+    return scenarios
+
+
+def start_stub(port: int, args) -> subprocess.Popen:
+    cmd = [
+        sys.executable,
+        "-m",
+        "giga_agent.scripts.replay_stub_server",
+        "--port",
+        str(port),
+        "--llm-delay",
+        str(args.llm_delay),
+    ]
+    for section in ("gigachat", "tools", "repl"):
+        upstream = getattr(args, f"upstream_{section}")
+        if upstream:
+            cmd += [f"--upstream-{section}", upstream]
+    process = subprocess.Popen(cmd)
+    url = f"http://127.0.0.1:{port}/_health"
+    started = time.perf_counter()
+    while time.perf_counter() - started < 120:
+        if process.poll() is not None:
+            raise RuntimeError("Заглушка завершилась при старте")
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise TimeoutError("Заглушка не ответила за 120 с")
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Время узлов графа: запуск узла — цепочка с именем из `langgraph_node`."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.started = {}
+        self.totals = defaultdict(float)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node is not None and kwargs.get("name") == node:
+            self.started[run_id] = (node, time.perf_counter())
+
+    def _finish(self, run_id):
+        item = self.started.pop(run_id, None)
+        if item is not None:
+            node, started = item
+            self.totals[node] += time.perf_counter() - started
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        # interrupt() завершает узел исключением GraphInterrupt
+        self._finish(run_id)
+
+    def totals_ms(self) -> dict:
+        return {node: seconds * 1000 for node, seconds in self.totals.items()}
+
+
+class LoopProbe:
+    """Пробная задача: просыпается каждые `interval` с и копит свое опоздание."""
+
+    def __init__(
+        self,
+        interval: float = LOOP_PROBE_INTERVAL,
+        threshold: float = LOOP_BLOCK_THRESHOLD,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - expected
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.blocked += lag
+                self.stalls += 1
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def checkpoint_bytes(saver) -> int:
+    def size(obj) -> int:
+        if isinstance(obj, (bytes, bytearray)):
+            return len(obj)
+        if isinstance(obj, dict):
+            return sum(size(v) for v in obj.values())
+        if isinstance(obj, (list, tuple)):
+            return sum(size(v) for v in obj)
+        return 0
+
+    return size(saver.storage) + size(saver.blobs) + size(saver.writes)
+
+
+class Bench:
+    def __init__(self, stub_url: str, record: bool = False):
+        self.stub_url = stub_url
+        self.record = record
+        self.session = None
+        self.graphs = {}
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def _stub(self, method: str, path: str, **kwargs) -> dict:
+        async with self.session.request(method, self.stub_url + path, **kwargs) as res:
+            return await res.json()
+
+    def workflow(self, name: str):
+        if name not in self.graphs:
+            module, attr = GRAPHS[name]
+            self.graphs[name] = getattr(importlib.import_module(module), attr)
+        return self.graphs[name]
+
+    async def run(self, scenario: dict, trace_memory: bool = False) -> dict:
+        from langchain_core.messages import convert_to_messages
+        from langgraph.checkpoint.memory import InMemorySaver
+        from langgraph.store.memory import InMemoryStore
+        from langgraph.types import Command
+
+        await self._stub(
+            "POST", f"/_scenario/{scenario['name']}", json={"record": self.record}
+        )
+        saver = InMemorySaver()
+        graph = self.workflow(scenario["graph"]).compile(
+            checkpointer=saver, store=InMemoryStore()
+        )
+        payload = dict(scenario["input"])
+        for key, value in payload.items():
+            if key.endswith("messages"):
+                payload[key] = convert_to_messages(value)
+        timer = NodeTimer()
+        config = {
+            "configurable": {"thread_id": str(uuid4()), **scenario.get("configurable", {})},
+            "callbacks": [timer],
+            "recursion_limit": 100,
+        }
+        resume = scenario.get("resume", {"type": "approve"})
+        probe = LoopProbe()
+        if trace_memory:
+            tracemalloc.start()
+        probe.start()
+        started = time.perf_counter()
+        interrupts = 0
+        try:
+            while True:
+                interrupted = False
+                async for mode, chunk in graph.astream(
+                    payload, config, stream_mode=["updates", "messages"]
+                ):
+                    if mode == "updates" and "__interrupt__" in chunk:
+                        interrupted = True
+                if not interrupted:
+                    break
+                interrupts += 1
+                if interrupts > MAX_INTERRUPTS:
+                    raise RuntimeError("Слишком много interrupt подряд")
+                payload = Command(resume=resume)
+            wall = time.perf_counter() - started
+        finally:
+            await probe.stop()
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+            if trace_memory:
+                tracemalloc.stop()
+        status = await self._stub("GET", "/_scenario")
+        if self.record:
+            await self._stub("POST", f"/_scenario/{scenario['name']}/save")
+        elif status["misses"]:
+            raise RuntimeError(f"Нет записей для запросов: {status['misses']}")
+        return {
+            "wall_ms": wall * 1000,
+            "nodes": timer.totals_ms(),
+            "checkpoint_bytes": checkpoint_bytes(saver),
+            "loop_blocked_ms": probe.blocked * 1000,
+            "loop_max_lag_ms": probe.max_lag * 1000,
+            "loop_stalls": probe.stalls,
+            "interrupts": interrupts,
+            "llm_calls": status["used"]["llm"],
+            "unused": {k: v for k, v in status["unused"].items() if v},
+            "peak_mb": peak / 1024 / 1024,
+        }
+
+
+def median_result(runs: list[dict], memory: dict) -> dict:
+    result = {
+        key: statistics.median(run[key] for run in runs)
+        for key in (
+            "wall_ms",
+            "checkpoint_bytes",
+            "loop_blocked_ms",
+            "loop_max_lag_ms",
+            "loop_stalls",
+            "interrupts",
+            "llm_calls",
+        )
+    }
+    nodes = sorted({node for run in runs for node in run["nodes"]})
+    result["nodes"] = {
+        node: statistics.median(run["nodes"].get(node, 0.0) for run in runs)
+        for node in nodes
+    }
+    result["peak_mb"] = memory["peak_mb"]
+    result["unused"] = runs[-1]["unused"]
+    return result
+
+
+def regressed(current: float, baseline: float, tolerance: tuple) -> bool:
+    relative, absolute = tolerance
+    return current - baseline > max(baseline * relative, absolute)
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float) -> list[str]:
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, tolerance in TOLERANCES.items():
+            if metric.endswith("_ms"):
+                tolerance = (time_tolerance, tolerance[1])
+            if metric in base and regressed(result[metric], base[metric], tolerance):
+                problems.append(
+                    f"{name}: {metric} {base[metric]:.1f} -> {result[metric]:.1f}"
+                )
+        for node, value in result["nodes"].items():
+            before = base.get("nodes", {}).get(node)
+            tolerance = (time_tolerance, NODE_TOLERANCE[1])
+            if before is not None and regressed(value, before, tolerance):
+                problems.append(f"{name}: узел {node} {before:.1f} -> {value:.1f} мс")
+    return problems
+
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def merge_baselines(portable: dict, local: dict) -> dict:
+    """Локальный baseline дополняет общий; общие метрики берутся из общего."""
+    merged = {name: dict(values) for name, values in local.items()}
+    for name, values in portable.items():
+        merged.setdefault(name, {}).update(values)
+    return merged
+
+
+def save_baseline(path: str, baseline: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def print_results(results: dict):
+    print(
+        f"{'сценарий':<14} {'время, мс':>10} {'LLM':>4} {'чекпоинты, КБ':>14} "
+        f"{'блок. loop, мс':>15} {'макс. лаг, мс':>14} {'пик, МБ':>8}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:<14} {r['wall_ms']:>10.1f} {r['llm_calls']:>4.0f} "
+            f"{r['checkpoint_bytes'] / 1024:>14.1f} {r['loop_blocked_ms']:>15.1f} "
+            f"{r['loop_max_lag_ms']:>14.1f} {r['peak_mb']:>8.1f}"
+        )
+    for name, r in results.items():
+        print(f"\n{name}: узлы, мс")
+        for node, value in sorted(r["nodes"].items(), key=lambda item: -item[1]):
+            print(f"  {node:<28} {value:>10.1f}")
+        if r["unused"]:
+            print(f"  неиспользованные записи: {r['unused']}")
+
+
+async def main(args) -> int:
+    stub_url = f"http://127.0.0.1:{args.port}"
+    record = bool(args.record)
+    blob_dir = tempfile.mkdtemp(prefix="bench_blobs_")
+    configure_env(stub_url, record, blob_dir)
+    scenarios = load_scenarios(args.scenarios)
+    stub = start_stub(args.port, args)
+    results = {}
+    try:
+        async with Bench(stub_url, record=record) as bench:
+            for scenario in scenarios:
+                if record:
+                    await bench.run(scenario)
+                    print(f"{scenario['name']}: записано")
+                    continue
+                # Прогрев: импорт графа, каталог инструментов, первые соединения
+                await bench.run(scenario)
+                runs = [await bench.run(scenario) for _ in range(args.repeat)]
+                memory = await bench.run(scenario, trace_memory=True)
+                results[scenario["name"]] = median_result(runs, memory)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=30)
+    if record:
+        return 0
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    portable = load_baseline(args.baseline)
+    local = load_baseline(args.local_baseline)
+    baseline = merge_baselines(portable, local)
+    if args.update_baseline:
+        for name, result in results.items():
+            result = {
+                key: round(value, 1) if isinstance(value, float) else value
+                for key, value in result.items()
+                if key != "unused"
+            }
+            result["nodes"] = {
+                node: round(value, 1) for node, value in result["nodes"].items()
+            }
+            portable[name] = {key: result[key] for key in PORTABLE_METRICS}
+            local[name] = {
+                key: value
+                for key, value in result.items()
+                if key not in PORTABLE_METRICS
+            }
+        save_baseline(args.baseline, portable)
+        save_baseline(args.local_baseline, local)
+        print(f"\nBaseline обновлен: {args.baseline}, {args.local_baseline}")
+        return 0
+    problems = compare(results, baseline, args.tolerance)
+    if problems:
+        print("\nРегрессии относительно baseline:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    if not baseline:
+        print("\nBaseline не найден")
+    elif not local:
+        print(
+            "\nРегрессий нет; времена не сравнивались: нет локального baseline "
+            "(--update-baseline на этой машине)"
+        )
+    else:
+        print("\nРегрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--port", type=int, default=9393)
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Задержка LLM, с")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--local-baseline", default=LOCAL_BASELINE_PATH, help="Времена этой машины"
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Допуск роста времени, доля"
+    )
+    parser.add_argument("--output", default=None, help="Сохранить результаты в JSON")
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--upstream-gigachat", default=None)
+    parser.add_argument("--upstream-tools", default=None)
+    parser.add_argument("--upstream-repl", default=None)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,166 @@
+"""
+Бенчмарк размера чекпоинтов: сколько байт записывается на шаг графа
+при хранении всего каталога инструментов в состоянии (как раньше)
+и при хранении только его версии.
+
+Граф повторяет форму `tool_graph` (agent -> tool_call -> agent ...),
+узлы не ходят в LLM и tool server. Сериализация — JsonPlusSerializer,
+как у чекпоинтеров LangGraph.
+
+Запуск:
+    python -m giga_agent.scripts.bench_checkpoint --rounds 10
+    python -m giga_agent.scripts.bench_checkpoint --tools-url http://127.0.0.1:9091
+"""
+import argparse
+import asyncio
+import json
+from operator import add
+from typing import Annotated, List, TypedDict
+from uuid import uuid4
+
+import requests
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import StateGraph, add_messages
+
+from giga_agent.utils.tool_catalogue import register_catalogue
+
+
+class LegacyState(TypedDict):
+    messages: Annotated[list[AnyMessage], add_messages]
+    file_ids: Annotated[List[str], add]
+    kernel_id: str
+    tool_call_index: int
+    tools: list
+
+
+class SlimState(TypedDict):
+    messages: Annotated[list[AnyMessage], add_messages]
+    file_ids: Annotated[List[str], add]
+    kernel_id: str
+    tool_call_index: int
+    tools_version: str
+
+
+def synthetic_catalogue(count: int) -> list:
+    """Каталог, похожий по размеру на реальный ответ `/tools`."""
+    tools = []
+    for i in range(count):
+        tools.append(
+            {
+                "name": f"tool_{i}",
+                "description": "Описание инструмента и правил его использования. " * 8,
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        f"arg_{j}": {
+                            "type": "string",
+                            "description": "Описание аргумента инструмента. " * 3,
+                        }
+                        for j in range(4)
+                    },
+                    "required": ["arg_0"],
+                },
+            }
+        )
+    return tools
+
+
+def build_graph(state_cls, tools: list, rounds: int, result_size: int):
+    slim = state_cls is SlimState
+    version = register_catalogue(tools)
+
+    def agent(state):
+        update = {
+            "messages": [
+                AIMessage(
+                    content="",
+                    tool_calls=[
+                        {"name": "tool_0", "args": {"arg_0": "x"}, "id": str(uuid4())}
+                    ],
+                )
+            ],
+            "kernel_id": "kernel",
+            "file_ids": [],
+        }
+        if slim:
+            update["tools_version"] = version
+        else:
+            update["tools"] = tools
+        return update
+
+    def tool_call(state):
+        last = state["messages"][-1]
+        return {
+            "messages": [
+                ToolMessage(
+                    tool_call_id=last.tool_calls[0]["id"],
+                    content=json.dumps({"data": "x" * result_size}),
+                )
+            ],
+            "tool_call_index": state.get("tool_call_index", -1) + 1,
+            "file_ids": [],
+        }
+
+    def router(state):
+        done = state.get("tool_call_index", -1) + 1 >= rounds
+        return "__end__" if done else "tool_call"
+
+    workflow = StateGraph(state_cls)
+    workflow.add_node(agent)
+    workflow.add_node(tool_call)
+    workflow.add_edge("__start__", "agent")
+    workflow.add_conditional_edges("agent", router)
+    workflow.add_edge("tool_call", "agent")
+    return workflow
+
+
+def _bytes_size(obj) -> int:
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(_bytes_size(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_bytes_size(v) for v in obj)
+    return 0
+
+
+async def run(state_cls, tools: list, rounds: int, result_size: int) -> dict:
+    saver = InMemorySaver()
+    graph = build_graph(state_cls, tools, rounds, result_size).compile(
+        checkpointer=saver
+    )
+    config = {"configurable": {"thread_id": "bench"}, "recursion_limit": 4 * rounds + 10}
+    await graph.ainvoke({"messages": [HumanMessage(content="привет")]}, config)
+    steps = len([c async for c in saver.alist(config)])
+    total = _bytes_size(saver.storage) + _bytes_size(saver.blobs) + _bytes_size(
+        saver.writes
+    )
+    return {"steps": steps, "bytes": total, "bytes_per_step": total / steps}
+
+
+async def main(args):
+    if args.tools_url:
+        tools = requests.get(f"{args.tools_url}/tools", timeout=60).json()
+    else:
+        tools = synthetic_catalogue(args.tools)
+    print(
+        f"Каталог: {len(tools)} инструментов, "
+        f"{len(json.dumps(tools, ensure_ascii=False).encode())} байт JSON"
+    )
+    print(f"{'state':>8} {'steps':>6} {'bytes':>12} {'bytes/step':>12}")
+    for name, state_cls in (("before", LegacyState), ("after", SlimState)):
+        stats = await run(state_cls, tools, args.rounds, args.result_size)
+        print(
+            f"{name:>8} {stats['steps']:>6} {stats['bytes']:>12} "
+            f"{stats['bytes_per_step']:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--tools", type=int, default=25, help="Размер синтетического каталога")
+    parser.add_argument("--tools-url", default=None, help="Взять каталог у tool server")
+    parser.add_argument("--result-size", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+"""
+Бенчмарк вызовов MCP-инструментов: новая сессия на каждый вызов
+(`MultiServerMCPClient.get_tools()`) против постоянных сессий `MCPSessionPool`.
+По умолчанию используется локальный stdio-сервер `giga_agent.scripts.mcp_stub_server`.
+
+Запуск:
+    python -m giga_agent.scripts.bench_mcp --calls 50 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from giga_agent.tool_server.mcp_pool import MCPSessionPool
+from giga_agent.utils import metrics
+
+STUB_CONFIG = {
+    "stub": {
+        "transport": "stdio",
+        "command": sys.executable,
+        "args": ["-m", "giga_agent.scripts.mcp_stub_server"],
+    }
+}
+
+
+async def run_calls(tools, calls: int, concurrency: int) -> tuple[float, set]:
+    tool = next(tool for tool in tools if tool.name == "pid")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            return await tool.ainvoke({})
+
+    started = time.perf_counter()
+    pids = await asyncio.gather(*[call() for _ in range(calls)])
+    return time.perf_counter() - started, set(pids)
+
+
+async def main(args):
+    config = json.loads(args.config) if args.config else STUB_CONFIG
+    print(f"{'mode':>12} {'calls':>6} {'seconds':>8} {'calls/s':>8} {'processes':>10}")
+
+    tools = await MultiServerMCPClient(config).get_tools()
+    elapsed, pids = await run_calls(tools, args.calls, args.concurrency)
+    print(
+        f"{'per-call':>12} {args.calls:>6} {elapsed:>8.2f} "
+        f"{args.calls / elapsed:>8.1f} {len(pids):>10}"
+    )
+
+    pool = MCPSessionPool(config)
+    try:
+        tools = await pool.get_tools()
+        elapsed, pids = await run_calls(tools, args.calls, args.concurrency)
+        print(
+            f"{'pool':>12} {args.calls:>6} {elapsed:>8.2f} "
+            f"{args.calls / elapsed:>8.1f} {len(pids):>10}"
+        )
+    finally:
+        await pool.stop()
+    for item in metrics.snapshot().get("mcp_call_seconds", []):
+        print(
+            f"{item['labels']['server']}.{item['labels']['tool']}: "
+            f"avg {item['avg'] * 1000:.1f} ms, max {item['max'] * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--config", default=None, help="MCP_CONFIG в JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,63 @@
+"""
+Бенчмарк пропускной способности классификатора тональности (тексты/сек).
+
+Эмбединги генерируются случайно, поэтому меряется только инференс классификатора
+и пересылка данных в воркеры, без обращения к API эмбедингов.
+
+Запуск:
+    python -m giga_agent.scripts.bench_sentiment --sizes 1000 10000 --workers 0 1 2
+"""
+import argparse
+import asyncio
+import time
+
+import joblib
+import numpy as np
+
+from giga_agent.repl_tools.classifier import (
+    SENTIMENT_MODEL_PATH,
+    SentimentClassifier,
+    probs_to_labels,
+)
+
+
+def bench_baseline(clf, X: np.ndarray) -> float:
+    """Старый путь: predict_proba целиком в текущем потоке (блокирует event loop)."""
+    start = time.perf_counter()
+    probs_to_labels(clf.predict_proba(X), clf.classes_)
+    return time.perf_counter() - start
+
+
+async def bench_classifier(classifier: SentimentClassifier, X: np.ndarray) -> float:
+    # Прогрев: поднимаем пул и загружаем модель в воркерах
+    await classifier.apredict(X[:1])
+    start = time.perf_counter()
+    await classifier.apredict(X)
+    return time.perf_counter() - start
+
+
+async def main(sizes: list[int], workers: list[int], chunk_size: int):
+    clf = joblib.load(SENTIMENT_MODEL_PATH)
+    rng = np.random.default_rng(0)
+    print(f"{'texts':>8} {'mode':>16} {'seconds':>10} {'texts/s':>12}")
+    for size in sizes:
+        X = rng.standard_normal((size, clf.n_features_in_), dtype="float32")
+        elapsed = bench_baseline(clf, X)
+        print(f"{size:>8} {'inline':>16} {elapsed:>10.3f} {size / elapsed:>12.0f}")
+        for n in workers:
+            classifier = SentimentClassifier(workers=n, chunk_size=chunk_size)
+            try:
+                elapsed = await bench_classifier(classifier, X)
+            finally:
+                classifier.shutdown()
+            mode = f"pool[{n}]" if n else "thread"
+            print(f"{size:>8} {mode:>16} {elapsed:>10.3f} {size / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.workers, args.chunk_size))
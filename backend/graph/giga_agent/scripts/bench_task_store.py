@@ -0,0 +1,159 @@
+"""
+Бенчмарк хранилища задач tasks_app на большом числе задач.
+
+- импорт: прежний цикл (`next_sorting` на каждую задачу, autoflush перед
+  каждым max) против `TaskStore.bulk_import` одной транзакцией;
+- список: прежний путь (ORM-объекты, `json.loads` каждой задачи и сериализация
+  FastAPI) против выдачи строк `json_data` без разбора;
+- страница из конца списка: OFFSET против курсора `(sorting, id)`;
+- перенос задачи в начало: сдвиг `sorting` у всех задач против дробного индекса.
+
+Прежний импорт медленный, поэтому он меряется на `--legacy-tasks` задачах.
+
+Запуск:
+    python -m giga_agent.scripts.bench_task_store --tasks 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import update
+from sqlmodel import func, select
+
+from giga_agent.utils.task_store import Task, TaskStore, rows_to_json
+
+PAGE = 50
+
+
+def make_items(count: int) -> list[dict]:
+    return [
+        {
+            "id": str(uuid4()),
+            "json_data": {
+                "message": f"Задача {i}: построй график продаж за {i % 12 + 1} месяц",
+                "attachments": [{"path": f"files/sales_{i % 100}.csv"}],
+            },
+            "steps": 10,
+            "active": i % 2 == 0,
+        }
+        for i in range(count)
+    ]
+
+
+async def legacy_import(store: TaskStore, items: list[dict]):
+    async with store.session() as session:
+        for item in items:
+            result = await session.execute(select(func.max(Task.sorting)))
+            sorting = (result.scalar_one_or_none() or 0) + 1
+            session.add(
+                Task(
+                    id=item["id"],
+                    json_data=json.dumps(item["json_data"], ensure_ascii=False),
+                    steps=item["steps"],
+                    sorting=sorting,
+                    active=item["active"],
+                )
+            )
+        await session.commit()
+
+
+async def legacy_list(store: TaskStore) -> bytes:
+    async with store.session() as session:
+        result = await session.execute(select(Task).order_by(Task.sorting))
+        new_tasks = []
+        for task in result.scalars().all():
+            new_task = task.model_dump()
+            new_task["json_data"] = json.loads(task.json_data)
+            new_tasks.append(new_task)
+    # Как JSONResponse FastAPI
+    return json.dumps(
+        jsonable_encoder(new_tasks), ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+async def legacy_last_page(store: TaskStore, count: int):
+    async with store.session() as session:
+        result = await session.execute(
+            select(Task).order_by(Task.sorting).offset(count - PAGE).limit(PAGE)
+        )
+        return result.scalars().all()
+
+
+async def keyset_last_page(store: TaskStore, count: int):
+    # Курсор предыдущей страницы клиент получает из X-Next-Cursor
+    async with store.session() as session:
+        result = await session.execute(
+            select(Task.sorting, Task.id)
+            .order_by(Task.sorting, Task.id)
+            .offset(count - PAGE - 1)
+            .limit(1)
+        )
+        sorting, task_id = result.one()
+    start = time.perf_counter()
+    rows = await store.list(limit=PAGE, after=f"{sorting}:{task_id}")
+    return rows, time.perf_counter() - start
+
+
+async def legacy_move_to_front(store: TaskStore, task_id: str):
+    async with store.session() as session:
+        await session.execute(update(Task).values(sorting=Task.sorting + 1))
+        await session.execute(
+            update(Task).where(Task.id == task_id).values(sorting=1)
+        )
+        await session.commit()
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+async def main(args):
+    items = make_items(args.tasks)
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_store = TaskStore(os.path.join(directory, "legacy.db"))
+        await legacy_store.init(dump_path=None)
+        legacy_items = items[: args.legacy_tasks]
+        _, legacy_import_time = await timed(legacy_import(legacy_store, legacy_items))
+        await legacy_store.close()
+
+        store = TaskStore(os.path.join(directory, "tasks.db"))
+        await store.init(dump_path=None)
+        _, import_time = await timed(store.bulk_import(items))
+
+        legacy_body, legacy_list_time = await timed(legacy_list(store))
+        rows, list_time = await timed(store.list())
+        body = rows_to_json(rows).encode()
+
+        _, offset_time = await timed(legacy_last_page(store, args.tasks))
+        _, keyset_time = await keyset_last_page(store, args.tasks)
+
+        last_id = rows[-1].id
+        _, move_time = await timed(store.move(last_id, before_id=rows[0].id))
+        _, legacy_move_time = await timed(legacy_move_to_front(store, rows[-2].id))
+        await store.close()
+
+    print(f"Задач: {args.tasks}, прежний импорт на {len(legacy_items)}")
+    print(f"{'операция':<32} {'было, с':>10} {'стало, с':>10}")
+    legacy_import_scaled = legacy_import_time / len(legacy_items) * args.tasks
+    for name, before, after in (
+        ("импорт (прежний — оценка)", legacy_import_scaled, import_time),
+        ("список целиком", legacy_list_time, list_time),
+        (f"последние {PAGE} задач", offset_time, keyset_time),
+        ("перенос задачи в начало", legacy_move_time, move_time),
+    ):
+        print(f"{name:<32} {before:>10.4f} {after:>10.4f}")
+    print(f"Размер ответа списка: {len(legacy_body)} / {len(body)} байт")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=100_000)
+    parser.add_argument("--legacy-tasks", type=int, default=5_000)
+    asyncio.run(main(parser.parse_args()))
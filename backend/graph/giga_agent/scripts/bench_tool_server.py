@@ -0,0 +1,144 @@
+"""
+Бенчмарк запуска tool server: время до готовности `/tools` и память на воркер
+для `uvicorn --workers N` (каждый воркер импортирует все заново)
+и для `giga_agent.tool_server.launcher` (preload + fork).
+
+Память читается из /proc/<pid>/smaps_rollup (только Linux):
+RSS — вся резидентная память, PSS — с учетом общих страниц,
+USS — память, принадлежащая только этому процессу.
+
+Запуск:
+    python -m giga_agent.scripts.bench_tool_server --workers 4
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+MODES = {
+    "uvicorn": [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "giga_agent.tool_server.tool_server:app",
+        "--log-level",
+        "warning",
+    ],
+    "launcher": [
+        sys.executable,
+        "-m",
+        "giga_agent.tool_server.launcher",
+        "--log-level",
+        "warning",
+    ],
+}
+
+
+def children(pid: int) -> list[int]:
+    result = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Имя процесса в скобках может содержать пробелы
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            result.append(int(entry))
+    return result
+
+
+def memory_kb(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":"):
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "uss": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def wait_ready(url: str, timeout: float) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"{url} не ответил за {timeout} с")
+
+
+def bench(mode: str, workers: int, port: int, timeout: float) -> dict:
+    cmd = MODES[mode] + ["--port", str(port), "--workers", str(workers)]
+    process = subprocess.Popen(cmd)
+    try:
+        ready = wait_ready(f"http://127.0.0.1:{port}/tools", timeout)
+        # Ждем, пока поднимутся все воркеры, а не только первый
+        deadline = time.perf_counter() + timeout
+        worker_pids = []
+        while time.perf_counter() < deadline:
+            worker_pids = [
+                pid
+                for pid in children(process.pid)
+                if "resource_tracker" not in open(f"/proc/{pid}/cmdline").read()
+            ]
+            if len(worker_pids) >= workers:
+                break
+            time.sleep(0.2)
+        for _ in range(workers * 4):
+            requests.get(f"http://127.0.0.1:{port}/tools", timeout=10)
+        memory = [memory_kb(pid) for pid in worker_pids]
+        parent = memory_kb(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    total = {
+        key: parent[key] + sum(m[key] for m in memory) for key in ("rss", "pss", "uss")
+    }
+    return {
+        "ready": ready,
+        "workers": len(memory),
+        "worker_rss": sum(m["rss"] for m in memory) / max(len(memory), 1),
+        "worker_uss": sum(m["uss"] for m in memory) / max(len(memory), 1),
+        "total_pss": total["pss"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=9191)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':>10} {'workers':>8} {'ready, s':>10} "
+        f"{'RSS/worker, MB':>15} {'USS/worker, MB':>15} {'PSS total, MB':>14}"
+    )
+    for mode in args.modes:
+        stats = bench(mode, args.workers, args.port, args.timeout)
+        print(
+            f"{mode:>10} {stats['workers']:>8} {stats['ready']:>10.1f} "
+            f"{stats['worker_rss'] / 1024:>15.0f} {stats['worker_uss'] / 1024:>15.0f} "
+            f"{stats['total_pss'] / 1024:>14.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Микробенчмарк накладных расходов tool server на вызов небольшого инструмента
+(без сети): подстановка state, валидация аргументов и сам вызов.
+
+- old: `inject_tool_args` -> `_to_args_and_kwargs` -> `ainvoke` (валидация дважды),
+  при ошибке схема строится через `convert_to_gigachat_tool`;
+- compiled: `inject_tool_args` -> `CompiledTool.validate` -> вызов корутины,
+  схема для ошибки подготовлена заранее.
+
+Запуск:
+    python -m giga_agent.scripts.bench_tool_validation --calls 20000
+"""
+import argparse
+import asyncio
+import time
+from typing import Annotated, Optional
+
+from langchain_core.tools import tool
+from langchain_gigachat.utils.function_calling import convert_to_gigachat_tool
+from langgraph.prebuilt import InjectedState, ToolNode
+from pydantic_core import ValidationError
+
+from giga_agent.tool_server.validators import CompiledTool
+
+
+@tool
+async def add(a: int, b: int) -> int:
+    """Складывает два числа"""
+    return a + b
+
+
+@tool
+async def weather_stub(
+    city: str,
+    days: int = 1,
+    units: Optional[str] = None,
+    state: Annotated[dict, InjectedState] = None,
+) -> dict:
+    """Прогноз погоды для города"""
+    return {"city": city, "days": days, "kernel_id": state.get("kernel_id")}
+
+
+CASES = {
+    "add": (add, {"a": 1, "b": 2}),
+    "weather_stub": (weather_stub, {"city": "Москва", "days": 3}),
+    "add (ошибка)": (add, {"a": "не число", "b": 2}),
+}
+STATE = {"kernel_id": "bench", "file_ids": []}
+
+
+def inject(tool_node: ToolNode, tool, kwargs: dict) -> dict:
+    return tool_node.inject_tool_args(
+        {"name": tool.name, "args": kwargs, "id": "123"}, STATE, None
+    )["args"]
+
+
+async def call_old(tool_node: ToolNode, tool, kwargs: dict):
+    args = inject(tool_node, tool, kwargs)
+    try:
+        tool._to_args_and_kwargs(args, None)
+    except ValidationError as e:
+        return f"{e}\n{convert_to_gigachat_tool(tool)['function']}"
+    return await tool.ainvoke(args)
+
+
+async def call_compiled(tool_node: ToolNode, compiled: CompiledTool, kwargs: dict):
+    args = inject(tool_node, compiled.tool, kwargs)
+    try:
+        validated = compiled.validate(args)
+    except ValidationError as e:
+        return f"{e}{compiled.error_hint}"
+    return await compiled.ainvoke(validated)
+
+
+async def measure(call, calls: int) -> float:
+    await call()
+    start = time.perf_counter()
+    for _ in range(calls):
+        await call()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+async def main(calls: int):
+    tool_node = ToolNode([add, weather_stub])
+    compiled = {name: CompiledTool(t) for name, (t, _) in CASES.items()}
+    print(f"{'tool':>14} {'old, мкс':>10} {'compiled, мкс':>14} {'ускорение':>10}")
+    for name, (t, kwargs) in CASES.items():
+        old = await measure(lambda: call_old(tool_node, t, dict(kwargs)), calls)
+        new = await measure(
+            lambda: call_compiled(tool_node, compiled[name], dict(kwargs)), calls
+        )
+        print(f"{name:>14} {old:>10.1f} {new:>14.1f} {old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
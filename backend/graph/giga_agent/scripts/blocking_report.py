@@ -0,0 +1,100 @@
+"""
+Отчет о блокировках event loop сервера графов и tool server.
+
+Берет `/blocking/` у tasks_app (сервер LangGraph) и `/blocking` у tool server
+и печатает места вызова, на которых loop простаивал дольше
+GIGA_AGENT_LOOP_BLOCK_THRESHOLD, — по убыванию суммарного времени блокировок,
+затем самые долгие спаны (GIGA_AGENT_TRACING) и синхронные HTTP-запросы
+из потока event loop.
+
+Запуск:
+    python -m giga_agent.scripts.blocking_report
+    python -m giga_agent.scripts.blocking_report --top 5 --stacks
+    python -m giga_agent.scripts.blocking_report --reset
+"""
+import argparse
+import os
+import sys
+
+import requests
+
+from giga_agent.utils.env import load_project_env
+
+load_project_env()
+
+SERVICES = {
+    "graph": ("--graph-url", "http://127.0.0.1:2024", "/blocking/"),
+    "tool_server": (
+        "--tool-server-url",
+        os.getenv("TOOL_CLIENT_API", "http://127.0.0.1:8811"),
+        "/blocking",
+    ),
+}
+
+
+def print_report(name: str, report: dict, stacks: bool):
+    print(f"== {name}")
+    if not report.get("enabled"):
+        print("Сторож loop выключен (GIGA_AGENT_LOOP_MONITOR)")
+    else:
+        print(
+            f"Блокировок дольше {report['threshold_ms']:.0f} мс: {report['blocks']}, "
+            f"всего {report['blocked_ms']:.0f} мс"
+        )
+        if report["sites"]:
+            print(f"{'всего, мс':>10} {'раз':>5} {'макс, мс':>9}  место вызова")
+        for site in report["sites"]:
+            print(
+                f"{site['total_ms']:>10.0f} {site['blocks']:>5} {site['max_ms']:>9.0f}  "
+                f"{site['site']}"
+            )
+            if site["call"] != site["site"]:
+                print(f"{'':>27}-> {site['call']}")
+            if stacks and site["stack"]:
+                print("    " + site["stack"].rstrip().replace("\n", "\n    "))
+    if report.get("spans"):
+        print(f"\n{'всего, мс':>10} {'раз':>5} {'сред, мс':>9} {'макс, мс':>9}  спан")
+        for item in report["spans"]:
+            print(
+                f"{item['total_ms']:>10.0f} {item['count']:>5} {item['avg_ms']:>9.1f} "
+                f"{item['max_ms']:>9.0f}  {item['kind']} {item['span']}"
+            )
+    sync_io = report.get("sync_io_on_event_loop") or []
+    if sync_io:
+        print("\nСинхронный HTTP из потока event loop:")
+        for item in sorted(sync_io, key=lambda item: item["value"], reverse=True):
+            print(f"{item['value']:>10.0f}  {item['labels'].get('host')}")
+    print()
+
+
+def main(args) -> int:
+    failed = 0
+    for name, (option, _, path) in SERVICES.items():
+        url = getattr(args, option[2:].replace("-", "_")).rstrip("/") + path
+        try:
+            if args.reset:
+                response = requests.delete(url, timeout=10)
+            else:
+                response = requests.get(url, params={"top": args.top}, timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"== {name}\nНе удалось получить {url}: {e}\n")
+            failed += 1
+            continue
+        if args.reset:
+            print(f"{name}: статистика блокировок сброшена")
+        else:
+            print_report(name, response.json(), args.stacks)
+    return 1 if failed == len(SERVICES) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    for option, default, _ in SERVICES.values():
+        parser.add_argument(option, default=default)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--stacks", action="store_true", help="печатать стеки")
+    parser.add_argument(
+        "--reset", action="store_true", help="сбросить накопленные блокировки"
+    )
+    sys.exit(main(parser.parse_args()))
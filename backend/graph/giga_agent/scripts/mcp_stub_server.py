@@ -0,0 +1,36 @@
+"""
+Локальный MCP-сервер (stdio) для проверки пула сессий tool server без внешних сервисов.
+
+Пример MCP_CONFIG:
+    {"stub": {"transport": "stdio", "command": "python",
+              "args": ["-m", "giga_agent.scripts.mcp_stub_server"]}}
+"""
+import asyncio
+import os
+
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP("giga-agent-stub")
+
+
+@mcp.tool()
+async def echo(text: str) -> str:
+    """Возвращает переданный текст"""
+    return text
+
+
+@mcp.tool()
+async def sleep(seconds: float) -> str:
+    """Ждет `seconds` секунд и возвращает pid процесса сервера"""
+    await asyncio.sleep(seconds)
+    return str(os.getpid())
+
+
+@mcp.tool()
+async def pid() -> str:
+    """Pid процесса сервера: по нему видно, переиспользуется ли сессия"""
+    return str(os.getpid())
+
+
+if __name__ == "__main__":
+    mcp.run(transport="stdio")
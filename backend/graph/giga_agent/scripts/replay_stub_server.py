@@ -0,0 +1,503 @@
+"""
+Локальные заглушки GigaChat, генерации изображений, tool server и REPL
+для бенчмарка агентов (`giga_agent.scripts.bench_agents`).
+
+Заглушка отвечает записанными ответами из `bench_fixtures/<сценарий>.json`
+и не ходит во внешние сервисы:
+- `/gigachat/chat/completions` — протокол GigaChat (обычный ответ и SSE-поток)
+  и OpenAI-совместимый (`tools`/`tool_calls`), которым пользуется
+  `OpenAIGigaChatWrapper`, когда `langchain_gigachat` недоступен;
+- `/gigachat/oauth`, `/gigachat/token` — OAuth и квота для `GigaChatTokenManager`;
+- `/openai/images/generations` — однотонный PNG запрошенного размера;
+- `/tools/tools`, `/tools/{tool}` — tool server (каталог строится из `TOOLS`);
+- `/repl/start`, `/repl/code`, `/repl/bootstrap`, `/repl/shutdown` — REPL;
+- `POST /_scenario/{name}` — выбрать сценарий и начать его записи заново,
+  `GET /_scenario` — какие записи не использованы и на какие запросы записи не нашлось.
+
+Запись подбирается по порядку: берется первая неиспользованная запись раздела
+(`llm`, `tools`, `repl`), у которой `match` входит в текст запроса — для LLM это
+последнее сообщение, для инструмента — его аргументы, для REPL — код ячейки.
+Запрос к LLM или инструменту без подходящей записи получает ошибку и попадает
+в `misses`; ячейки REPL без записи (служебные `function_results.append(...)`)
+выполняются «успешно» с пустым результатом.
+
+С `--upstream-gigachat` / `--upstream-tools` / `--upstream-repl` запросы
+проксируются в настоящие сервисы, а ответы дописываются в сценарий
+(`POST /_scenario/{name}` с `{"record": true}` очищает записи,
+`POST /_scenario/{name}/save` сохраняет файл).
+
+Запуск:
+    python -m giga_agent.scripts.replay_stub_server --port 9393
+"""
+import argparse
+import asyncio
+import base64
+import glob
+import json
+import os
+import time
+from io import BytesIO
+from typing import Optional
+from uuid import uuid4
+
+import httpx
+import uvicorn
+from fastapi import Body, FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from PIL import Image
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "bench_fixtures")
+SECTIONS = ("llm", "tools", "repl")
+# Раздел записей -> имя сервиса в `--upstream-*`
+UPSTREAM_OF = {"llm": "gigachat", "tools": "tools", "repl": "repl"}
+# Столько символов запроса сохраняется в `match` при записи
+MATCH_LENGTH = 120
+# Размер кусков текста в SSE-потоке
+STREAM_CHUNK = 64
+
+options = {"llm_delay": 0.0, "upstreams": {}}
+
+
+class Tape:
+    """Записи одного сценария и то, какие из них уже отданы."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            self.data = json.load(f)
+        self.name = self.data.get("name") or os.path.splitext(os.path.basename(path))[0]
+        self.reset()
+
+    def reset(self, record: bool = False):
+        if record:
+            # Перезаписываются только разделы, которые проксируются в сервисы
+            for section in SECTIONS:
+                if UPSTREAM_OF[section] in options["upstreams"]:
+                    self.data[section] = []
+        self.used = {section: set() for section in SECTIONS}
+        self.misses = []
+
+    def take(self, section: str, text: str, name: Optional[str] = None) -> Optional[dict]:
+        for index, entry in enumerate(self.data.get(section, [])):
+            if index in self.used[section]:
+                continue
+            if name is not None and entry.get("name") != name:
+                continue
+            if entry.get("match") and entry["match"] not in text:
+                continue
+            self.used[section].add(index)
+            return entry
+        return None
+
+    def miss(self, section: str, text: str):
+        self.misses.append({"section": section, "request": text[:300]})
+
+    def record(self, section: str, entry: dict):
+        self.data.setdefault(section, []).append(entry)
+        self.used[section].add(len(self.data[section]) - 1)
+
+    def status(self) -> dict:
+        unused = {}
+        for section in SECTIONS:
+            entries = self.data.get(section, [])
+            unused[section] = [
+                entry.get("match") or entry.get("name")
+                for index, entry in enumerate(entries)
+                if index not in self.used[section]
+            ]
+        return {
+            "scenario": self.name,
+            "used": {section: len(self.used[section]) for section in SECTIONS},
+            "unused": unused,
+            "misses": self.misses,
+        }
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        os.replace(tmp, self.path)
+
+
+tapes: dict[str, Tape] = {}
+current: dict[str, Optional[Tape]] = {"tape": None}
+
+
+def load_tapes(directory: str):
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        if os.path.basename(path) == "baseline.json":
+            continue
+        tape = Tape(path)
+        tapes[tape.name] = tape
+
+
+def active_tape() -> Tape:
+    tape = current["tape"]
+    if tape is None:
+        raise RuntimeError("Сценарий не выбран: POST /_scenario/{name}")
+    return tape
+
+
+def default_catalogue() -> list:
+    """Каталог настоящего tool server: те же инструменты и схемы, что отдает `/tools`."""
+    from langchain_gigachat.utils.function_calling import convert_to_gigachat_tool
+
+    from giga_agent.config import TOOLS
+
+    return [convert_to_gigachat_tool(tool)["function"] for tool in TOOLS]
+
+
+async def forward(section: str, request: Request, path: str, **kwargs) -> httpx.Response:
+    headers = {
+        name: value
+        for name, value in request.headers.items()
+        if name in ("authorization", "content-type", "x-deadline")
+    }
+    async with httpx.AsyncClient(verify=False, timeout=600) as client:
+        return await client.request(
+            request.method,
+            options["upstreams"][section] + path,
+            headers=headers,
+            **kwargs,
+        )
+
+
+app = FastAPI()
+
+
+@app.get("/_health")
+async def health():
+    return {"scenarios": sorted(tapes)}
+
+
+@app.post("/_scenario/{name}")
+async def select_scenario(name: str, payload: dict = Body(default={})):
+    if name not in tapes:
+        return JSONResponse({"message": f"Нет сценария {name}"}, status_code=404)
+    tapes[name].reset(record=bool(payload.get("record")))
+    current["tape"] = tapes[name]
+    return tapes[name].status()
+
+
+@app.get("/_scenario")
+async def scenario_status():
+    return active_tape().status()
+
+
+@app.post("/_scenario/{name}/save")
+async def save_scenario(name: str):
+    await asyncio.to_thread(tapes[name].save)
+    return tapes[name].status()
+
+
+# --- GigaChat ---
+def estimate_tokens(text: str) -> int:
+    return max(len(text) // 4, 1)
+
+
+def completion_message(entry: dict) -> dict:
+    message = {"role": "assistant", "content": entry.get("content", "")}
+    if entry.get("function_call"):
+        message["function_call"] = entry["function_call"]
+        message["functions_state_id"] = str(uuid4())
+    return message
+
+
+def openai_message(message: dict) -> dict:
+    """Тот же ответ в формате OpenAI: вызов функции — в `tool_calls`, аргументы строкой."""
+    result = {"role": "assistant", "content": message["content"]}
+    if "function_call" in message:
+        result["tool_calls"] = [
+            {
+                "id": message["functions_state_id"],
+                "type": "function",
+                "function": {
+                    "name": message["function_call"]["name"],
+                    "arguments": json.dumps(
+                        message["function_call"].get("arguments") or {},
+                        ensure_ascii=False,
+                    ),
+                },
+            }
+        ]
+    return result
+
+
+def is_openai_request(request: Request, body: dict) -> bool:
+    # Клиент gigachat передает функции в `functions`, OpenAI — в `tools`
+    return "tools" in body or request.headers.get("user-agent", "").startswith(
+        "OpenAI"
+    )
+
+
+def completion_usage(body: dict, entry: dict) -> dict:
+    if entry.get("usage"):
+        return entry["usage"]
+    prompt_tokens = estimate_tokens(json.dumps(body.get("messages", []), ensure_ascii=False))
+    completion_tokens = estimate_tokens(
+        entry.get("content", "") + json.dumps(entry.get("function_call") or "")
+    )
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def sse(data: dict) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_completion(message: dict, usage: dict, model: str):
+    created = int(time.time())
+    content = message["content"]
+    pieces = [
+        content[i : i + STREAM_CHUNK] for i in range(0, len(content), STREAM_CHUNK)
+    ]
+    for index, piece in enumerate(pieces):
+        delta = {"content": piece}
+        if index == 0:
+            delta["role"] = "assistant"
+        yield sse(
+            {
+                "choices": [{"delta": delta, "index": 0}],
+                "created": created,
+                "model": model,
+                "object": "chat.completion",
+            }
+        )
+    delta = {"role": "assistant", "content": ""}
+    finish_reason = "stop"
+    if "function_call" in message:
+        delta["function_call"] = message["function_call"]
+        delta["functions_state_id"] = message["functions_state_id"]
+        finish_reason = "function_call"
+    yield sse(
+        {
+            "choices": [{"delta": delta, "index": 0, "finish_reason": finish_reason}],
+            "created": created,
+            "model": model,
+            "object": "chat.completion",
+            "usage": usage,
+        }
+    )
+    yield "data: [DONE]\n\n"
+
+
+async def record_completion(request: Request, body: dict, text: str) -> Optional[dict]:
+    response = await forward(
+        "gigachat", request, "/chat/completions", json={**body, "stream": False}
+    )
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    message = data["choices"][0]["message"]
+    entry = {"match": text[:MATCH_LENGTH], "content": message.get("content") or ""}
+    if message.get("function_call"):
+        entry["function_call"] = message["function_call"]
+    elif message.get("tool_calls"):
+        function = message["tool_calls"][0]["function"]
+        entry["function_call"] = {
+            "name": function["name"],
+            "arguments": json.loads(function.get("arguments") or "{}"),
+        }
+    if data.get("usage"):
+        entry["usage"] = data["usage"]
+    active_tape().record("llm", entry)
+    return entry
+
+
+@app.post("/gigachat/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages") or []
+    text = (messages[-1].get("content") or "") if messages else ""
+    tape = active_tape()
+    if "gigachat" in options["upstreams"]:
+        entry = await record_completion(request, body, text)
+    else:
+        entry = tape.take("llm", text)
+    if entry is None:
+        tape.miss("llm", text)
+        return JSONResponse(
+            {"status": 400, "message": "Нет записанного ответа LLM"}, status_code=400
+        )
+    delay = entry.get("delay", options["llm_delay"])
+    if delay:
+        await asyncio.sleep(delay)
+    model = body.get("model") or "GigaChat"
+    message = completion_message(entry)
+    usage = completion_usage(body, entry)
+    if is_openai_request(request, body):
+        return {
+            "id": message.get("functions_state_id") or str(uuid4()),
+            "choices": [
+                {
+                    "message": openai_message(message),
+                    "index": 0,
+                    "finish_reason": "tool_calls" if "function_call" in message else "stop",
+                }
+            ],
+            "created": int(time.time()),
+            "model": model,
+            "usage": usage,
+            "object": "chat.completion",
+        }
+    if body.get("stream"):
+        return StreamingResponse(
+            stream_completion(message, usage, model), media_type="text/event-stream"
+        )
+    return {
+        "choices": [
+            {
+                "message": message,
+                "index": 0,
+                "finish_reason": "function_call" if "function_call" in message else "stop",
+            }
+        ],
+        "created": int(time.time()),
+        "model": model,
+        "usage": usage,
+        "object": "chat.completion",
+    }
+
+
+@app.post("/gigachat/oauth")
+async def oauth():
+    return {
+        "access_token": "bench",
+        "expires_at": int((time.time() + 30 * 60) * 1000),
+    }
+
+
+@app.get("/gigachat/token")
+async def token_info():
+    return {"token_limit": 1_000_000, "used_tokens": 0, "remaining_tokens": 1_000_000}
+
+
+# --- Генерация изображений ---
+_images: dict[str, str] = {}
+
+
+def solid_png(width: int, height: int) -> str:
+    key = f"{width}x{height}"
+    if key not in _images:
+        buffer = BytesIO()
+        Image.new("RGB", (width, height), (92, 124, 250)).save(buffer, format="PNG")
+        _images[key] = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return _images[key]
+
+
+@app.post("/openai/images/generations")
+async def generate_image(payload: dict = Body(...)):
+    width, _, height = payload.get("size", "1024x1024").partition("x")
+    data = await asyncio.to_thread(solid_png, int(width), int(height))
+    return {"created": int(time.time()), "data": [{"b64_json": data}]}
+
+
+# --- tool server ---
+@app.get("/tools/tools")
+async def get_tools(request: Request):
+    tape = active_tape()
+    if "tools" in options["upstreams"]:
+        response = await forward("tools", request, "/tools")
+        tape.data["catalogue"] = response.json()
+    if tape.data.get("catalogue"):
+        return tape.data["catalogue"]
+    return app.state.catalogue
+
+
+@app.post("/tools/{tool_name}")
+async def call_tool(tool_name: str, request: Request):
+    payload = await request.json()
+    text = json.dumps(payload.get("kwargs") or {}, ensure_ascii=False)
+    tape = active_tape()
+    if "tools" in options["upstreams"]:
+        response = await forward("tools", request, f"/{tool_name}", json=payload)
+        if response.status_code != 200:
+            return JSONResponse(response.json(), status_code=response.status_code)
+        entry = {"name": tool_name, "data": response.json()["data"]}
+        tape.record("tools", entry)
+    else:
+        entry = tape.take("tools", text, name=tool_name)
+    if entry is None:
+        tape.miss("tools", f"{tool_name} {text}")
+        return JSONResponse(
+            {"message": f"Нет записанного результата {tool_name}"}, status_code=500
+        )
+    return {"data": entry.get("data")}
+
+
+# --- REPL ---
+EMPTY_CELL = {
+    "result": "",
+    "is_exception": False,
+    "exception": None,
+    "attachments": [],
+    "cpu_time": 0.0,
+    "wall_time": 0.0,
+}
+
+
+@app.post("/repl/start")
+async def start_kernel(request: Request):
+    if "repl" in options["upstreams"]:
+        return (await forward("repl", request, "/start")).json()
+    return {"id": str(uuid4())}
+
+
+@app.post("/repl/code")
+async def execute_code(request: Request):
+    payload = await request.json()
+    script = payload.get("script") or ""
+    tape = active_tape()
+    if "repl" in options["upstreams"]:
+        response = (await forward("repl", request, "/code", json=payload)).json()
+        tape.record("repl", {"match": script[:MATCH_LENGTH], "response": response})
+        return response
+    entry = tape.take("repl", script)
+    return entry["response"] if entry is not None else EMPTY_CELL
+
+
+@app.post("/repl/bootstrap")
+async def bootstrap(request: Request):
+    payload = await request.json()
+    if "repl" in options["upstreams"]:
+        return (await forward("repl", request, "/bootstrap", json=payload)).json()
+    return {"version": payload.get("version"), "changed": True, "is_exception": False}
+
+
+@app.post("/repl/shutdown")
+async def shutdown_kernel(request: Request):
+    if "repl" in options["upstreams"]:
+        payload = await request.json()
+        return (await forward("repl", request, "/shutdown", json=payload)).json()
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=9393)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument(
+        "--llm-delay", type=float, default=0.0, help="Задержка ответа LLM, с"
+    )
+    parser.add_argument("--upstream-gigachat", default=None)
+    parser.add_argument("--upstream-tools", default=None)
+    parser.add_argument("--upstream-repl", default=None)
+    args = parser.parse_args()
+
+    options["llm_delay"] = args.llm_delay
+    for section in ("gigachat", "tools", "repl"):
+        upstream = getattr(args, f"upstream_{section}")
+        if upstream:
+            options["upstreams"][section] = upstream.rstrip("/")
+    load_tapes(args.fixtures)
+    # Каталог строится до старта: первый запрос графа не ждет импорта инструментов
+    app.state.catalogue = default_catalogue()
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
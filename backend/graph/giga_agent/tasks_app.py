@@ -1,26 +1,47 @@
 import asyncio
-import base64
 import io
-import json
-import os
 import uuid
 from contextlib import asynccontextmanager
-from pathlib import Path
-from uuid import uuid4
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import HTMLResponse
-from sqlmodel import SQLModel, Field, select, func
-from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.ext.asyncio import AsyncEngine
-from sqlalchemy.orm import sessionmaker
+from fastapi import FastAPI, HTTPException, Query, Request, Response, UploadFile, File
+from fastapi.responses import FileResponse, HTMLResponse
+from sqlmodel import Field, SQLModel
 
 from langgraph_sdk import get_client
 
+from giga_agent.batch_runner import (
+    BATCH_CONCURRENCY,
+    BatchRun,
+    BatchRunner,
+    BatchStore,
+)
+from giga_agent.utils import metrics
+from giga_agent.utils.blob_store import (
+    BLOB_TTL,
+    BlobNotFound,
+    attachment_bytes,
+    gc_loop,
+    get_blob_store,
+)
 from giga_agent.utils.env import load_project_env
+from giga_agent.utils.http_cache import (
+    HTML_CACHE_SIZE,
+    BodyLRU,
+    CachedBody,
+    etag_matches,
+    strong_etag,
+)
+from giga_agent.utils.instrumentation import (
+    blocking_report,
+    get_loop_monitor,
+    install_tracing,
+    start_loop_monitor,
+    stop_loop_monitor,
+)
 from giga_agent.utils.llm import is_llm_image_inline
+from giga_agent.utils.llm_cache import get_cache_stats
+from giga_agent.utils.task_store import Task, get_task_store, rows_to_json
 
 # Применяем HTTP патчер для перехвата запросов к GigaChat API
 import logging
@@ -30,188 +51,226 @@ from giga_agent.utils.http_patcher import patch_httpx
 logger.info("🔧 TASKS_APP: Применение HTTP патчера...")
 patch_httpx()
 logger.info("🔧 TASKS_APP: HTTP патчер применен!")
+# tasks_app загружается в процесс сервера LangGraph: спаны и сторож loop
+# покрывают и запуски графов
+install_tracing()
 
 from giga_agent.config import llm
 
 
-# --- Модель данных ---
-class Task(SQLModel, table=True):
-    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
-    json_data: str = Field(default_factory=lambda: str("{}"))
-    steps: int = Field(default=10, nullable=False)
-    sorting: int = Field(default=None, nullable=False, index=True)
-    active: bool = Field(default=False, nullable=False)
-
-
-Path("db").mkdir(parents=True, exist_ok=True)
-
-
-# --- Настройка асинхронного движка и сессии ---
-DATABASE_URL = "sqlite+aiosqlite:///db/tasks.db"
-engine: AsyncEngine = create_async_engine(
-    DATABASE_URL, echo=True, connect_args={"check_same_thread": False}
-)
-AsyncSessionLocal = sessionmaker(
-    bind=engine, class_=AsyncSession, expire_on_commit=False
-)
-
-
-# --- Создаем таблицы ---
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
-    async with AsyncSessionLocal() as session:
-        # Считаем, сколько строк в таблице Task
-        result = await session.execute(select(func.count()).select_from(Task))
-        count_tasks = result.scalar_one()  # возвращает 0, если пусто
-        # Если таблица Task пуста, подгружаем JSON-дамп
-        if count_tasks == 0:
-            # Предположим, файл dump.json лежит в той же директории, что и скрипт
-            dump_path = os.path.join(os.path.dirname(__file__), "dump.json")
-            if os.path.exists(dump_path):
-                # Читаем список объектов из JSON
-                with open(dump_path, "r", encoding="utf-8") as f:
-                    data_list = await asyncio.to_thread(json.load, fp=f)
-
-                # Проходим по каждому элементу массива
-                for item in data_list:
-                    # Извлекаем поля из JSON-объекта.
-                    # Если в JSON не указан id, сгенерируем новый.
-                    _id = item.get("id", str(uuid4()))
-
-                    # Если в дампе json_data — это вложенный объект,
-                    # сериализуем его в строку:
-                    _json_data = item.get("json_data", {})
-                    json_str = json.dumps(_json_data, ensure_ascii=False)
-
-                    # Считываем остальные поля, или ставим дефолт
-                    _steps = item.get("steps", 10)
-                    _sorting = item.get("sorting", None)
-                    _active = item.get("active", False)
-
-                    # Если sorting не указан в JSON или равен None,
-                    # можно установить next_sorting
-                    if _sorting is None:
-                        # Здесь мы вызываем вашу функцию next_sorting,
-                        # передавая текущую сессию
-                        _sorting = await next_sorting(session)
-
-                    # Создаём объект Task и добавляем в сессию
-                    task = Task(
-                        id=_id,
-                        json_data=json_str,
-                        steps=_steps,
-                        sorting=_sorting,
-                        active=_active,
-                    )
-                    session.add(task)
-
-                await session.commit()
-            else:
-                print(f"Файл {dump_path} не найден, пропускаем загрузку")
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
+    await task_store.init()
+    blob_gc = asyncio.create_task(gc_loop()) if BLOB_TTL > 0 else None
+    start_loop_monitor("graph")
     yield
-    # Clean up connections
+    await stop_loop_monitor()
+    if blob_gc is not None:
+        blob_gc.cancel()
+    await task_store.close()
 
 
 # Запускаем инициализацию при старте
 app = FastAPI(lifespan=lifespan)
-
-
-# Вспомогательная функция для получения следующего sorting
-async def next_sorting(session: AsyncSession) -> int:
-    result = await session.execute(select(func.max(Task.sorting)))
-    max_sort = result.scalar_one_or_none()
-    return (max_sort or 0) + 1
+task_store = get_task_store()
 
 
 # 1) Создать задачу
 @app.post("/tasks/", response_model=Task)
 async def create_task():
-    async with AsyncSessionLocal() as session:
-        task = Task(json_data=json.dumps({"message": "", "attachments": []}))
-        task.sorting = await next_sorting(session)
-        session.add(task)
-        await session.commit()
-        await session.refresh(task)
-        return task
+    return await task_store.create({"message": "", "attachments": []})
 
 
-# 2) Получить все задачи (сортируя по полю sorting)
+# 2) Получить задачи (сортируя по полю sorting)
 @app.get("/tasks/")
-async def list_tasks():
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Task).order_by(Task.sorting))
-        tasks = result.scalars().all()
-        new_tasks = []
-        for task in tasks:
-            new_task = task.dict()
-            new_task["json_data"] = json.loads(task.json_data)
-            new_tasks.append(new_task)
-        return new_tasks
+async def list_tasks(
+    response: Response,
+    limit: Optional[int] = Query(default=None, ge=1, le=1000),
+    after: Optional[str] = None,
+    active: Optional[bool] = None,
+):
+    """
+    Без `limit` — все задачи, как раньше. С `limit` — страница после курсора
+    `after`; курсор следующей страницы приходит в заголовке `X-Next-Cursor`.
+    """
+    try:
+        rows = await task_store.list(limit=limit, after=after, active=active)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    headers = {}
+    if limit is not None and len(rows) == limit:
+        headers["X-Next-Cursor"] = rows[-1].cursor
+    # json_data отдаем как есть, без json.loads / повторной сериализации
+    return Response(
+        rows_to_json(rows), media_type="application/json", headers=headers
+    )
 
 
 # 3) Получить конкретную задачу
 @app.get("/tasks/{task_id}/", response_model=Task)
 async def get_task(task_id: str):
-    async with AsyncSessionLocal() as session:
-        task = await session.get(Task, task_id)
-        if not task:
-            raise HTTPException(404, "Task not found")
-        return task
+    task = await task_store.get(task_id)
+    if not task:
+        raise HTTPException(404, "Task not found")
+    return task
 
 
 # 4) Обновить задачу (json_data и/или steps)
 class TaskUpdate(SQLModel):
     json_data: Optional[dict] = None
     steps: Optional[int] = None
-    sorting: Optional[int] = None
+    sorting: Optional[float] = None
     active: Optional[bool] = None
 
 
 @app.put("/tasks/{task_id}/", response_model=Task)
 async def update_task(task_id: str, task_update: TaskUpdate):
-    async with AsyncSessionLocal() as session:
-        task = await session.get(Task, task_id)
-        if not task:
-            raise HTTPException(404, "Task not found")
-        if task_update.json_data is not None:
-            task.json_data = json.dumps(task_update.json_data, ensure_ascii=False)
-        if task_update.steps is not None:
-            task.steps = task_update.steps
-        if task_update.sorting is not None:
-            task.sorting = task_update.sorting
-        if task_update.active is not None:
-            task.active = task_update.active
-        session.add(task)
-        await session.commit()
-        await session.refresh(task)
-        return task
+    task = await task_store.update(task_id, **task_update.model_dump())
+    if not task:
+        raise HTTPException(404, "Task not found")
+    return task
 
 
 # 5) Удалить задачу
 @app.delete("/tasks/{task_id}/", status_code=204)
 async def delete_task(task_id: str):
-    async with AsyncSessionLocal() as session:
-        task = await session.get(Task, task_id)
-        if not task:
-            raise HTTPException(404, "Task not found")
-        await session.delete(task)
-        await session.commit()
+    if not await task_store.delete(task_id):
+        raise HTTPException(404, "Task not found")
+
+
+# 6) Переместить задачу: меняется только ее sorting
+class TaskMove(SQLModel):
+    before_id: Optional[str] = None
+    after_id: Optional[str] = None
+
+
+@app.post("/tasks/{task_id}/move/", response_model=Task)
+async def move_task(task_id: str, task_move: TaskMove):
+    try:
+        task = await task_store.move(
+            task_id, before_id=task_move.before_id, after_id=task_move.after_id
+        )
+    except KeyError:
+        raise HTTPException(404, "Neighbour task not found")
+    if not task:
+        raise HTTPException(404, "Task not found")
+    return task
+
+
+# 7) Пакетный запуск активных задач через граф chat
+class BatchRequest(SQLModel):
+    task_ids: Optional[list[str]] = None
+    concurrency: Optional[int] = Field(default=None, ge=1)
+    repeat: int = Field(default=1, ge=1)
+    run_timeout: Optional[float] = None
+
+
+batch_runs = BatchStore()
+
+
+def get_batch_or_404(batch_id: str) -> BatchRun:
+    batch = batch_runs.get(batch_id)
+    if batch is None:
+        raise HTTPException(404, "Batch not found")
+    return batch
+
+
+@app.post("/batches/")
+async def start_batch(request: BatchRequest):
+    rows = await task_store.list(active=True)
+    if request.task_ids:
+        rows = [row for row in rows if row.id in set(request.task_ids)]
+    tasks = [
+        {"id": row.id, "json_data": row.data, "steps": row.steps} for row in rows
+    ] * max(request.repeat, 1)
+    if not tasks:
+        raise HTTPException(400, "No active tasks")
+    batch = BatchRun(tasks, concurrency=request.concurrency or BATCH_CONCURRENCY)
+    BatchRunner(run_timeout=request.run_timeout).start(batch)
+    batch_runs.add(batch)
+    return batch.to_dict(include_results=False)
+
+
+@app.get("/batches/")
+async def list_batches():
+    return [batch.to_dict(include_results=False) for batch in batch_runs.list()]
+
+
+@app.get("/batches/{batch_id}/")
+async def get_batch(batch_id: str):
+    return get_batch_or_404(batch_id).to_dict()
+
+
+@app.post("/batches/{batch_id}/cancel/")
+async def cancel_batch(batch_id: str):
+    batch = get_batch_or_404(batch_id)
+    if batch.task is not None and not batch.task.done():
+        batch.task.cancel()
+    return batch.to_dict(include_results=False)
+
+
+# Страницы и вложения не меняются после создания: в LRU держим их сжатыми
+html_cache = BodyLRU(HTML_CACHE_SIZE)
+HTML_CACHE_CONTROL = "public, max-age=3600"
+BLOB_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 
 @app.get("/html/{html_id}/", response_class=HTMLResponse)
-async def get_task(html_id: str):
-    client = get_client()
-    result = await client.store.get_item(("html",), key=html_id)
-    if result:
-        return HTMLResponse(content=result["value"]["data"], status_code=200)
-    else:
-        raise HTTPException(404, "Page not found")
+async def get_html(html_id: str, request: Request):
+    page = html_cache.get(html_id)
+    if page is None:
+        client = get_client()
+        result = await client.store.get_item(("html",), key=html_id)
+        if not result:
+            raise HTTPException(404, "Page not found")
+        value = result["value"]
+        try:
+            body = await attachment_bytes(value)
+        except BlobNotFound:
+            raise HTTPException(404, "Page not found")
+        etag = strong_etag(value["blob"]) if "blob" in value else None
+        page = await asyncio.to_thread(
+            CachedBody, body, "text/html; charset=utf-8", etag
+        )
+        html_cache.put(html_id, page)
+    return page.response(request, HTML_CACHE_CONTROL)
+
+
+# Типы, которые можно запросить у /blobs/ через ?type=
+BLOB_MEDIA_TYPES = {
+    "image/png": "image/png",
+    "audio/mp3": "audio/mpeg",
+    "application/vnd.plotly.v1+json": "application/json",
+}
+
+
+@app.get("/blobs/{digest}")
+async def get_blob(digest: str, request: Request, type: Optional[str] = None):
+    store = get_blob_store()
+    media_type = BLOB_MEDIA_TYPES.get(type, "application/octet-stream")
+    etag = strong_etag(digest)
+    if media_type == "application/json":
+        # JSON графиков хорошо сжимается, отдаем его из LRU как страницы
+        key = f"blob:{digest}"
+        body = html_cache.get(key)
+        if body is None:
+            try:
+                data = await store.aread(digest)
+            except BlobNotFound:
+                raise HTTPException(404, "Blob not found")
+            body = await asyncio.to_thread(CachedBody, data, media_type, etag)
+            html_cache.put(key, body)
+        return body.response(request, BLOB_CACHE_CONTROL)
+    try:
+        await asyncio.to_thread(store.touch, digest)
+    except BlobNotFound:
+        raise HTTPException(404, "Blob not found")
+    headers = {"ETag": etag, "Cache-Control": BLOB_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    # Содержимое неизменно для хэша; FileResponse отдает файл через sendfile
+    # и сам обрабатывает Range (аудио, большие изображения)
+    return FileResponse(store.path(digest), media_type=media_type, headers=headers)
 
 
 @app.post("/upload/image/")
@@ -229,14 +288,39 @@ async def upload_image(file: UploadFile = File(...)):
         ).id_
     else:
         uploaded_id = str(uuid.uuid4())
+    blob = await get_blob_store().aput(file_bytes)
     await client.store.put_item(
         ("attachments",),
         uploaded_id,
         {
             "file_id": uploaded_id,
-            "data": base64.b64encode(file_bytes).decode(),
+            "blob": blob,
+            "size": len(file_bytes),
             "type": "image/png",
         },
         ttl=None,
     )
     return {"id": uploaded_id}
+
+
+@app.get("/metrics/")
+async def get_metrics():
+    return {
+        "metrics": metrics.snapshot(),
+        "llm_cache": get_cache_stats(),
+        "html_cache": html_cache.stats(),
+    }
+
+
+@app.get("/blocking/")
+async def get_blocking(top: int = 20):
+    """Места, где event loop сервера графов блокировался дольше порога, и самые долгие спаны."""
+    return blocking_report(top)
+
+
+@app.delete("/blocking/")
+async def reset_blocking():
+    monitor = get_loop_monitor()
+    if monitor is not None:
+        monitor.reset()
+    return blocking_report(0)
@@ -26,6 +26,7 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langgraph.graph import StateGraph
 from langgraph.prebuilt.tool_node import _handle_tool_error, ToolNode
 import gigachat.exceptions
+from langchain_core.runnables import RunnableConfig
 from langgraph.store.base import BaseStore
 from langgraph.types import interrupt
 
@@ -34,14 +35,35 @@ from giga_agent.config import (
     REPL_TOOLS,
     SERVICE_TOOLS,
     AGENT_MAP,
+    build_tool_context,
     load_llm,
 )
 from giga_agent.prompts.few_shots import FEW_SHOTS_ORIGINAL, FEW_SHOTS_UPDATED
 from giga_agent.prompts.main_prompt import SYSTEM_PROMPT
 from giga_agent.repl_tools.utils import describe_repl_tool
 from giga_agent.tool_server.tool_client import ToolClient
+from giga_agent.utils.approval import (
+    ALLOW,
+    DENY,
+    get_approval_policy,
+    get_user_id,
+)
+from giga_agent.utils.blob_store import offload_attachment
+from giga_agent.utils.deadline import reset_deadline, run_deadline, set_deadline
 from giga_agent.utils.env import load_project_env
+from giga_agent.utils.gigachat_token import (
+    get_gigachat_token_info,
+    get_gigachat_token_manager,
+    invalidate_gigachat_tokens,
+)
 from giga_agent.utils.jupyter import JupyterClient
+from giga_agent.utils.llm import is_llm_gigachat
+from giga_agent.utils.speculation import (
+    get_speculation_buffer,
+    is_speculative,
+    speculation_key,
+)
+from giga_agent.utils.tool_catalogue import aget_catalogue
 import re
 
 
@@ -279,71 +301,13 @@ def parse_function_calls_from_text(message):
     return message
 
 
-async def get_gigachat_token_info() -> str:
-    """Получение информации о токенах GigaChat"""
-    try:
-        import aiohttp
-        import os
-        
-        # Получаем токен из переменных окружения (пробуем разные варианты)
-        credentials = os.getenv("MAIN_GIGACHAT_CREDENTIALS") or os.getenv("GIGACHAT_CREDENTIALS")
-        if not credentials:
-            return "❌ Токен GigaChat не найден в переменных окружения. Проверьте переменные MAIN_GIGACHAT_CREDENTIALS или GIGACHAT_CREDENTIALS."
-        
-        # Декодируем credentials (base64)
-        import base64
-        try:
-            decoded_credentials = base64.b64decode(credentials).decode('utf-8')
-            client_id, client_secret = decoded_credentials.split(':')
-        except Exception as decode_error:
-            return f"❌ Ошибка декодирования токена: {str(decode_error)}"
-        
-        # Получаем access token
-        auth_url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-        auth_data = {
-            "scope": "GIGACHAT_API_PERS"
-        }
-        auth_headers = {
-            "Authorization": f"Basic {credentials}",
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(auth_url, data=auth_data, headers=auth_headers) as resp:
-                if resp.status == 200:
-                    auth_response = await resp.json()
-                    access_token = auth_response.get("access_token")
-                    
-                    if access_token:
-                        # Запрашиваем информацию о токенах
-                        token_url = "https://gigachat.devices.sberbank.ru/api/v1/token"
-                        token_headers = {
-                            "Authorization": f"Bearer {access_token}"
-                        }
-                        
-                        async with session.get(token_url, headers=token_headers) as token_resp:
-                            if token_resp.status == 200:
-                                token_data = await token_resp.json()
-                                return f"📊 **Информация о токенах:**\n" \
-                                       f"• Лимит токенов: {token_data.get('token_limit', 'N/A')}\n" \
-                                       f"• Использовано: {token_data.get('used_tokens', 'N/A')}\n" \
-                                       f"• Остаток: {token_data.get('remaining_tokens', 'N/A')}"
-                            else:
-                                token_error_text = await token_resp.text()
-                                return f"❌ Ошибка получения информации о токенах: {token_resp.status} - {token_error_text}"
-                    else:
-                        return "❌ Не удалось получить access token из ответа авторизации"
-                else:
-                    auth_error_text = await resp.text()
-                    return f"❌ Ошибка авторизации: {resp.status} - {auth_error_text}"
-    except Exception as e:
-        return f"❌ Ошибка при получении информации о токенах: {str(e)}"
-
-
 async def handle_gigachat_error_async(e: Exception, flag: bool = False) -> str:
     """Асинхронная обработка ошибок GigaChat с информацией о токенах"""
     if isinstance(e, gigachat.exceptions.ResponseError):
         error_msg = str(e)
+        if "unauthorized" in error_msg.lower() or "401" in error_msg:
+            # Кэшированный токен мог протухнуть раньше срока
+            invalidate_gigachat_tokens()
         
         # Получаем актуальную информацию о токенах
         token_info = await get_gigachat_token_info()
@@ -398,7 +362,11 @@ def handle_gigachat_error(e: Exception, flag: bool = False) -> str:
         # Для других ошибок используем стандартную обработку
         return _handle_tool_error(e, flag=flag)
 from giga_agent.utils.lang import LANG
-from giga_agent.utils.python import prepend_code
+from giga_agent.utils.python import (
+    build_kernel_context,
+    kernel_bootstrap_code,
+    kernel_bootstrap_version,
+)
 
 load_project_env()
 
@@ -416,7 +384,13 @@ def generate_repl_tools_description():
 {repl_tools}
 ```
 Также ты можешь вызвать из кода следующие функции: {service_tools}. Аргументы и описания этих функций описаны в твоих функциях!
-Вызывай эти методы, только через именованные агрументы"""
+Вызывай эти методы, только через именованные агрументы.
+Если нужно вызвать функцию много раз (например, для списка городов или ссылок), не вызывай её в цикле, а используй параллельные вызовы:
+```
+results = batch_call(weather, [{{"city": c}} for c in cities])  # результаты в том же порядке
+results = await asyncio.gather(*[weather.acall(city=c) for c in cities])
+```
+Загруженные CSV/XLSX читай через `df = read_dataset('files/имя.csv')` — это быстрее, чем `pd.read_csv`: файл уже разобран. С дополнительными параметрами (`sep`, `usecols` и т.п.) работает как `pd.read_csv` / `pd.read_excel`."""
 
 
 prompt = ChatPromptTemplate.from_messages(
@@ -468,14 +442,13 @@ async def agent(state: AgentState):
         base_url=os.getenv("TOOL_CLIENT_API", "http://127.0.0.1:9091")
     )
     kernel_id = state.get("kernel_id")
-    tools = state.get("tools")
+    tools_version, tools = await aget_catalogue(
+        state.get("tools_version"), tool_client
+    )
     file_ids = []
     if not kernel_id:
         kernel_id = (await client.start_kernel())["id"]
         await client.execute(kernel_id, "function_results = []")
-    if not tools:
-        tools = await tool_client.get_tools()
-    ch = (prompt | llm.bind_tools(tools, parallel_tool_calls=False)).with_retry()
     if state["messages"][-1].type == "human":
         user_input = state["messages"][-1].content
         # Безопасная проверка additional_kwargs
@@ -517,6 +490,12 @@ async def agent(state: AgentState):
         ].content = f"<task>{user_input}</task> Активно планируй и следуй своему плану! Действуй по простым шагам!{generate_user_info(state)}\n{file_prompt}\n{selected_prompt}\nСледующий шаг: "
     
     try:
+        model = llm
+        token_manager = get_gigachat_token_manager(is_main=True)
+        if token_manager is not None and is_llm_gigachat():
+            # Общий кэшированный токен вместо отдельного похода в OAuth
+            model = await token_manager.abind(llm)
+        ch = (prompt | model.bind_tools(tools, parallel_tool_calls=False)).with_retry()
         message = await ch.ainvoke({"messages": state["messages"]})
         
         # Логируем получение ответа от LLM
@@ -545,7 +524,7 @@ async def agent(state: AgentState):
         return {
             "messages": [state["messages"][-1], parsed_message],
             "kernel_id": kernel_id,
-            "tools": tools,
+            "tools_version": tools_version,
             "file_ids": file_ids,
         }
     except Exception as e:
@@ -555,39 +534,40 @@ async def agent(state: AgentState):
         return {
             "messages": [state["messages"][-1], error_message],
             "kernel_id": kernel_id,
-            "tools": tools,
+            "tools_version": tools_version,
             "file_ids": file_ids,
         }
 
 
+def get_tool_client(state: AgentState) -> ToolClient:
+    tool_client = ToolClient(
+        base_url=os.getenv("TOOL_CLIENT_API", "http://127.0.0.1:9091")
+    )
+    tool_client.set_state(build_tool_context(state))
+    return tool_client
+
+
+async def ensure_kernel_bootstrap(state: AgentState) -> str:
+    _, tools = await aget_catalogue(state.get("tools_version"), get_tool_client(state))
+    code = kernel_bootstrap_code(build_kernel_context(state), tools)
+    version = kernel_bootstrap_version(code)
+    if state.get("kernel_bootstrap") != version:
+        response = await client.bootstrap(state["kernel_id"], version, code)
+        if response.get("is_exception"):
+            raise Exception(f"Ошибка установки инструментов в ядро: {response}")
+    return version
+
+
 async def tool_call(
     state: AgentState,
     store: BaseStore,
+    config: RunnableConfig,
 ):
-    tool_client = ToolClient(
-        base_url=os.getenv("TOOL_CLIENT_API", "http://127.0.0.1:9091")
-    )
     # Безопасная проверка tool_calls
     last_message = state["messages"][-1]
     if not hasattr(last_message, 'tool_calls') or not last_message.tool_calls:
         raise ValueError("No tool_calls found in the last message")
     action = copy.deepcopy(last_message.tool_calls[0])
-    value = interrupt({"type": "approve"})
-    if value.get("type") == "comment":
-        return {
-            "messages": ToolMessage(
-                tool_call_id=action.get("id", str(uuid4())),
-                content=json.dumps(
-                    {
-                        "message": f'Пользователь отменил выполнение инструмента. Комментарий: "{value.get("message")}"'
-                    },
-                    ensure_ascii=False,
-                ),
-            )
-        }
-    
-    # Если пользователь не отменил, продолжаем выполнение
-    tool_call_index = state.get("tool_call_index", -1)
     if action.get("name") == "python":
         if os.getenv("REPL_FROM_MESSAGE", "1") == "1":
             action["args"]["code"] = get_code_arg(state["messages"][-1].content)
@@ -606,14 +586,68 @@ async def tool_call(
                     ),
                 )
             }
-        action["args"]["code"] = prepend_code(action["args"]["code"], state)
+    # Политика проверяется до interrupt: разрешенные вызовы идут без подтверждения
+    approval = get_approval_policy().evaluate(
+        action.get("name"), action.get("args"), get_user_id(config)
+    )
+    if approval == DENY:
+        return {
+            "messages": ToolMessage(
+                tool_call_id=action.get("id", str(uuid4())),
+                content=json.dumps(
+                    {"message": "Вызов инструмента запрещен политикой подтверждения."},
+                    ensure_ascii=False,
+                ),
+            )
+        }
+    spec_key = None
+    if approval != ALLOW and is_speculative(action.get("name")):
+        spec_key = speculation_key(config, action.get("id"))
+    if spec_key is not None:
+        # Инструмент только читает данные: запускаем его, не дожидаясь подтверждения
+        get_speculation_buffer().start(
+            spec_key,
+            lambda: get_tool_client(state).aexecute(
+                action.get("name"), action.get("args")
+            ),
+        )
+    if approval != ALLOW:
+        value = interrupt({"type": "approve"})
+        if value.get("type") == "comment":
+            if spec_key is not None:
+                get_speculation_buffer().discard(spec_key)
+            return {
+                "messages": ToolMessage(
+                    tool_call_id=action.get("id", str(uuid4())),
+                    content=json.dumps(
+                        {
+                            "message": f'Пользователь отменил выполнение инструмента. Комментарий: "{value.get("message")}"'
+                        },
+                        ensure_ascii=False,
+                    ),
+                )
+            }
+
+    # Если пользователь не отменил, продолжаем выполнение
+    tool_call_index = state.get("tool_call_index", -1)
+    kernel_bootstrap = state.get("kernel_bootstrap")
     file_ids = []
+    # Дедлайн запуска уходит в заголовках к tool server и REPL
+    deadline_token = set_deadline(run_deadline(config))
     try:
-        state_ = copy.deepcopy(state)
-        state_.pop("messages")
-        tool_client.set_state(state_)
-        if action.get("name") not in AGENT_MAP:
-            result = await tool_client.aexecute(action.get("name"), action.get("args"))
+        if action.get("name") == "python":
+            # Заглушки инструментов ставятся в ядро один раз на версию,
+            # в ячейке выполняется только код модели
+            kernel_bootstrap = await ensure_kernel_bootstrap(state)
+        speculative_task = (
+            get_speculation_buffer().pop(spec_key) if spec_key is not None else None
+        )
+        if speculative_task is not None:
+            result = await speculative_task
+        elif action.get("name") not in AGENT_MAP:
+            result = await get_tool_client(state).aexecute(
+                action.get("name"), action.get("args")
+            )
         else:
             tool_node = ToolNode(tools=list(AGENT_MAP.values()))
             injected_args = tool_node.inject_tool_args(
@@ -677,27 +711,15 @@ async def tool_call(
             attachments = result.pop("giga_attachments")
             file_ids = [attachment["file_id"] for attachment in attachments]
             for attachment in attachments:
+                # В store только метаданные и sha256, байты — в blob store
+                value = await offload_attachment(attachment)
                 if attachment["type"] == "text/html":
-                    await store.aput(
-                        ("html",),
-                        attachment["file_id"],
-                        attachment,
-                        ttl=None,
-                    )
+                    namespace = ("html",)
                 elif attachment["type"] == "audio/mp3":
-                    await store.aput(
-                        ("audio",),
-                        attachment["file_id"],
-                        attachment,
-                        ttl=None,
-                    )
+                    namespace = ("audio",)
                 else:
-                    await store.aput(
-                        ("attachments",),
-                        attachment["file_id"],
-                        attachment,
-                        ttl=None,
-                    )
+                    namespace = ("attachments",)
+                await store.aput(namespace, attachment["file_id"], value, ttl=None)
 
                 tool_attachments.append(
                     {
@@ -718,11 +740,14 @@ async def tool_call(
             content=error_content,
         )
         tool_call_index = action.get("index", 0)
+    finally:
+        reset_deadline(deadline_token)
 
     return {
         "messages": [message],
         "tool_call_index": tool_call_index,
         "file_ids": file_ids,
+        "kernel_bootstrap": kernel_bootstrap,
     }
 
 
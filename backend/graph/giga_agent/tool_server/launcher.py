@@ -0,0 +1,165 @@
+"""
+Запуск tool server в несколько воркеров с предзагрузкой (preload/fork).
+
+Родительский процесс один раз импортирует модули (LLM, агенты, модели),
+собирает реестр инструментов вместе с MCP, загружает классификатор тональности,
+открывает сокет и только потом форкает воркеров. Воркеры получают всё это
+через copy-on-write, поэтому память и время старта не умножаются на число воркеров.
+
+Запуск:
+    python -m giga_agent.tool_server.launcher --host 0.0.0.0 --port 9091 --workers 4
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Воркер, проживший меньше, считается упавшим при старте
+WORKER_MIN_UPTIME = 10.0
+# Пауза перед перезапуском после падений при старте: 1, 2, 4, ... до 30 с
+RESTART_BACKOFF = 1.0
+RESTART_BACKOFF_MAX = 30.0
+# Столько падений при старте подряд — ошибка окружения, а не сбой: выходим
+MAX_RAPID_FAILURES = 5
+
+
+def preload():
+    """Всё тяжелое создается в родителе до fork."""
+    started = time.perf_counter()
+    from giga_agent.repl_tools.classifier import get_sentiment_classifier
+    from giga_agent.tool_server import tool_server
+
+    async def build():
+        await tool_server.build_registry()
+        # Сессии MCP родителя не переживут fork, воркеры откроют свои
+        await tool_server.mcp_pool.stop()
+
+    asyncio.run(build())
+    try:
+        get_sentiment_classifier().preload()
+    except Exception:
+        logger.exception("Не удалось предзагрузить классификатор тональности")
+    # Объекты, созданные до fork, не трогаем сборщиком мусора: иначе
+    # обход поколений пишет в заголовки объектов и ломает copy-on-write
+    gc.collect()
+    gc.freeze()
+    logger.info(
+        "Предзагрузка tool server: %s инструментов за %.1f с",
+        len(tool_server.tool_map),
+        time.perf_counter() - started,
+    )
+    return tool_server.app
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, log_level: str):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, fd=sock.fileno(), log_level=log_level)
+    uvicorn.Server(config).run()
+
+
+def spawn_worker(app, sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(app, sock, log_level)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tool server с предзагрузкой и fork")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9091)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("GIGA_AGENT_TOOL_SERVER_WORKERS", 1)),
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    app = preload()
+    sock = bind_socket(args.host, args.port)
+    # pid -> время запуска
+    workers = {
+        spawn_worker(app, sock, args.log_level): time.monotonic()
+        for _ in range(args.workers)
+    }
+    stopping = False
+    rapid_failures = 0
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    exit_code = 0
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = workers.pop(pid, None)
+        if stopping or started is None:
+            continue
+        # Воркер упал — поднимаем новый из того же прогретого родителя
+        if time.monotonic() - started < WORKER_MIN_UPTIME:
+            rapid_failures += 1
+        else:
+            rapid_failures = 0
+        if rapid_failures >= MAX_RAPID_FAILURES:
+            logger.error(
+                "Воркеры падают при старте %s раз подряд, tool server остановлен",
+                rapid_failures,
+            )
+            stop(None, None)
+            exit_code = 1
+            continue
+        delay = (
+            min(RESTART_BACKOFF * 2 ** (rapid_failures - 1), RESTART_BACKOFF_MAX)
+            if rapid_failures
+            else 0
+        )
+        logger.warning(
+            "Воркер %s завершился (%s), перезапуск через %.1f с", pid, status, delay
+        )
+        if delay:
+            time.sleep(delay)
+        if not stopping:
+            workers[spawn_worker(app, sock, args.log_level)] = time.monotonic()
+    sock.close()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Долгоживущие сессии MCP для tool server.
+
+`MultiServerMCPClient.get_tools()` создает инструменты, которые на каждый вызов
+открывают новую сессию (для stdio — запускают процесс сервера заново).
+Здесь на каждый MCP-сервер держится пул постоянных сессий:
+- каждая сессия живет в своей задаче-владельце (контекст anyio должен
+  закрываться в той же задаче, где открыт) и переподключается с backoff;
+- запросы мультиплексируются внутри сессии (не больше MCP_MAX_CONCURRENCY
+  одновременно), вызов уходит в наименее загруженную сессию;
+- фоновый health check пингует сессии и переподключает сломанные;
+- время вызовов пишется в гистограмму `mcp_call_seconds{server, tool}`.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import anyio
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langchain_mcp_adapters.sessions import create_session
+from mcp import ClientSession
+from mcp.types import CallToolResult, TextContent
+from mcp.types import Tool as MCPTool
+
+from giga_agent.utils import metrics
+from giga_agent.utils.env import load_project_env
+
+logger = logging.getLogger(__name__)
+
+load_project_env()
+
+MCP_SESSIONS_PER_SERVER = int(os.getenv("GIGA_AGENT_MCP_SESSIONS_PER_SERVER", 1))
+MCP_MAX_CONCURRENCY = int(os.getenv("GIGA_AGENT_MCP_MAX_CONCURRENCY", 16))
+MCP_HEALTHCHECK_INTERVAL = float(os.getenv("GIGA_AGENT_MCP_HEALTHCHECK_INTERVAL", 30))
+MCP_CONNECT_TIMEOUT = float(os.getenv("GIGA_AGENT_MCP_CONNECT_TIMEOUT", 30))
+MCP_BACKOFF_MAX = float(os.getenv("GIGA_AGENT_MCP_BACKOFF_MAX", 30))
+
+# Ошибки, после которых сессию считаем сломанной и переподключаемся
+CONNECTION_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    ConnectionError,
+    OSError,
+)
+# Ошибки записи в закрытый поток сессии: запрос не ушел на сервер, и его
+# можно повторить. После отправки вызов не повторяется — инструмент мог уже
+# выполниться (запись, отправка сообщения)
+NOT_SENT_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError)
+# Предел страниц в list_tools — защита от сервера, который зациклил курсор
+MAX_LIST_TOOLS_PAGES = 1000
+
+
+# Две функции ниже повторяют приватные помощники langchain_mcp_adapters.tools
+# (0.1.9): публичный load_mcp_tools привязывает инструменты к одной сессии,
+# а вызовы пула должны идти через его сессии
+async def list_all_tools(session: ClientSession) -> List[MCPTool]:
+    """Все инструменты сервера с учетом пагинации `list_tools`."""
+    cursor: Optional[str] = None
+    tools: List[MCPTool] = []
+    for _ in range(MAX_LIST_TOOLS_PAGES):
+        page = await session.list_tools(cursor=cursor)
+        tools.extend(page.tools or [])
+        # Курсор может прийти как None или ""
+        if not page.nextCursor:
+            return tools
+        cursor = page.nextCursor
+    raise RuntimeError(
+        f"list_tools вернул больше {MAX_LIST_TOOLS_PAGES} страниц инструментов"
+    )
+
+
+def convert_call_tool_result(result: CallToolResult):
+    """Результат MCP в формат `content_and_artifact`: текст и нетекстовые части."""
+    texts = [item.text for item in result.content if isinstance(item, TextContent)]
+    artifacts = [item for item in result.content if not isinstance(item, TextContent)]
+    content = texts[0] if len(texts) == 1 else texts or ""
+    if result.isError:
+        raise ToolException(content)
+    return content, artifacts or None
+
+
+class MCPSession:
+    """Одна постоянная сессия с MCP-сервером и задача, которая ее держит."""
+
+    def __init__(self, server: str, connection: dict, max_concurrency: int):
+        self.server = server
+        self.connection = connection
+        self.max_concurrency = max_concurrency
+        self._reset()
+
+    def _reset(self):
+        self.session: Optional[ClientSession] = None
+        self.in_flight = 0
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._broken: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stopping = False
+
+    @property
+    def is_ready(self) -> bool:
+        return (
+            self.session is not None
+            and self._broken is not None
+            and not self._broken.is_set()
+        )
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._ready = asyncio.Event()
+            self._broken = asyncio.Event()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        attempt = 0
+        while not self._stopping:
+            try:
+                async with create_session(self.connection) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    attempt = 0
+                    metrics.inc("mcp_connects", server=self.server)
+                    logger.info("MCP %s: сессия открыта", self.server)
+                    await self._broken.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                metrics.inc("mcp_connect_errors", server=self.server)
+                logger.exception("MCP %s: ошибка сессии", self.server)
+            finally:
+                self.session = None
+                self._ready.clear()
+                self._broken.clear()
+            if self._stopping:
+                break
+            delay = min(MCP_BACKOFF_MAX, 0.5 * 2**attempt)
+            attempt += 1
+            logger.warning("MCP %s: переподключение через %.1f с", self.server, delay)
+            await asyncio.sleep(delay)
+
+    def mark_broken(self):
+        if self._broken is not None:
+            self._broken.set()
+        # Пока задача-владелец не переподключилась, wait_ready не должен
+        # отдавать сломанную сессию
+        if self._ready is not None:
+            self._ready.clear()
+
+    async def wait_ready(self, timeout: float = MCP_CONNECT_TIMEOUT) -> ClientSession:
+        self.start()
+        await asyncio.wait_for(self._ready.wait(), timeout)
+        return self.session
+
+    async def call_tool(self, name: str, arguments: dict):
+        session = await self.wait_ready()
+        self.in_flight += 1
+        try:
+            async with self._semaphore:
+                return await session.call_tool(name, arguments)
+        except CONNECTION_ERRORS:
+            self.mark_broken()
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def ping(self, timeout: float) -> bool:
+        if self.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            metrics.inc("mcp_ping_errors", server=self.server)
+            self.mark_broken()
+            return False
+
+    async def stop(self):
+        self._stopping = True
+        self.mark_broken()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, MCP_CONNECT_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self._task.cancel()
+        self._reset()
+
+
+class MCPServerPool:
+    def __init__(self, server: str, connection: dict, size: int, max_concurrency: int):
+        self.server = server
+        self.sessions = [
+            MCPSession(server, connection, max_concurrency) for _ in range(size)
+        ]
+
+    def start(self):
+        for session in self.sessions:
+            session.start()
+
+    def _pick(self, exclude: Optional[MCPSession] = None) -> MCPSession:
+        candidates = [session for session in self.sessions if session is not exclude]
+        # В пуле из одной сессии повтор ждет ее переподключения
+        candidates = candidates or self.sessions
+        ready = [session for session in candidates if session.is_ready]
+        return min(ready or candidates, key=lambda session: session.in_flight)
+
+    async def list_tools(self) -> List[MCPTool]:
+        session = await self._pick().wait_ready()
+        return await list_all_tools(session)
+
+    async def call_tool(self, name: str, arguments: dict):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            session = self._pick()
+            try:
+                return await session.call_tool(name, arguments)
+            except NOT_SENT_ERRORS:
+                # Сессия закрылась до отправки — одна повторная попытка на другой
+                status = "retry"
+                session.mark_broken()
+                return await self._pick(exclude=session).call_tool(name, arguments)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            metrics.observe(
+                "mcp_call_seconds",
+                time.perf_counter() - started,
+                server=self.server,
+                tool=name,
+            )
+            metrics.inc("mcp_calls", server=self.server, status=status)
+
+    async def stop(self):
+        await asyncio.gather(*[session.stop() for session in self.sessions])
+
+
+class MCPSessionPool:
+    def __init__(
+        self,
+        connections: Dict[str, dict],
+        size: int = MCP_SESSIONS_PER_SERVER,
+        max_concurrency: int = MCP_MAX_CONCURRENCY,
+        healthcheck_interval: float = MCP_HEALTHCHECK_INTERVAL,
+    ):
+        self.connections = connections
+        self.size = size
+        self.max_concurrency = max_concurrency
+        self.healthcheck_interval = healthcheck_interval
+        self._reset()
+        # Сессии и задачи родителя не переживают fork (см. tool_server.launcher)
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.servers = {
+            name: MCPServerPool(name, connection, self.size, self.max_concurrency)
+            for name, connection in self.connections.items()
+        }
+        self._healthcheck_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        for server in self.servers.values():
+            server.start()
+        if self.servers and (
+            self._healthcheck_task is None or self._healthcheck_task.done()
+        ):
+            self._healthcheck_task = asyncio.create_task(self._healthcheck())
+
+    async def _healthcheck(self):
+        while True:
+            await asyncio.sleep(self.healthcheck_interval)
+            for server in self.servers.values():
+                for session in server.sessions:
+                    await session.ping(timeout=self.healthcheck_interval / 2)
+
+    async def call_tool(self, server: str, name: str, arguments: dict):
+        return await self.servers[server].call_tool(name, arguments)
+
+    def _to_langchain_tool(self, server: str, tool: MCPTool) -> BaseTool:
+        async def call_tool(**arguments: Dict[str, Any]):
+            result = await self.call_tool(server, tool.name, arguments)
+            return convert_call_tool_result(result)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description or "",
+            args_schema=tool.inputSchema,
+            coroutine=call_tool,
+            response_format="content_and_artifact",
+            metadata=tool.annotations.model_dump() if tool.annotations else None,
+        )
+
+    async def get_tools(self) -> List[BaseTool]:
+        """Инструменты всех серверов, вызовы которых идут через пул сессий."""
+        self.start()
+        tools = []
+        for name, server in self.servers.items():
+            for tool in await server.list_tools():
+                tools.append(self._to_langchain_tool(name, tool))
+        return tools
+
+    def stats(self) -> dict:
+        return {
+            name: [
+                {"ready": session.is_ready, "in_flight": session.in_flight}
+                for session in server.sessions
+            ]
+            for name, server in self.servers.items()
+        }
+
+    async def stop(self):
+        if self._healthcheck_task is not None:
+            self._healthcheck_task.cancel()
+            self._healthcheck_task = None
+        await asyncio.gather(*[server.stop() for server in self.servers.values()])
@@ -8,8 +8,12 @@ import aiohttp
 import requests
 from pydantic import BaseModel
 
+from giga_agent.utils.deadline import deadline_headers, remaining
 from giga_agent.utils.jupyter import JupyterClient
 
+# Прежний фиксированный лимит; при дедлайне запуска берется остаток времени
+TOOL_CALL_TIMEOUT = 600.0
+
 
 class ToolExecuteException(Exception):
     pass
@@ -31,7 +35,8 @@ class ToolClient(BaseModel):
             async with session.post(
                 f"{self.base_url}/{tool_name}",
                 json={"kwargs": kwargs, "state": self.state},
-                timeout=600.0,
+                headers=deadline_headers(),
+                timeout=remaining(TOOL_CALL_TIMEOUT),
             ) as res:
                 if res.status == 200:
                     data = (await res.json())["data"]
@@ -49,7 +54,10 @@ class ToolClient(BaseModel):
         url = f"{self.base_url}/{tool_name}"
         try:
             response = requests.post(
-                url, json={"kwargs": kwargs, "state": self.state}, timeout=600.0
+                url,
+                json={"kwargs": kwargs, "state": self.state},
+                headers=deadline_headers(),
+                timeout=remaining(TOOL_CALL_TIMEOUT),
             )
         except requests.RequestException as e:
             # Ошибка сети или таймаут
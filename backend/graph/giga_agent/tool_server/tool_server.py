@@ -1,78 +1,52 @@
+import asyncio
+import json
+import os
+import time
 import traceback
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Body
-from langchain_gigachat.utils.function_calling import convert_to_gigachat_tool
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from fastapi import FastAPI, Body, Request
+from fastapi.encoders import jsonable_encoder
 from langgraph.prebuilt.tool_node import _handle_tool_error, ToolNode
 import gigachat.exceptions
 from pydantic_core import ValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from giga_agent.utils.env import load_project_env
+from giga_agent.utils.gigachat_token import (
+    get_gigachat_token_info,
+    invalidate_gigachat_tokens,
+)
 from giga_agent.config import MCP_CONFIG, TOOLS, REPL_TOOLS, AGENT_MAP
-
-
-async def get_gigachat_token_info() -> str:
-    """Получение информации о токенах GigaChat"""
-    try:
-        import aiohttp
-        import os
-        
-        # Получаем токен из переменных окружения
-        credentials = os.getenv("MAIN_GIGACHAT_CREDENTIALS")
-        if not credentials:
-            return "❌ Токен GigaChat не найден в переменных окружения"
-        
-        # Декодируем credentials (base64)
-        import base64
-        decoded_credentials = base64.b64decode(credentials).decode('utf-8')
-        client_id, client_secret = decoded_credentials.split(':')
-        
-        # Получаем access token
-        auth_url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-        auth_data = {
-            "scope": "GIGACHAT_API_PERS"
-        }
-        auth_headers = {
-            "Authorization": f"Basic {credentials}",
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(auth_url, data=auth_data, headers=auth_headers) as resp:
-                if resp.status == 200:
-                    auth_response = await resp.json()
-                    access_token = auth_response.get("access_token")
-                    
-                    if access_token:
-                        # Запрашиваем информацию о токенах
-                        token_url = "https://gigachat.devices.sberbank.ru/api/v1/token"
-                        token_headers = {
-                            "Authorization": f"Bearer {access_token}"
-                        }
-                        
-                        async with session.get(token_url, headers=token_headers) as token_resp:
-                            if token_resp.status == 200:
-                                token_data = await token_resp.json()
-                                return f"📊 **Информация о токенах:**\n" \
-                                       f"• Лимит токенов: {token_data.get('token_limit', 'N/A')}\n" \
-                                       f"• Использовано: {token_data.get('used_tokens', 'N/A')}\n" \
-                                       f"• Остаток: {token_data.get('remaining_tokens', 'N/A')}"
-                            else:
-                                return f"❌ Ошибка получения информации о токенах: {token_resp.status}"
-                    else:
-                        return "❌ Не удалось получить access token"
-                else:
-                    return f"❌ Ошибка авторизации: {resp.status}"
-    except Exception as e:
-        return f"❌ Ошибка при получении информации о токенах: {str(e)}"
+from giga_agent.utils import metrics
+from giga_agent.utils.deadline import (
+    DEADLINE_HEADER,
+    DeadlineExceeded,
+    deadline_scope,
+    get_deadline,
+    parse_deadline,
+    remaining,
+)
+from giga_agent.utils.instrumentation import (
+    blocking_report,
+    get_loop_monitor,
+    install_tracing,
+    span,
+    start_loop_monitor,
+    stop_loop_monitor,
+)
+from giga_agent.utils.llm_cache import cache_scope, get_cache_stats
+from giga_agent.tool_server.mcp_pool import MCPSessionPool
+from giga_agent.tool_server.validators import CompiledTool
 
 
 async def handle_gigachat_error_async(e: Exception, flag: bool = False) -> str:
     """Асинхронная обработка ошибок GigaChat с информацией о токенах"""
     if isinstance(e, gigachat.exceptions.ResponseError):
         error_msg = str(e)
+        if "unauthorized" in error_msg.lower() or "401" in error_msg:
+            # Кэшированный токен мог протухнуть раньше срока
+            invalidate_gigachat_tokens()
         
         # Получаем актуальную информацию о токенах
         token_info = await get_gigachat_token_info()
@@ -113,76 +87,274 @@ def handle_gigachat_error(e: Exception, flag: bool = False) -> str:
 
 tool_map = {}
 repl_tool_map = {}
+compiled_tools = {}
 config = {}
+mcp_pool = MCPSessionPool(MCP_CONFIG)
 
 load_project_env()
+install_tracing()
 
+# Сколько вызовов одного инструмента из /batch выполняется одновременно
+TOOL_BATCH_CONCURRENCY = int(os.getenv("GIGA_AGENT_TOOL_BATCH_CONCURRENCY", 8))
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    client = MultiServerMCPClient(MCP_CONFIG)
-    tools = TOOLS + await client.get_tools()
+
+async def build_registry():
+    """Собирает реестр инструментов (включая MCP)."""
+    tools = TOOLS + await mcp_pool.get_tools()
     config["tool_node"] = ToolNode(tools=tools)
     for tool in tools:
         tool_map[tool.name] = tool
+        # Валидатор и схема для ошибок строятся один раз, а не на каждый вызов
+        compiled_tools[tool.name] = CompiledTool(tool)
     for tool in REPL_TOOLS:
         repl_tool_map[tool.__name__] = tool
-    yield
+
+
+def clear_registry():
     repl_tool_map.clear()
     tool_map.clear()
+    compiled_tools.clear()
     config.clear()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # В режиме launcher реестр уже собран в родительском процессе до fork
+    preloaded = bool(tool_map)
+    if not preloaded:
+        await build_registry()
+    else:
+        # Сессии MCP открываются в каждом воркере заново
+        mcp_pool.start()
+    start_loop_monitor("tool_server")
+    yield
+    await stop_loop_monitor()
+    await mcp_pool.stop()
+    if not preloaded:
+        clear_registry()
+
+
 app = FastAPI(lifespan=lifespan)
 
 
-@app.post("/{tool_name}")
-async def call_tool(tool_name: str, payload: dict = Body(...)):
-    if tool_name in tool_map or tool_name in repl_tool_map:
-        if tool_name in AGENT_MAP:
-            return JSONResponse(
-                status_code=500,
-                content=f"Ты пытался вызвать '{tool_name}'. "
-                f"Нельзя вызывать '{tool_name}' из кода! Вызывай их через function_call",
-            )
+class ToolCallError(Exception):
+    def __init__(self, status_code: int, content: str):
+        super().__init__(content)
+        self.status_code = status_code
+        self.content = content
+
+
+def resolve_tool(tool_name: str):
+    if tool_name not in tool_map and tool_name not in repl_tool_map:
+        raise ToolCallError(404, f"Tool with name {tool_name} not found!")
+    if tool_name in AGENT_MAP:
+        raise ToolCallError(
+            500,
+            f"Ты пытался вызвать '{tool_name}'. "
+            f"Нельзя вызывать '{tool_name}' из кода! Вызывай их через function_call",
+        )
+    if tool_name in repl_tool_map:
+        return repl_tool_map[tool_name]
+    return tool_map[tool_name]
+
+
+def get_compiled_tool(tool) -> CompiledTool:
+    if tool.name not in compiled_tools:
+        compiled_tools[tool.name] = CompiledTool(tool)
+    return compiled_tools[tool.name]
+
+
+def get_tool_schema(tool) -> dict:
+    """Схема инструмента для сообщений об ошибке, строится один раз на инструмент."""
+    return get_compiled_tool(tool).schema
+
+
+def prepare_tool_args(tool, kwargs: dict, state) -> dict:
+    injected_args = config["tool_node"].inject_tool_args(
+        {"name": tool.name, "args": kwargs, "id": "123"}, state, None
+    )["args"]
+    if tool.name == "python":
+        injected_args["code"] = kwargs.get("code")
+    return injected_args
+
+
+async def run_tool(tool_name: str, kwargs: dict, state):
+    tool = resolve_tool(tool_name)
+    # Инструменты tool server вызываются мимо колбэков LangChain, спан — здесь
+    with span("tool", tool_name):
+        return await _run_resolved_tool(tool, tool_name, kwargs, state)
+
+
+async def _run_resolved_tool(tool, tool_name: str, kwargs: dict, state):
+    if tool_name in repl_tool_map:
+        # Семантический кэш LLM в repl-инструментах не смешивает данные разных ядер
+        with cache_scope((state or {}).get("kernel_id")):
+            return await tool(**kwargs)
+    compiled = get_compiled_tool(tool)
+    try:
+        validated = compiled.validate(prepare_tool_args(tool, kwargs, state))
+    except ValidationError as e:
+        content = handle_gigachat_error(e, flag=True)
+        raise ToolCallError(
+            500, f"Ошибка в заполнении функции!\n{content}{compiled.error_hint}"
+        )
+    # Аргументы проверены один раз, для StructuredTool вызов идет сразу в корутину
+    return await compiled.ainvoke(validated)
+
+
+async def run_tool_with_deadline(tool_name: str, kwargs: dict, state):
+    """Вызов, ограниченный остатком дедлайна запуска (если он передан)."""
+    try:
+        return await asyncio.wait_for(
+            run_tool(tool_name, kwargs, state), timeout=remaining()
+        )
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        deadline = get_deadline()
+        if deadline is None or time.time() < deadline:
+            # Таймаут внутри самого инструмента, а не дедлайн запуска
+            raise
+        metrics.inc("tool_deadline_exceeded", tool=tool_name)
+        raise ToolCallError(
+            504, f"Время выполнения инструмента {tool_name} истекло"
+        )
+
+
+async def run_tool_safe(tool_name: str, kwargs: dict, state) -> dict:
+    """Результат вызова в виде {"status", "data"|"error"}: ошибки не пробрасываются."""
+    try:
+        return {
+            "status": 200,
+            "data": await run_tool_with_deadline(tool_name, kwargs, state),
+        }
+    except ToolCallError as e:
+        return {"status": e.status_code, "error": e.content}
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": 500, "error": await handle_gigachat_error_async(e, flag=True)}
+
+
+async def cancel_on_disconnect(request: Request, coro):
+    """
+    Выполняет корутину, пока клиент ждет ответа. Если соединение разорвано
+    (запуск брошен или у клиента вышел таймаут), вызов отменяется.
+    """
+    task = asyncio.create_task(coro)
+
+    async def wait_disconnect():
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    watcher = asyncio.create_task(wait_disconnect())
+    cancelled = False
+    try:
+        await asyncio.wait([task, watcher], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            cancelled = True
+            metrics.inc("tool_calls_cancelled")
+    if cancelled:
+        raise ToolCallError(499, "Клиент отключился, вызов отменен")
+    return task.result()
+
+
+# Регистрируется раньше "/{tool_name}", иначе запрос попадет в вызов инструмента "batch"
+@app.post("/batch")
+async def call_tools_batch(request: Request, payload: dict = Body(...)):
+    """
+    Пакетный вызов: `{"items": [{"tool": ..., "kwargs": {...}}, ...], "state": {...}}`.
+    Вызовы выполняются параллельно (не больше TOOL_BATCH_CONCURRENCY на инструмент),
+    результаты отдаются в исходном порядке по мере готовности в формате NDJSON:
+    одна строка `{"index", "status", "data"|"error"}` на элемент.
+    """
+    items = payload.get("items") or []
+    state = payload.get("state")
+    semaphores = {}
+
+    async def run_item(item: dict) -> dict:
+        tool_name = item.get("tool")
+        semaphore = semaphores.setdefault(
+            tool_name, asyncio.Semaphore(TOOL_BATCH_CONCURRENCY)
+        )
+        async with semaphore:
+            return await run_tool_safe(tool_name, item.get("kwargs") or {}, state)
+
+    tasks = []
+    # Задачи наследуют дедлайн из контекста, в котором созданы
+    deadline = parse_deadline(request.headers.get(DEADLINE_HEADER))
+    with deadline_scope(deadline):
+        for item in items:
+            # Каждый элемент выполняется отдельно, даже одинаковые:
+            # инструменты могут быть неидемпотентными
+            tasks.append(asyncio.create_task(run_item(item)))
+    metrics.inc("tool_batch_items", len(tasks))
+
+    async def stream():
         try:
-            if tool_name in repl_tool_map:
-                kwargs = payload.get("kwargs")
-                return JSONResponse({"data": await repl_tool_map[tool_name](**kwargs)})
-            tool = tool_map[tool_name]
-            kwargs = payload.get("kwargs")
-            state = payload.get("state")
-            injected_args = config["tool_node"].inject_tool_args(
-                {"name": tool.name, "args": kwargs, "id": "123"}, state, None
-            )["args"]
-            if tool.name == "python":
-                injected_args["code"] = kwargs.get("code")
-            try:
-                tool._to_args_and_kwargs(injected_args, None)
-            except ValidationError as e:
-                content = handle_gigachat_error(e, flag=True)
-                tool_schema = convert_to_gigachat_tool(tool)["function"]
-                return JSONResponse(
-                    status_code=500,
-                    content=f"Ошибка в заполнении функции!\n{content}\nЗаполни параметры функции по следующей схеме: {tool_schema}",
-                )
-            data = await tool_map[tool_name].ainvoke(injected_args)
-            return {"data": data}
-        except Exception as e:
-            traceback.print_exc()
-            error_content = await handle_gigachat_error_async(e, flag=True)
-            return JSONResponse(
-                status_code=500, content=error_content
+            for index, task in enumerate(tasks):
+                result = await task
+                line = jsonable_encoder({"index": index, **result})
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # Клиент отключился — не продолжаем оставшиеся вызовы
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.post("/{tool_name}")
+async def call_tool(tool_name: str, request: Request, payload: dict = Body(...)):
+    deadline = parse_deadline(request.headers.get(DEADLINE_HEADER))
+    try:
+        # Вложенные клиенты (например, к REPL) получают тот же дедлайн
+        with deadline_scope(deadline):
+            data = await cancel_on_disconnect(
+                request,
+                run_tool_with_deadline(
+                    tool_name, payload.get("kwargs"), payload.get("state")
+                ),
             )
-    else:
-        return JSONResponse(
-            status_code=404, content=f"Tool with name {tool_name} not found!"
-        )
+    except ToolCallError as e:
+        return JSONResponse(status_code=e.status_code, content=e.content)
+    except Exception as e:
+        traceback.print_exc()
+        error_content = await handle_gigachat_error_async(e, flag=True)
+        return JSONResponse(status_code=500, content=error_content)
+    if tool_name in repl_tool_map:
+        return JSONResponse({"data": data})
+    return {"data": data}
 
 
 @app.get("/tools")
 async def get_tools():
     tools = []
     for tool in tool_map.values():
-        tools.append(convert_to_gigachat_tool(tool)["function"])
+        tools.append(get_tool_schema(tool))
     return tools
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "metrics": metrics.snapshot(),
+        "llm_cache": get_cache_stats(),
+        "mcp": mcp_pool.stats(),
+    }
+
+
+@app.get("/blocking")
+async def get_blocking(top: int = 20):
+    """Места, где event loop tool server блокировался дольше порога, и самые долгие спаны."""
+    return blocking_report(top)
+
+
+@app.delete("/blocking")
+async def reset_blocking():
+    monitor = get_loop_monitor()
+    if monitor is not None:
+        monitor.reset()
+    return blocking_report(0)
@@ -0,0 +1,65 @@
+"""
+Скомпилированные валидаторы аргументов инструментов для tool server.
+
+Раньше каждый вызов проходил валидацию дважды: `tool._to_args_and_kwargs`
+для проверки и еще раз внутри `tool.ainvoke`, а при ошибке схема инструмента
+заново строилась через `convert_to_gigachat_tool`. Здесь для каждого инструмента
+один раз при сборке реестра создаются:
+- `TypeAdapter` по pydantic-схеме аргументов;
+- готовый текст подсказки со схемой для сообщения об ошибке.
+
+Для `StructuredTool` с корутиной вызов после единственной проверки идет
+напрямую в корутину, минуя callback-менеджер и повторный разбор аргументов.
+Остальные инструменты (JSON-схема, только синхронная функция, корутина
+с `config`/`callbacks`) по-прежнему вызываются через `ainvoke`.
+"""
+import inspect
+from typing import Any, Optional
+
+from langchain_core.tools import BaseTool, StructuredTool
+from langchain_core.tools.base import _get_runnable_config_param
+from langchain_gigachat.utils.function_calling import convert_to_gigachat_tool
+from pydantic import BaseModel, TypeAdapter
+
+
+class CompiledTool:
+    """Инструмент вместе с валидатором и схемой, подготовленными один раз."""
+
+    def __init__(self, tool: BaseTool):
+        self.tool = tool
+        self.schema = convert_to_gigachat_tool(tool)["function"]
+        self.error_hint = (
+            f"\nЗаполни параметры функции по следующей схеме: {self.schema}"
+        )
+        args_schema = tool.args_schema
+        self.adapter: Optional[TypeAdapter] = None
+        if isinstance(args_schema, type) and issubclass(args_schema, BaseModel):
+            self.adapter = TypeAdapter(args_schema)
+        self.direct = (
+            self.adapter is not None
+            and isinstance(tool, StructuredTool)
+            and tool.coroutine is not None
+            and _get_runnable_config_param(tool.coroutine) is None
+            and "callbacks" not in inspect.signature(tool.coroutine).parameters
+        )
+
+    def validate(self, args: dict) -> dict:
+        """
+        Одна проверка аргументов по схеме. Как и в langchain, в результат
+        попадают только переданные поля — значения по умолчанию берет функция.
+        """
+        if self.adapter is None:
+            # JSON-схема (MCP): langchain ее не проверяет, проверит сам сервер
+            return args
+        model = self.adapter.validate_python(args)
+        return {key: getattr(model, key) for key in model.model_fields_set}
+
+    async def ainvoke(self, validated: dict) -> Any:
+        """Вызов с аргументами, уже прошедшими `validate`."""
+        if not self.direct:
+            return await self.tool.ainvoke(validated)
+        result = await self.tool.coroutine(**validated)
+        if self.tool.response_format == "content_and_artifact":
+            # ainvoke без ToolCall возвращает только содержимое
+            return result[0]
+        return result
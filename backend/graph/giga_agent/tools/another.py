@@ -15,6 +15,7 @@ from pydantic import Field
 
 from langgraph_sdk import get_client
 
+from giga_agent.utils.blob_store import attachment_bytes
 from giga_agent.utils.llm import is_llm_image_inline, load_llm
 from giga_agent.generators.image import load_image_gen
 from giga_agent.prompts.image import IMAGE_PROMPT
@@ -162,11 +163,10 @@ async def ask_about_image(
     else:
         client = get_client()
         result = await client.store.get_item(("attachments",), key=image_id)
-        data = (
-            result["value"]["img_data"]
-            if "img_data" in result["value"]
-            else result["value"]["data"]
-        )
+        value = result["value"]
+        has_preview = "img_blob" in value or "img_data" in value
+        image = await attachment_bytes(value, "img_data" if has_preview else "data")
+        data = base64.b64encode(image).decode()
         return (
             (
                 await llm.ainvoke(
@@ -1,11 +1,12 @@
 import asyncio
 import json
 import uuid
-from base64 import b64decode, b64encode
+from base64 import b64decode
 
 import plotly
 from pydantic import BaseModel, Field
 
+from giga_agent.utils.blob_store import get_blob_store
 from giga_agent.utils.llm import is_llm_image_inline, load_llm
 from giga_agent.utils.jupyter import JupyterClient
 from langchain_core.tools import BaseTool
@@ -17,6 +18,9 @@ class CodeInput(BaseModel):
     code: str = Field(..., description="Код Python")
 
 
+# Бюджет ячейки, который запрашивается у REPL (сервер ограничивает его REPL_MAX_TIMEOUT)
+REPL_TIMEOUT = float(os.getenv("GIGA_AGENT_REPL_TIMEOUT", 30))
+
 INPUT_REGEX = re.compile(r"input\(.+?\)")
 FILE_NOT_FOUND_REGEX = re.compile(r"FileNotFoundError:.+?No such file or directory")
 
@@ -47,7 +51,7 @@ class ExecuteTool(BaseTool):
                 "is_exception": True,
             }
 
-        response = await client.execute(self.kernel_id, code)
+        response = await client.execute(self.kernel_id, code, timeout=REPL_TIMEOUT)
         result = response["result"]
         results = []
         if result is not None:
@@ -81,7 +85,8 @@ class ExecuteTool(BaseTool):
                     uploaded_file_id = (await llm.aupload_file(("image.png", img))).id_
                 else:
                     uploaded_file_id = str(uuid.uuid4())
-                attachment_data["img_data"] = b64encode(img)
+                # PNG для анализа изображения, без base64 в store
+                attachment_data["img_blob"] = await get_blob_store().aput(img)
                 attachment_data["file_id"] = uploaded_file_id
                 attachment_info += f"ID изображения '{uploaded_file_id}'. Ты можешь показать это пользователю с помощью через \"![График](graph:{uploaded_file_id})\" "
                 results.append(attachment_info)
@@ -99,7 +104,7 @@ class ExecuteTool(BaseTool):
                 "Исправь ошибку."
             )
             if "KeyboardInterrupt" in exc:
-                message += "Твой код выполнялся слишком долго! Разбей его на более простые шаги, чтобы он выполнялся меньше 40 секунд, или поменяй алгоритм решения задачи на более оптимальный!"
+                message += f"Твой код выполнялся слишком долго! Разбей его на более простые шаги, чтобы он выполнялся меньше {REPL_TIMEOUT:.0f} секунд, или поменяй алгоритм решения задачи на более оптимальный!"
         else:
             message = (
                 f'Результат выполнения: "{result.strip()}". Код выполнился без ошибок. Проверь нужные переменные. Не забудь, что пользователь не видит этот результат, поэтому если нужно перепиши его.\n'
@@ -9,10 +9,11 @@ from langchain_tavily import TavilyExtract
 from langgraph.prebuilt import InjectedState
 
 from giga_agent.utils.env import load_project_env
+from giga_agent.utils.gigachat_token import get_gigachat_token_manager
 from giga_agent.utils.llm import load_llm, is_llm_image_inline, is_llm_gigachat
 from giga_agent.utils.messages import filter_tool_calls
 
-llm = load_llm(tag="fast").bind(top_p=0.3).with_config(tags=["nostream"])
+llm = load_llm(tag="fast")
 
 PROMPT = ChatPromptTemplate.from_messages(
     [
@@ -51,8 +52,9 @@ PROMPT = ChatPromptTemplate.from_messages(
 scrape_sem = asyncio.Semaphore(4)
 
 
-async def url_response_to_llm(messages, response):
-    extract_ch = PROMPT | llm
+async def url_response_to_llm(messages, response, model):
+    # Без кэша ответов: промпт содержит всю историю диалога и не повторяется
+    extract_ch = PROMPT | model.bind(top_p=0.3).with_config(tags=["nostream"])
     last_mes = filter_tool_calls(messages[-1])
 
     message = HumanMessage(
@@ -109,11 +111,14 @@ async def get_urls(urls: list[str], state: Annotated[dict, InjectedState]):
     response = await extract.ainvoke(
         {"urls": urls, "include_images": False, "extract_depth": "basic"}
     )
-    if is_llm_gigachat():
-        await llm._client.aget_token()
+    model = llm
+    token_manager = get_gigachat_token_manager()
+    if is_llm_gigachat(tag="fast") and token_manager is not None:
+        # Токен берется из общего кэша, а не запрашивается на каждый вызов
+        model = await token_manager.abind(llm)
     tasks = []
     for result in response["results"]:
-        tasks.append(url_response_to_llm(state["messages"], result))
+        tasks.append(url_response_to_llm(state["messages"], result, model))
 
     response = await asyncio.gather(*tasks, return_exceptions=True)
     return {
@@ -0,0 +1,159 @@
+"""
+Политика подтверждения вызовов инструментов.
+
+Политика задается в JSON (путь к файлу или сам JSON в `GIGA_AGENT_APPROVAL_POLICY`)
+и проверяется до `interrupt`: разрешенные вызовы выполняются в том же шаге графа
+без записи чекпоинта и похода к клиенту.
+
+Пример:
+
+    {
+      "default": "ask",
+      "rules": [
+        {"tool": "weather", "action": "allow"},
+        {"tool": "vk_*", "action": "allow"},
+        {"tool": "python", "args": {"code": "^(?!.*pip install)"}, "action": "allow"},
+        {"tool": "search", "users": ["analyst-1"], "action": "allow"},
+        {"tool": "run_program", "action": "deny"}
+      ]
+    }
+
+Правила проверяются по порядку, срабатывает первое подходящее:
+- `tool` — имя инструмента, поддерживаются шаблоны `*` и `?`;
+- `args` — регулярные выражения для аргументов (ищутся через `re.search`,
+  нестроковые значения сравниваются в виде JSON), должны совпасть все;
+- `users` — список пользователей: id, под которым сервер LangGraph
+  аутентифицировал запуск (`langgraph_auth_user_id`); `user_id` из конфига
+  запуска не учитывается — его задает сам клиент;
+- `action` — `allow` (без подтверждения), `ask` (спросить), `deny` (отклонить).
+"""
+import fnmatch
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Pattern
+
+from giga_agent.utils import metrics
+from giga_agent.utils.env import load_project_env
+
+logger = logging.getLogger(__name__)
+
+load_project_env()
+
+ALLOW = "allow"
+ASK = "ask"
+DENY = "deny"
+ACTIONS = (ALLOW, ASK, DENY)
+
+
+class ApprovalRule:
+    def __init__(
+        self,
+        tool: str = "*",
+        action: str = ASK,
+        args: Optional[Dict[str, Pattern]] = None,
+        users: Optional[List[str]] = None,
+    ):
+        self.tool = tool
+        self.action = action
+        self.args = args or {}
+        self.users = users
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ApprovalRule":
+        action = data.get("action", ASK)
+        if action not in ACTIONS:
+            raise ValueError(f"Неизвестное действие в политике подтверждения: {action}")
+        return cls(
+            tool=data.get("tool", "*"),
+            action=action,
+            args={
+                name: re.compile(pattern, re.DOTALL)
+                for name, pattern in (data.get("args") or {}).items()
+            },
+            users=[str(user) for user in data["users"]] if "users" in data else None,
+        )
+
+    def matches(self, tool_name: str, args: dict, user_id: Optional[str]) -> bool:
+        if not fnmatch.fnmatchcase(tool_name, self.tool):
+            return False
+        if self.users is not None and user_id not in self.users:
+            return False
+        for name, pattern in self.args.items():
+            if name not in args:
+                return False
+            value = args[name]
+            if not isinstance(value, str):
+                value = json.dumps(value, ensure_ascii=False)
+            if not pattern.search(value):
+                return False
+        return True
+
+
+class ApprovalPolicy:
+    def __init__(self, rules: List[ApprovalRule], default: str = ASK):
+        self.rules = rules
+        self.default = default
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ApprovalPolicy":
+        default = data.get("default", ASK)
+        if default not in ACTIONS:
+            raise ValueError(f"Неизвестное действие в политике подтверждения: {default}")
+        return cls(
+            rules=[ApprovalRule.from_dict(rule) for rule in data.get("rules", [])],
+            default=default,
+        )
+
+    @classmethod
+    def from_env(cls, value: Optional[str]) -> "ApprovalPolicy":
+        """Пустое значение — подтверждение требуется для всех вызовов, как раньше."""
+        if not value:
+            return cls(rules=[])
+        value = value.strip()
+        if not value.startswith("{"):
+            with open(value, "r", encoding="utf-8") as f:
+                value = f.read()
+        return cls.from_dict(json.loads(value))
+
+    def evaluate(
+        self, tool_name: str, args: Optional[dict], user_id: Optional[str] = None
+    ) -> str:
+        args = args or {}
+        action = self.default
+        for rule in self.rules:
+            if rule.matches(tool_name, args, user_id):
+                action = rule.action
+                break
+        # "ask" не считаем: после interrupt узел выполняется повторно
+        if action == ALLOW:
+            metrics.inc("interrupts_avoided", tool=tool_name)
+        elif action == DENY:
+            metrics.inc("tool_calls_denied", tool=tool_name)
+        return action
+
+
+def get_user_id(config: Optional[dict]) -> Optional[str]:
+    """Аутентифицированный пользователь запуска; ставится сервером, а не клиентом."""
+    configurable = (config or {}).get("configurable") or {}
+    user_id = configurable.get("langgraph_auth_user_id")
+    return str(user_id) if user_id else None
+
+
+_APPROVAL_POLICY: Optional[ApprovalPolicy] = None
+
+
+def get_approval_policy() -> ApprovalPolicy:
+    global _APPROVAL_POLICY
+
+    if _APPROVAL_POLICY is None:
+        _APPROVAL_POLICY = ApprovalPolicy.from_env(
+            os.getenv("GIGA_AGENT_APPROVAL_POLICY")
+        )
+        logger.info(
+            "Политика подтверждения: %s правил, по умолчанию '%s'",
+            len(_APPROVAL_POLICY.rules),
+            _APPROVAL_POLICY.default,
+        )
+    return _APPROVAL_POLICY
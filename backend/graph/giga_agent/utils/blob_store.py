@@ -0,0 +1,217 @@
+"""
+Контентно-адресуемое хранилище вложений (изображения, графики plotly, HTML, MP3).
+
+В LangGraph store кладутся только метаданные вложения и sha256 содержимого
+(`blob`, для превью графика — `img_blob`), а сами байты лежат в файловой
+системе под `GIGA_AGENT_BLOB_DIR` (`<root>/ab/abcdef...`):
+- одинаковое содержимое хранится один раз;
+- `/blobs/{sha256}` в tasks_app отдает файл через sendfile с поддержкой Range,
+  не читая его в память процесса;
+- вложения, к которым не обращались дольше `GIGA_AGENT_BLOB_TTL` секунд,
+  удаляются сборщиком мусора (0 — хранить бессрочно), но только если на них
+  не ссылается ни один элемент store: элементы хранятся без TTL, и на них
+  ссылается индекс загрузок upload_server.
+
+Старые элементы store с base64 в `data` / `img_data` по-прежнему читаются
+через `attachment_bytes`.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Collection, Optional
+
+from langgraph_sdk import get_client
+
+from giga_agent.utils import metrics
+from giga_agent.utils.env import load_project_env
+
+logger = logging.getLogger(__name__)
+
+load_project_env()
+
+BLOB_DIR = os.getenv("GIGA_AGENT_BLOB_DIR", "db/blobs")
+BLOB_TTL = float(os.getenv("GIGA_AGENT_BLOB_TTL", 0))
+BLOB_GC_INTERVAL = float(os.getenv("GIGA_AGENT_BLOB_GC_INTERVAL", 3600))
+
+_DIGEST_REGEX = re.compile(r"^[0-9a-f]{64}$")
+# Типы, в которых base64 хранится в поле data; остальное — текст или JSON
+_BASE64_TYPES = {"image/png", "audio/mp3"}
+# Пространства store, элементы которых ссылаются на вложения
+REFERENCE_NAMESPACES = (("attachments",), ("html",), ("audio",))
+REFERENCE_PAGE_SIZE = 100
+
+
+class BlobNotFound(KeyError):
+    pass
+
+
+class FilesystemBlobStore:
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        if not _DIGEST_REGEX.match(digest):
+            raise BlobNotFound(digest)
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        try:
+            return os.path.exists(self.path(digest))
+        except BlobNotFound:
+            return False
+
+    def touch(self, digest: str):
+        """Продлевает жизнь вложения: GC смотрит на время последнего обращения."""
+        try:
+            os.utime(self.path(digest))
+        except FileNotFoundError:
+            raise BlobNotFound(digest) from None
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.path(digest)
+        if os.path.exists(target):
+            os.utime(target)
+            metrics.inc("blob_store_dedup")
+            return digest
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+        metrics.inc("blob_store_put")
+        return digest
+
+    def read(self, digest: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Байты [start, end) вложения; без end — до конца файла."""
+        path = self.path(digest)
+        try:
+            with open(path, "rb") as f:
+                os.utime(f.fileno())
+                if start:
+                    f.seek(start)
+                return f.read() if end is None else f.read(max(end - start, 0))
+        except FileNotFoundError:
+            raise BlobNotFound(digest) from None
+
+    def gc(self, ttl: float = BLOB_TTL, keep: Collection[str] = ()) -> int:
+        """
+        Удаляет вложения, к которым не обращались дольше ttl секунд,
+        кроме перечисленных в keep.
+        """
+        if ttl <= 0:
+            return 0
+        border = time.time() - ttl
+        removed = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name in keep:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if os.stat(path).st_mtime < border:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        metrics.inc("blob_store_gc_removed", removed)
+        return removed
+
+    async def aput(self, data: bytes) -> str:
+        return await asyncio.to_thread(self.put, data)
+
+    async def aread(
+        self, digest: str, start: int = 0, end: Optional[int] = None
+    ) -> bytes:
+        return await asyncio.to_thread(self.read, digest, start, end)
+
+
+_BLOB_STORE_SINGLETON: Optional[FilesystemBlobStore] = None
+
+
+def get_blob_store() -> FilesystemBlobStore:
+    global _BLOB_STORE_SINGLETON
+
+    if _BLOB_STORE_SINGLETON is None:
+        _BLOB_STORE_SINGLETON = FilesystemBlobStore()
+    return _BLOB_STORE_SINGLETON
+
+
+def _to_bytes(value, base64_encoded: bool) -> bytes:
+    if base64_encoded:
+        return base64.b64decode(value)
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+async def offload_attachment(attachment: dict) -> dict:
+    """
+    Переносит содержимое вложения в хранилище и возвращает метаданные для store:
+    `data` заменяется на `blob` (+ `size`), `img_data` — на `img_blob`.
+    """
+    store = get_blob_store()
+    value = {k: v for k, v in attachment.items() if k not in ("data", "img_data")}
+    if attachment.get("data") is not None and "blob" not in attachment:
+        data = _to_bytes(attachment["data"], attachment.get("type") in _BASE64_TYPES)
+        value["blob"] = await store.aput(data)
+        value["size"] = len(data)
+    if attachment.get("img_data") is not None and "img_blob" not in attachment:
+        value["img_blob"] = await store.aput(_to_bytes(attachment["img_data"], True))
+    return value
+
+
+async def attachment_bytes(value: dict, field: str = "data") -> bytes:
+    """
+    Содержимое вложения из элемента store: `field` — `data` или `img_data`.
+    Для старых элементов декодирует base64 / текст прямо из store.
+    """
+    blob = value.get("img_blob" if field == "img_data" else "blob")
+    if blob:
+        return await get_blob_store().aread(blob)
+    if field == "img_data" or value.get("type") in _BASE64_TYPES:
+        return base64.b64decode(value[field])
+    return _to_bytes(value[field], False)
+
+
+async def referenced_digests() -> set:
+    """sha256 вложений, на которые ссылаются элементы store."""
+    client = get_client()
+    digests = set()
+    for namespace in REFERENCE_NAMESPACES:
+        offset = 0
+        while True:
+            page = await client.store.search_items(
+                namespace, limit=REFERENCE_PAGE_SIZE, offset=offset
+            )
+            items = page["items"]
+            for item in items:
+                for field in ("blob", "img_blob"):
+                    if item["value"].get(field):
+                        digests.add(item["value"][field])
+            if len(items) < REFERENCE_PAGE_SIZE:
+                break
+            offset += len(items)
+    return digests
+
+
+async def gc_loop(interval: float = BLOB_GC_INTERVAL, ttl: float = BLOB_TTL):
+    """Периодическая сборка мусора; запускается в lifespan tasks_app."""
+    while True:
+        try:
+            # Если ссылки не удалось собрать, сборка пропускается целиком
+            keep = await referenced_digests()
+            removed = await asyncio.to_thread(get_blob_store().gc, ttl, keep)
+            if removed:
+                logger.info("Blob store: удалено %s устаревших вложений", removed)
+        except Exception:
+            logger.exception("Ошибка сборки мусора в blob store")
+        await asyncio.sleep(interval)
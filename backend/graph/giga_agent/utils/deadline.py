@@ -0,0 +1,116 @@
+"""
+Дедлайн запуска, который передается по цепочке граф → tool server → REPL → ядро.
+
+Дедлайн — абсолютное время (unix epoch, секунды) в заголовке `X-Giga-Deadline`.
+Внутри процесса он хранится в ContextVar, поэтому вложенные клиенты
+(ToolClient, JupyterClient) подхватывают его сами: каждый слой берет
+как таймаут остаток времени, но не больше своего прежнего лимита.
+
+Отмена идет тем же путем: когда запуск брошен, задача узла отменяется,
+HTTP-запрос закрывается, а следующий слой видит разрыв соединения
+и останавливает свою работу (tool server отменяет вызов, REPL прерывает ядро).
+"""
+import contextlib
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar, Token
+from typing import Optional
+
+from giga_agent.utils.env import load_project_env
+
+load_project_env()
+
+DEADLINE_HEADER = "X-Giga-Deadline"
+# Бюджет на весь запуск графа, если клиент не передал свой; 0 — без дедлайна
+RUN_TIMEOUT = float(os.getenv("GIGA_AGENT_RUN_TIMEOUT", 3600))
+
+_deadline: ContextVar[Optional[float]] = ContextVar("giga_deadline", default=None)
+# Дедлайны запусков: узлы одного запуска делят общий бюджет
+_run_deadlines: "OrderedDict[str, float]" = OrderedDict()
+_MAX_RUNS = 4096
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def parse_deadline(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def run_deadline(config: Optional[dict]) -> Optional[float]:
+    """
+    Дедлайн текущего запуска: `configurable.deadline` (epoch) или
+    `configurable.run_timeout` (секунды от первого обращения в запуске),
+    иначе GIGA_AGENT_RUN_TIMEOUT.
+    """
+    config = config or {}
+    configurable = config.get("configurable") or {}
+    if configurable.get("deadline"):
+        return float(configurable["deadline"])
+    timeout = float(configurable.get("run_timeout") or RUN_TIMEOUT)
+    if timeout <= 0:
+        return None
+    run_id = (config.get("metadata") or {}).get("run_id") or configurable.get(
+        "run_id"
+    )
+    if run_id is None:
+        return time.time() + timeout
+    run_id = str(run_id)
+    if run_id not in _run_deadlines:
+        _run_deadlines[run_id] = time.time() + timeout
+        while len(_run_deadlines) > _MAX_RUNS:
+            _run_deadlines.popitem(last=False)
+    return _run_deadlines[run_id]
+
+
+def get_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def set_deadline(deadline: Optional[float]) -> Token:
+    """Устанавливает дедлайн; более поздний, чем уже действующий, не расширяет его."""
+    current = _deadline.get()
+    if current is not None and (deadline is None or deadline > current):
+        deadline = current
+    return _deadline.set(deadline)
+
+
+def reset_deadline(token: Token):
+    _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def deadline_scope(deadline: Optional[float]):
+    token = set_deadline(deadline)
+    try:
+        yield get_deadline()
+    finally:
+        reset_deadline(token)
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """
+    Сколько секунд осталось: не больше `default`, если он задан.
+    Без дедлайна возвращает `default`. Если время вышло — DeadlineExceeded.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    left = deadline - time.time()
+    if left <= 0:
+        raise DeadlineExceeded("Время выполнения запуска истекло")
+    return left if default is None else min(default, left)
+
+
+def deadline_headers() -> dict:
+    deadline = _deadline.get()
+    if deadline is None:
+        return {}
+    return {DEADLINE_HEADER: f"{deadline:.3f}"}
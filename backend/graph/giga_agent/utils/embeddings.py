@@ -0,0 +1,222 @@
+"""
+Сервис эмбедингов поверх `load_embeddings()`:
+- дедупликация повторяющихся текстов до обращения к API;
+- разбиение на батчи по `GIGA_AGENT_EMBEDDINGS_BATCH_SIZE` и параллельные запросы;
+- дисковый кэш по хэшу содержимого (float32 memmap + индекс).
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from giga_agent.utils.env import load_project_env
+from giga_agent.utils.llm import load_embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+load_project_env()
+
+EMBEDDINGS_BATCH_SIZE = int(os.getenv("GIGA_AGENT_EMBEDDINGS_BATCH_SIZE", 64))
+EMBEDDINGS_CONCURRENCY = int(os.getenv("GIGA_AGENT_EMBEDDINGS_CONCURRENCY", 4))
+# Пустое значение выключает дисковый кэш
+EMBEDDINGS_CACHE_DIR = os.getenv("GIGA_AGENT_EMBEDDINGS_CACHE_DIR", "db/embeddings")
+
+
+class EmbeddingsDiskCache:
+    """
+    Кэш эмбедингов на диске:
+    - `vectors.f32` — матрица float32 (n × dim), читается через `np.memmap`;
+    - `index.txt` — хэш текста на каждой строке, номер строки = номер вектора.
+    Запись только дописыванием, поэтому кэш переживает рестарты и может
+    использоваться несколькими процессами.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / "vectors.f32"
+        self.index_path = self.directory / "index.txt"
+        self.dim_path = self.directory / "dim"
+        self.vectors_path.touch(exist_ok=True)
+        self.index_path.touch(exist_ok=True)
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._index_offset = 0
+        self._dim: Optional[int] = self._read_dim()
+        self._memmap: Optional[np.memmap] = None
+        with self._lock, self._file_lock():
+            self._sync_index()
+            self._truncate_orphan_vectors()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.directory / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_dim(self) -> Optional[int]:
+        try:
+            return int(self.dim_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _sync_index(self):
+        """Дочитывает строки индекса, дописанные другими процессами."""
+        if self.index_path.stat().st_size == self._index_offset:
+            return
+        if self._dim is None:
+            # Размерность мог записать другой процесс после нашего старта
+            self._dim = self._read_dim()
+            if self._dim is None:
+                # Без размерности строки не прочитать: подхватим их позже
+                return
+        with open(self.index_path, "r", encoding="ascii") as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                self._index.setdefault(line.strip(), len(self._index))
+                self._index_offset += len(line)
+        self._memmap = None
+
+    def _truncate_orphan_vectors(self):
+        # Векторы, для которых не успели дописать индекс (падение процесса)
+        if self._dim is None:
+            return
+        expected = len(self._index) * self._dim * 4
+        if self.vectors_path.stat().st_size > expected:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(expected)
+
+    def _vectors(self) -> np.memmap:
+        if self._memmap is None or self._memmap.shape[0] < len(self._index):
+            self._memmap = np.memmap(
+                self.vectors_path,
+                dtype="float32",
+                mode="r",
+                shape=(len(self._index), self._dim),
+            )
+        return self._memmap
+
+    def get_many(self, hashes: list[str]) -> Dict[str, np.ndarray]:
+        with self._lock:
+            self._sync_index()
+            rows = {h: self._index[h] for h in hashes if h in self._index}
+            if not rows:
+                return {}
+            vectors = self._vectors()
+            return {h: np.array(vectors[row]) for h, row in rows.items()}
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        if not items:
+            return
+        with self._lock, self._file_lock():
+            self._sync_index()
+            new_items = {h: v for h, v in items.items() if h not in self._index}
+            if not new_items:
+                return
+            matrix = np.vstack(list(new_items.values())).astype("float32")
+            if self._dim is None:
+                self._dim = matrix.shape[1]
+                # Атомарно: другой процесс не должен увидеть недописанный файл
+                tmp_path = self.dim_path.with_suffix(".tmp")
+                tmp_path.write_text(str(self._dim))
+                os.replace(tmp_path, self.dim_path)
+            # Сначала векторы, потом индекс: строка индекса появляется только
+            # когда вектор уже на диске
+            with open(self.vectors_path, "ab") as f:
+                matrix.tofile(f)
+            with open(self.index_path, "a", encoding="ascii") as f:
+                f.write("".join(f"{h}\n" for h in new_items))
+            self._sync_index()
+
+
+class EmbeddingsService:
+    def __init__(
+        self,
+        embeddings,
+        model_name: str,
+        cache: Optional[EmbeddingsDiskCache] = None,
+        batch_size: int = EMBEDDINGS_BATCH_SIZE,
+        concurrency: int = EMBEDDINGS_CONCURRENCY,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def _hash(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\n{text}".encode("utf-8")).hexdigest()
+
+    async def _embed_batch(self, batch: list[str]) -> list[list[float]]:
+        async with self._semaphore:
+            return await self.embeddings.aembed_documents(batch)
+
+    async def aembed(self, texts: list[str]) -> np.ndarray:
+        """Возвращает матрицу эмбедингов float32 в порядке `texts`."""
+        unique = {self._hash(text): text for text in texts}
+        vectors: Dict[str, np.ndarray] = {}
+        if self.cache is not None:
+            vectors = await asyncio.to_thread(self.cache.get_many, list(unique))
+        missing = [(h, t) for h, t in unique.items() if h not in vectors]
+        if missing:
+            batches = [
+                missing[i : i + self.batch_size]
+                for i in range(0, len(missing), self.batch_size)
+            ]
+            results = await asyncio.gather(
+                *[self._embed_batch([t for _, t in batch]) for batch in batches]
+            )
+            fresh = {}
+            for batch, embs in zip(batches, results):
+                for (h, _), emb in zip(batch, embs):
+                    fresh[h] = np.asarray(emb, dtype="float32")
+            vectors.update(fresh)
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put_many, fresh)
+        logger.info(
+            "embeddings: %s текстов, %s уникальных, %s запрошено у API",
+            len(texts),
+            len(unique),
+            len(missing),
+        )
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        return np.vstack([vectors[self._hash(text)] for text in texts])
+
+
+_EMBEDDINGS_SERVICE: Optional[EmbeddingsService] = None
+
+
+def get_embeddings_service() -> EmbeddingsService:
+    global _EMBEDDINGS_SERVICE
+
+    if _EMBEDDINGS_SERVICE is not None:
+        return _EMBEDDINGS_SERVICE
+
+    model_name = os.getenv("GIGA_AGENT_EMBEDDINGS", "")
+    cache = None
+    if EMBEDDINGS_CACHE_DIR:
+        slug = re.sub(r"[^\w.-]+", "_", model_name)
+        cache = EmbeddingsDiskCache(os.path.join(EMBEDDINGS_CACHE_DIR, slug))
+    _EMBEDDINGS_SERVICE = EmbeddingsService(load_embeddings(), model_name, cache)
+    return _EMBEDDINGS_SERVICE
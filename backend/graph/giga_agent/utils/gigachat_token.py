@@ -0,0 +1,228 @@
+"""
+Кэширование access token'ов GigaChat и информации о квоте
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Optional
+
+import aiohttp
+
+from giga_agent.utils.env import load_project_env
+from giga_agent.utils.llm import gigachat_scope
+
+logger = logging.getLogger(__name__)
+
+load_project_env()
+
+AUTH_URL = os.getenv(
+    "GIGACHAT_AUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+)
+TOKEN_INFO_URL = os.getenv(
+    "GIGACHAT_TOKEN_INFO_URL", "https://gigachat.devices.sberbank.ru/api/v1/token"
+)
+# За сколько секунд до истечения токена обновлять его в фоне
+REFRESH_MARGIN = float(os.getenv("GIGACHAT_TOKEN_REFRESH_MARGIN", 120))
+# Сколько секунд считать информацию о квоте актуальной
+QUOTA_TTL = float(os.getenv("GIGACHAT_QUOTA_TTL", 60))
+# Фоновое обновление прекращается, если токен не запрашивали столько секунд
+TOKEN_IDLE_TTL = float(os.getenv("GIGACHAT_TOKEN_IDLE_TTL", 1800))
+
+
+class GigaChatTokenError(Exception):
+    pass
+
+
+class GigaChatTokenManager:
+    """
+    Хранит access token GigaChat и информацию о квоте:
+    - токен запрашивается один раз и переиспользуется до истечения;
+    - за `REFRESH_MARGIN` секунд до истечения токен обновляется фоновой задачей,
+      пока его запрашивали за последние `TOKEN_IDLE_TTL` секунд;
+    - одновременные запросы токена/квоты склеиваются в один поход в OAuth.
+    """
+
+    def __init__(self, credentials: str, scope: str):
+        self.credentials = credentials
+        self.scope = scope
+        self._access_token: Optional[str] = None
+        self._expires_at: float = 0.0  # unix time, секунды
+        self._quota: Optional[dict] = None
+        self._quota_fetched_at: float = 0.0
+        self._token_lock = asyncio.Lock()
+        self._quota_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._last_used: float = 0.0
+        # id исходного клиента -> (исходный клиент, копия с текущим токеном)
+        self._bound: Dict[int, tuple] = {}
+
+    def _is_token_fresh(self) -> bool:
+        return (
+            self._access_token is not None
+            and self._expires_at - time.time() > REFRESH_MARGIN / 2
+        )
+
+    async def aget_token(self) -> str:
+        """Возвращает актуальный access token, при необходимости обновляя его."""
+        self._last_used = time.time()
+        if self._is_token_fresh():
+            return self._access_token
+        async with self._token_lock:
+            # Пока ждали блокировку, токен мог обновить другой запрос
+            if not self._is_token_fresh():
+                await self._refresh()
+        return self._access_token
+
+    async def _refresh(self):
+        headers = {
+            "Authorization": f"Basic {self.credentials}",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "application/json",
+            "RqUID": str(uuid.uuid4()),
+        }
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                AUTH_URL, data={"scope": self.scope}, headers=headers, timeout=30.0
+            ) as resp:
+                if resp.status != 200:
+                    raise GigaChatTokenError(
+                        f"Ошибка авторизации: {resp.status} - {await resp.text()}"
+                    )
+                auth_response = await resp.json()
+        access_token = auth_response.get("access_token")
+        if not access_token:
+            raise GigaChatTokenError(
+                "Не удалось получить access token из ответа авторизации"
+            )
+        self._access_token = access_token
+        # expires_at приходит в миллисекундах
+        self._expires_at = auth_response.get("expires_at", 0) / 1000 or (
+            time.time() + 30 * 60
+        )
+        logger.info("🔑 GigaChat token обновлен, истекает в %s", self._expires_at)
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        if (
+            self._refresh_task is not None
+            and not self._refresh_task.done()
+            and self._refresh_task is not asyncio.current_task()
+        ):
+            self._refresh_task.cancel()
+        delay = max(self._expires_at - time.time() - REFRESH_MARGIN, 0)
+        self._refresh_task = asyncio.create_task(self._refresh_later(delay))
+
+    async def _refresh_later(self, delay: float):
+        await asyncio.sleep(delay)
+        if time.time() - self._last_used > TOKEN_IDLE_TTL:
+            # Токен никому не нужен: следующий запрос получит новый сам
+            logger.info("GigaChat token не используется, фоновое обновление остановлено")
+            return
+        try:
+            async with self._token_lock:
+                await self._refresh()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Не страшно: токен будет запрошен заново при следующем обращении
+            logger.exception("Не удалось обновить GigaChat token в фоне")
+
+    def invalidate(self):
+        """Сбрасывает токен, например после ответа 401."""
+        self._access_token = None
+        self._expires_at = 0.0
+        self._quota = None
+
+    async def aget_quota_info(self) -> dict:
+        """Возвращает информацию о квоте токенов, кэшированную на `QUOTA_TTL` секунд."""
+        if self._quota is not None and time.time() - self._quota_fetched_at < QUOTA_TTL:
+            return self._quota
+        async with self._quota_lock:
+            if (
+                self._quota is None
+                or time.time() - self._quota_fetched_at >= QUOTA_TTL
+            ):
+                token = await self.aget_token()
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(
+                        TOKEN_INFO_URL,
+                        headers={"Authorization": f"Bearer {token}"},
+                        timeout=30.0,
+                    ) as resp:
+                        if resp.status != 200:
+                            raise GigaChatTokenError(
+                                f"Ошибка получения информации о токенах: {resp.status} - {await resp.text()}"
+                            )
+                        self._quota = await resp.json()
+                self._quota_fetched_at = time.time()
+        return self._quota
+
+    async def format_token_info(self) -> str:
+        """Человекочитаемая информация о токенах для сообщений об ошибках."""
+        try:
+            token_data = await self.aget_quota_info()
+        except GigaChatTokenError as e:
+            return f"❌ {e}"
+        except Exception as e:
+            return f"❌ Ошибка при получении информации о токенах: {str(e)}"
+        return (
+            f"📊 **Информация о токенах:**\n"
+            f"• Лимит токенов: {token_data.get('token_limit', 'N/A')}\n"
+            f"• Использовано: {token_data.get('used_tokens', 'N/A')}\n"
+            f"• Остаток: {token_data.get('remaining_tokens', 'N/A')}"
+        )
+
+    async def abind(self, llm):
+        """
+        Возвращает копию клиента `langchain_gigachat` с кэшированным токеном
+        в публичном поле `access_token`, чтобы он не ходил в OAuth
+        самостоятельно. Копия пересоздается только при смене токена.
+        """
+        token = await self.aget_token()
+        if getattr(llm, "access_token", None) == token:
+            return llm
+        cached = self._bound.get(id(llm))
+        if cached is not None and cached[0] is llm and cached[1].access_token == token:
+            return cached[1]
+        # Новый экземпляр, а не model_copy: клиент SDK создается при первом
+        # обращении и в копию перенесся бы вместе со старым токеном
+        bound = type(llm)(**{**llm.model_dump(exclude_unset=True), "access_token": token})
+        self._bound[id(llm)] = (llm, bound)
+        return bound
+
+
+# Один менеджер на набор credentials
+_TOKEN_MANAGERS: Dict[str, GigaChatTokenManager] = {}
+
+
+def get_gigachat_token_manager(is_main: bool = False) -> Optional[GigaChatTokenManager]:
+    """
+    Возвращает общий менеджер токенов для основных (`MAIN_GIGACHAT_*`)
+    или обычных (`GIGACHAT_*`) credentials. `None`, если credentials не заданы.
+    """
+    prefix = "MAIN_" if is_main else ""
+    credentials = os.getenv(f"{prefix}GIGACHAT_CREDENTIALS")
+    if not credentials:
+        return None
+    if credentials not in _TOKEN_MANAGERS:
+        # Тот же scope, с которым load_llm создает клиент
+        _TOKEN_MANAGERS[credentials] = GigaChatTokenManager(
+            credentials, gigachat_scope(is_main)
+        )
+    return _TOKEN_MANAGERS[credentials]
+
+
+async def get_gigachat_token_info() -> str:
+    """Получение информации о токенах GigaChat через общий кэш"""
+    manager = get_gigachat_token_manager(is_main=True) or get_gigachat_token_manager()
+    if manager is None:
+        return "❌ Токен GigaChat не найден в переменных окружения. Проверьте переменные MAIN_GIGACHAT_CREDENTIALS или GIGACHAT_CREDENTIALS."
+    return await manager.format_token_info()
+
+
+def invalidate_gigachat_tokens():
+    """Сбрасывает все кэшированные токены (после ошибки авторизации)."""
+    for manager in _TOKEN_MANAGERS.values():
+        manager.invalidate()
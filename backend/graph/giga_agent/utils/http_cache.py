@@ -0,0 +1,141 @@
+"""
+HTTP-кэширование страниц и вложений tasks_app.
+
+Страницы `/html/{id}/` (презентации, лендинги, карты) не меняются после
+создания, а открывают их много раз, поэтому:
+- тело страницы держится в LRU процесса (`GIGA_AGENT_HTML_CACHE_MB`) сразу
+  в сжатых вариантах gzip / brotli (если установлен brotli), и повторный
+  запрос не ходит ни в store, ни на диск;
+- ETag — sha256 содержимого (у сжатых вариантов — с суффиксом кодировки),
+  `If-None-Match` отвечает 304 без тела.
+"""
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from giga_agent.utils import metrics
+from giga_agent.utils.env import load_project_env
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен
+    brotli = None
+
+load_project_env()
+
+HTML_CACHE_SIZE = int(float(os.getenv("GIGA_AGENT_HTML_CACHE_MB", 64)) * 1024 * 1024)
+# Меньше этого размера сжатие не дает выигрыша
+MIN_COMPRESS_SIZE = 1024
+
+
+def strong_etag(digest: str) -> str:
+    return f'"{digest}"'
+
+
+def content_etag(body: bytes) -> str:
+    return strong_etag(hashlib.sha256(body).hexdigest())
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Сравнение для If-None-Match: слабое, как требует RFC 9110."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag for candidate in header.split(",")
+    )
+
+
+def accepted_encodings(request: Request) -> dict:
+    codings = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            codings[name.strip().lower()] = q
+    return codings
+
+
+class CachedBody:
+    """Тело ответа с заранее сжатыми вариантами; строится в потоке (сжатие — CPU)."""
+
+    def __init__(self, body: bytes, media_type: str, etag: Optional[str] = None):
+        self.media_type = media_type
+        self.etag = etag or content_etag(body)
+        self.variants = {"identity": body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=9)
+        self.size = sum(len(variant) for variant in self.variants.values())
+
+    def select(self, request: Request) -> tuple[str, bytes]:
+        codings = accepted_encodings(request)
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and codings.get(encoding, 0) > 0:
+                return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+    def variant_etag(self, encoding: str) -> str:
+        """У каждого сжатого варианта свой ETag: `"<sha256>-gzip"`, `"<sha256>-br"`."""
+        if encoding == "identity":
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+    def response(self, request: Request, cache_control: str = "no-cache") -> Response:
+        encoding, body = self.select(request)
+        etag = self.variant_etag(encoding)
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if len(self.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            metrics.inc("http_not_modified")
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+class BodyLRU:
+    """LRU тел ответов с ограничением по суммарному размеру в байтах."""
+
+    def __init__(self, max_bytes: int = HTML_CACHE_SIZE, name: str = "html"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.size = 0
+        self._items: "OrderedDict[str, CachedBody]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        item = self._items.get(key)
+        if item is None:
+            metrics.inc("http_cache_miss", cache=self.name)
+            return None
+        self._items.move_to_end(key)
+        metrics.inc("http_cache_hit", cache=self.name)
+        return item
+
+    def put(self, key: str, item: CachedBody):
+        if item.size > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        self._items[key] = item
+        self.size += item.size
+        while self.size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= evicted.size
+
+    def stats(self) -> dict:
+        return {"items": len(self._items), "bytes": self.size, "max_bytes": self.max_bytes}
@@ -0,0 +1,549 @@
+"""
+Поиск блокировок event loop и спаны горячих путей графа и tool server.
+
+- `LoopMonitor` — пробная задача просыпается каждые `interval` секунд,
+  а сторожевой поток следит за ее опозданием. Если loop не отвечает дольше
+  `threshold`, поток снимает стек потока loop (`sys._current_frames`) — это
+  стек того синхронного вызова, который держит loop. Блокировки копятся по
+  местам вызова: ближайший к блокирующему вызову кадр кода giga_agent.
+- `span()` / `start_span()` — спаны узлов графа, инструментов, LLM и
+  HTTP-запросов. Длительность попадает в гистограмму `span_seconds`
+  (`giga_agent.utils.metrics`), а если установлен `opentelemetry`, —
+  еще и в настоящий спан OpenTelemetry (экспорт настраивается SDK как обычно).
+- `install_tracing()` включает спаны (GIGA_AGENT_TRACING): обработчик
+  колбэков LangChain добавляется ко всем запускам (узлы, LLM, инструменты),
+  а запросы httpx, aiohttp и requests оборачиваются спанами. Синхронный
+  HTTP-запрос из потока event loop дополнительно считается
+  в `sync_io_on_event_loop`.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import urlsplit
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+from langchain_core.utils.env import env_var_is_set
+
+from giga_agent.utils import metrics
+from giga_agent.utils.env import load_project_env
+
+logger = logging.getLogger(__name__)
+
+load_project_env()
+
+LOOP_MONITOR = os.getenv("GIGA_AGENT_LOOP_MONITOR", "1").lower() in ("1", "true")
+# Опоздание loop больше порога считается блокировкой (как slow_callback_duration asyncio)
+LOOP_BLOCK_THRESHOLD = float(os.getenv("GIGA_AGENT_LOOP_BLOCK_THRESHOLD", 0.1))
+LOOP_MONITOR_INTERVAL = float(os.getenv("GIGA_AGENT_LOOP_MONITOR_INTERVAL", 0.02))
+# Сколько кадров стека хранить для места блокировки
+STACK_DEPTH = 15
+TRACING_ENV = "GIGA_AGENT_TRACING"
+
+_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+
+
+# --- Блокировки event loop ---
+def _call_site(stack: traceback.StackSummary) -> tuple[str, str]:
+    """(место вызова в коде giga_agent, самый внутренний кадр) для снятого стека."""
+
+    def describe(frame: traceback.FrameSummary) -> str:
+        filename = frame.filename
+        if filename.startswith(_PACKAGE_DIR):
+            filename = os.path.relpath(filename, os.path.dirname(_PACKAGE_DIR))
+        return f"{filename}:{frame.lineno} in {frame.name}"
+
+    call = describe(stack[-1])
+    for frame in reversed(stack):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(_PACKAGE_DIR) and path != _THIS_FILE:
+            return describe(frame), call
+    return call, call
+
+
+class LoopMonitor:
+    """
+    Сторож event loop: находит блокировки дольше `threshold` и места,
+    где loop был застигнут в момент превышения порога.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        threshold: float = LOOP_BLOCK_THRESHOLD,
+        interval: float = LOOP_MONITOR_INTERVAL,
+    ):
+        self.service = service
+        self.threshold = threshold
+        self.interval = interval
+        self.sites: dict[str, dict] = {}
+        self.blocks = 0
+        self.blocked = 0.0
+        self.started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # Время, к которому пробная задача должна проснуться
+        self._expected = 0.0
+        # Стек, снятый сторожем во время текущей блокировки
+        self._pending: Optional[tuple] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._expected = time.monotonic() + self.interval
+        self.started_at = time.time()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(
+            target=self._watch, name=f"loop-monitor-{self.service}", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+
+    async def _heartbeat(self):
+        while True:
+            self._expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - self._expected
+            if lag >= self.threshold:
+                self._record(lag)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            expected = self._expected
+            if time.monotonic() - expected < self.threshold:
+                continue
+            with self._lock:
+                if self._pending is not None:
+                    continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame, limit=STACK_DEPTH)
+            del frame
+            # Пробная задача уже проснулась: в стеке она сама, а не блокировка
+            if (
+                self._expected != expected
+                or os.path.abspath(stack[-1].filename) == _THIS_FILE
+            ):
+                continue
+            site, call = _call_site(stack)
+            with self._lock:
+                self._pending = (site, call, "".join(stack.format()))
+
+    def _record(self, lag: float):
+        with self._lock:
+            # Блокировка короче периода сторожа может закончиться до снятия стека
+            site, call, stack = self._pending or ("неизвестно", "неизвестно", "")
+            self._pending = None
+            self.blocks += 1
+            self.blocked += lag
+            entry = self.sites.get(site)
+            if entry is None:
+                entry = self.sites[site] = {
+                    "site": site,
+                    "call": call,
+                    "blocks": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "stack": stack,
+                }
+            entry["blocks"] += 1
+            entry["total_ms"] += lag * 1000
+            if lag * 1000 >= entry["max_ms"]:
+                entry["max_ms"] = lag * 1000
+                entry["call"] = call
+                entry["stack"] = stack or entry["stack"]
+        metrics.observe("event_loop_block_seconds", lag, service=self.service)
+        logger.warning(
+            "Event loop %s заблокирован на %.0f мс: %s (%s)",
+            self.service,
+            lag * 1000,
+            site,
+            call,
+        )
+
+    def report(self, top: int = 20) -> dict:
+        with self._lock:
+            sites = sorted(
+                (dict(entry) for entry in self.sites.values()),
+                key=lambda entry: entry["total_ms"],
+                reverse=True,
+            )
+            blocks, blocked = self.blocks, self.blocked
+        return {
+            "service": self.service,
+            "threshold_ms": self.threshold * 1000,
+            "since": self.started_at,
+            "blocks": blocks,
+            "blocked_ms": blocked * 1000,
+            "sites": sites[:top],
+            "spans": top_spans(top),
+            "sync_io_on_event_loop": metrics.snapshot().get(
+                "sync_io_on_event_loop", []
+            ),
+        }
+
+    def reset(self):
+        with self._lock:
+            self.sites.clear()
+            self.blocks = 0
+            self.blocked = 0.0
+            self.started_at = time.time()
+
+
+_LOOP_MONITOR_SINGLETON: Optional[LoopMonitor] = None
+
+
+def get_loop_monitor() -> Optional[LoopMonitor]:
+    return _LOOP_MONITOR_SINGLETON
+
+
+def start_loop_monitor(service: str) -> Optional[LoopMonitor]:
+    """Запускает сторожа для текущего event loop (если GIGA_AGENT_LOOP_MONITOR включен)."""
+    global _LOOP_MONITOR_SINGLETON
+
+    if not LOOP_MONITOR:
+        return None
+    if _LOOP_MONITOR_SINGLETON is None:
+        _LOOP_MONITOR_SINGLETON = LoopMonitor(service)
+        _LOOP_MONITOR_SINGLETON.start()
+    return _LOOP_MONITOR_SINGLETON
+
+
+async def stop_loop_monitor():
+    global _LOOP_MONITOR_SINGLETON
+
+    if _LOOP_MONITOR_SINGLETON is not None:
+        await _LOOP_MONITOR_SINGLETON.stop()
+        _LOOP_MONITOR_SINGLETON = None
+
+
+def blocking_report(top: int = 20) -> dict:
+    """Отчет для `/blocking`: места блокировок и самые долгие спаны."""
+    monitor = get_loop_monitor()
+    if monitor is None:
+        return {"enabled": False, "spans": top_spans(top)}
+    return {"enabled": True, **monitor.report(top)}
+
+
+def top_spans(top: int = 20) -> list[dict]:
+    """Спаны с наибольшим суммарным временем (по гистограмме `span_seconds`)."""
+    spans = [
+        {
+            **item["labels"],
+            "count": item["count"],
+            "total_ms": item["sum"] * 1000,
+            "avg_ms": item["avg"] * 1000,
+            "max_ms": item["max"] * 1000,
+        }
+        for item in metrics.snapshot().get("span_seconds", [])
+    ]
+    spans.sort(key=lambda item: item["total_ms"], reverse=True)
+    return spans[:top]
+
+
+# --- Спаны ---
+def tracing_enabled() -> bool:
+    # Та же проверка, по которой LangChain добавляет SpanCallbackHandler
+    return env_var_is_set(TRACING_ENV)
+
+
+_OTEL_TRACER = None
+
+
+def _otel_tracer():
+    """Трейсер OpenTelemetry или None, если пакет не установлен."""
+    global _OTEL_TRACER
+
+    if _OTEL_TRACER is None:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            _OTEL_TRACER = False
+        else:
+            _OTEL_TRACER = trace.get_tracer("giga_agent")
+    return _OTEL_TRACER or None
+
+
+class Span:
+    """Спан: `kind` — node, tool, llm или http; `name` — узел, инструмент, модель, хост."""
+
+    __slots__ = ("kind", "name", "attributes", "started", "_otel")
+
+    def __init__(self, kind: str, name: str, parent=None, **attributes):
+        self.kind = kind
+        self.name = name
+        self.attributes = attributes
+        self.started = time.perf_counter()
+        self._otel = None
+        tracer = _otel_tracer()
+        if tracer is not None:
+            from opentelemetry import trace
+
+            context = (
+                trace.set_span_in_context(parent._otel)
+                if parent is not None and parent._otel is not None
+                else None
+            )
+            self._otel = tracer.start_span(
+                f"{kind} {name}",
+                context=context,
+                attributes={
+                    "giga.kind": kind,
+                    **{
+                        f"giga.{key}": value
+                        for key, value in attributes.items()
+                        if isinstance(value, (str, bool, int, float))
+                    },
+                },
+            )
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        if self._otel is not None:
+            for key, value in attributes.items():
+                if isinstance(value, (str, bool, int, float)):
+                    self._otel.set_attribute(f"giga.{key}", value)
+
+    def end(self, error: Optional[BaseException] = None):
+        duration = time.perf_counter() - self.started
+        metrics.observe("span_seconds", duration, kind=self.kind, span=self.name)
+        if error is not None:
+            metrics.inc("span_errors", kind=self.kind, span=self.name)
+        if self._otel is not None:
+            if error is not None:
+                from opentelemetry.trace import Status, StatusCode
+
+                self._otel.record_exception(error)
+                self._otel.set_status(Status(StatusCode.ERROR, str(error)))
+            self._otel.end()
+        return duration
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("giga_span", default=None)
+
+
+def start_span(kind: str, name: str, parent: Optional[Span] = None, **attributes):
+    """Начинает спан (или возвращает None, если спаны выключены); закрывается `end()`."""
+    if not tracing_enabled():
+        return None
+    return Span(kind, name, parent=parent or _current_span.get(), **attributes)
+
+
+@contextlib.contextmanager
+def span(kind: str, name: str, **attributes):
+    """Спан вокруг блока кода; работает и в синхронном, и в асинхронном коде."""
+    current = start_span(kind, name, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    else:
+        current.end()
+    finally:
+        _current_span.reset(token)
+
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    """Спаны узлов графа, вызовов LLM и инструментов из колбэков LangChain."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.spans: dict = {}
+
+    def _start(self, run_id, parent_run_id, kind: str, name: str, **attributes):
+        parent = self.spans.get(parent_run_id)
+        started = start_span(kind, name, parent=parent, **attributes)
+        if started is not None:
+            self.spans[run_id] = started
+
+    def _end(self, run_id, error: Optional[BaseException] = None, **attributes):
+        started = self.spans.pop(run_id, None)
+        if started is not None:
+            if attributes:
+                started.set(**attributes)
+            started.end(error=error)
+
+    def on_chain_start(
+        self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs
+    ):
+        # Запуск узла — цепочка с именем из `langgraph_node`
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        if node is not None and kwargs.get("name") == node:
+            self._start(
+                run_id,
+                parent_run_id,
+                "node",
+                node,
+                step=metadata.get("langgraph_step"),
+                thread_id=metadata.get("thread_id"),
+            )
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        # interrupt() завершает узел исключением GraphInterrupt — это не ошибка
+        if type(error).__name__ in ("GraphInterrupt", "ParentCommand"):
+            self._end(run_id)
+        else:
+            self._end(run_id, error=error)
+
+    def _start_llm(self, serialized, run_id, parent_run_id, metadata, kwargs):
+        metadata = metadata or {}
+        name = (
+            metadata.get("ls_model_name")
+            or kwargs.get("name")
+            or (serialized or {}).get("name")
+            or "llm"
+        )
+        self._start(run_id, parent_run_id, "llm", name)
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs
+    ):
+        self._start_llm(serialized, run_id, parent_run_id, metadata, kwargs)
+
+    def on_llm_start(
+        self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs
+    ):
+        self._start_llm(serialized, run_id, parent_run_id, metadata, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if not isinstance(usage, dict):
+            usage = getattr(usage, "__dict__", {})
+        self._end(
+            run_id,
+            **{
+                key: value
+                for key, value in usage.items()
+                if key in ("prompt_tokens", "completion_tokens", "total_tokens")
+            },
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_tool_start(
+        self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs
+    ):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self._start(run_id, parent_run_id, "tool", name)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+
+# Обработчик добавляется к каждому запуску LangChain, пока выставлен GIGA_AGENT_TRACING
+_span_handler_var: ContextVar[Optional[SpanCallbackHandler]] = ContextVar(
+    "giga_span_handler", default=None
+)
+register_configure_hook(
+    _span_handler_var, True, handle_class=SpanCallbackHandler, env_var=TRACING_ENV
+)
+
+
+# --- HTTP ---
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _http_span(method: str, url, sync: bool):
+    host = urlsplit(str(url)).netloc or "unknown"
+    blocking = sync and _on_event_loop()
+    if blocking:
+        metrics.inc("sync_io_on_event_loop", kind="http", host=host)
+    return span("http", host, method=method, blocking=blocking)
+
+
+_patched_http = False
+
+
+def _patch_http_clients():
+    global _patched_http
+
+    if _patched_http:
+        return
+    _patched_http = True
+
+    import httpx
+
+    original_send = httpx.Client.send
+    original_async_send = httpx.AsyncClient.send
+
+    def send(self, request, *args, **kwargs):
+        with _http_span(request.method, request.url, sync=True):
+            return original_send(self, request, *args, **kwargs)
+
+    async def async_send(self, request, *args, **kwargs):
+        with _http_span(request.method, request.url, sync=False):
+            return await original_async_send(self, request, *args, **kwargs)
+
+    httpx.Client.send = send
+    httpx.AsyncClient.send = async_send
+
+    try:
+        import aiohttp
+    except ImportError:
+        pass
+    else:
+        original_request = aiohttp.ClientSession._request
+
+        async def aiohttp_request(self, method, str_or_url, *args, **kwargs):
+            with _http_span(method, str_or_url, sync=False):
+                return await original_request(self, method, str_or_url, *args, **kwargs)
+
+        aiohttp.ClientSession._request = aiohttp_request
+
+    try:
+        import requests
+    except ImportError:
+        pass
+    else:
+        original_requests = requests.Session.request
+
+        def requests_request(self, method, url, *args, **kwargs):
+            with _http_span(method, url, sync=True):
+                return original_requests(self, method, url, *args, **kwargs)
+
+        requests.Session.request = requests_request
+
+
+def install_tracing():
+    """Включает спаны HTTP-клиентов; спаны LangChain включаются самим GIGA_AGENT_TRACING."""
+    if tracing_enabled():
+        _patch_http_clients()
@@ -3,6 +3,11 @@ import asyncio
 import aiohttp
 from pydantic import BaseModel
 
+from giga_agent.utils.deadline import deadline_headers, remaining
+
+# Прежний фиксированный лимит; при дедлайне запуска берется остаток времени
+JUPYTER_TIMEOUT = 60.0
+
 
 class KernelNotFoundException(Exception):
     pass
@@ -11,12 +16,18 @@ class KernelNotFoundException(Exception):
 class JupyterClient(BaseModel):
     base_url: str
 
-    async def execute(self, kernel_id, code):
+    async def execute(self, kernel_id, code, timeout=None):
+        """`timeout` — бюджет ячейки в секундах (REPL ограничивает его своим лимитом)."""
+        payload = {"kernel_id": kernel_id, "script": code}
+        if timeout is not None:
+            payload["timeout"] = timeout
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 f"{self.base_url}/code",
-                json={"kernel_id": kernel_id, "script": code},
-                timeout=60.0,
+                json=payload,
+                headers=deadline_headers(),
+                # Ячейка может ждать очереди ядра и выполняться весь свой бюджет
+                timeout=remaining(max(JUPYTER_TIMEOUT, (timeout or 0) + 30)),
             ) as res:
                 if res.status == 200:
                     data = await res.json()
@@ -26,6 +37,43 @@ class JupyterClient(BaseModel):
                 else:
                     raise Exception(f"Error {res.status}: {res.reason}")
 
+    async def submit_job(self, kernel_id, code, timeout=None):
+        """Запускает ячейку фоновой задачей, возвращает описание задачи с `job_id`."""
+        payload = {"kernel_id": kernel_id, "script": code, "mode": "background"}
+        if timeout is not None:
+            payload["timeout"] = timeout
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{self.base_url}/code", json=payload, timeout=JUPYTER_TIMEOUT
+            ) as res:
+                if res.status == 200:
+                    return await res.json()
+                raise Exception(f"Error {res.status}: {res.reason}")
+
+    async def get_job(self, job_id):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f"{self.base_url}/jobs/{job_id}", timeout=JUPYTER_TIMEOUT
+            ) as res:
+                if res.status == 200:
+                    return await res.json()
+                raise Exception(f"Error {res.status}: {res.reason}")
+
+    async def bootstrap(self, kernel_id, version, code):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{self.base_url}/bootstrap",
+                json={"kernel_id": kernel_id, "version": version, "script": code},
+                headers=deadline_headers(),
+                timeout=remaining(JUPYTER_TIMEOUT),
+            ) as res:
+                if res.status == 200:
+                    return await res.json()
+                elif res.status == 404:
+                    raise KernelNotFoundException()
+                else:
+                    raise Exception(f"Error {res.status}: {res.reason}")
+
     async def start_kernel(self):
         async with aiohttp.ClientSession() as session:
             async with session.post(
@@ -307,9 +307,22 @@ def load_gigachat(tag: str = None, is_main: bool = False):
 
 
 def load_gigachat_embeddings():
-    """Заглушка для embeddings - пока не реализовано"""
-    # TODO: Реализовать embeddings через OpenAI API если нужно
-    raise NotImplementedError("Embeddings через OpenAI API пока не реализованы")
+    """Загружает эмбединги GigaChat"""
+    from langchain_gigachat import GigaChatEmbeddings
+
+    emb_str = os.getenv("GIGA_AGENT_EMBEDDINGS")
+    return GigaChatEmbeddings(
+        model=emb_str[len(GIGACHAT_PROVIDER):],
+        credentials=os.getenv("GIGACHAT_CREDENTIALS"),
+        scope=gigachat_scope(),
+        verify_ssl_certs=False,
+    )
+
+
+def gigachat_scope(is_main: bool = False) -> str:
+    """Scope GigaChat для основных (`MAIN_GIGACHAT_SCOPE`) или обычных credentials."""
+    prefix = "MAIN_" if is_main else ""
+    return os.getenv(f"{prefix}GIGACHAT_SCOPE") or "GIGACHAT_API_PERS"
 
 
 def is_llm_gigachat(tag: str = None):
@@ -341,7 +354,7 @@ def load_llm(tag: str = None, is_main: bool = False):
             llm = ChatGigaChat(
                 model=llm_str[len(GIGACHAT_PROVIDER):],
                 credentials=os.getenv("MAIN_GIGACHAT_CREDENTIALS" if is_main else "GIGACHAT_CREDENTIALS"),
-                scope="GIGACHAT_API_PERS",
+                scope=gigachat_scope(is_main),
                 verify_ssl_certs=False
             )
         except ImportError:
@@ -0,0 +1,387 @@
+"""
+Кэш ответов LLM для "быстрых" вспомогательных вызовов (summarize, ask, lean canvas).
+
+Два уровня:
+- точное совпадение по нормализованному промпту + модели + параметрам;
+- (опционально) семантический поиск по эмбедингам промпта из `load_embeddings()`.
+  Похожий промпт ищется только среди ответов того же места вызова и того же
+  владельца данных (`scope`: поток графа, ядро REPL), иначе похожий запрос
+  одного пользователя получил бы ответ, собранный из данных другого.
+  Без `scope` семантический уровень не используется.
+
+Хранилище задается `GIGA_AGENT_LLM_CACHE`:
+- пусто / `off` — кэш выключен;
+- `sqlite:///path/to/cache.db` — SQLite;
+- `redis://host:port/db` — Redis.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from langchain_core.messages import AIMessage, BaseMessage
+
+from giga_agent.utils import metrics
+from giga_agent.utils.env import load_project_env
+
+logger = logging.getLogger(__name__)
+
+load_project_env()
+
+LLM_CACHE = os.getenv("GIGA_AGENT_LLM_CACHE", "")
+LLM_CACHE_TTL = float(os.getenv("GIGA_AGENT_LLM_CACHE_TTL", 24 * 60 * 60))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("GIGA_AGENT_LLM_CACHE_MAX_ENTRIES", 10000))
+# Порог косинусной близости для семантического уровня, 0 — уровень выключен
+LLM_CACHE_SIMILARITY = float(os.getenv("GIGA_AGENT_LLM_CACHE_SIMILARITY", 0))
+
+_WHITESPACE_REGEX = re.compile(r"\s+")
+# Владелец данных текущего вызова, если место вызова не передало scope явно
+_scope: ContextVar[Optional[str]] = ContextVar("llm_cache_scope", default=None)
+
+
+@contextlib.contextmanager
+def cache_scope(scope: Optional[str]):
+    """Задает `scope` для вызовов `cached_ainvoke` внутри блока."""
+    token = _scope.set(scope)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def normalize_prompt(messages) -> str:
+    """Приводит список сообщений к канонической строке для ключа кэша."""
+    if isinstance(messages, str):
+        messages = [("human", messages)]
+    parts = []
+    for message in messages:
+        if isinstance(message, BaseMessage):
+            role, content = message.type, message.content
+        elif isinstance(message, (tuple, list)):
+            role, content = message
+        else:
+            role, content = "human", message
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False, sort_keys=True)
+        content = _WHITESPACE_REGEX.sub(" ", content).strip()
+        parts.append(f"{role}: {content}")
+    return "\n".join(parts)
+
+
+# Поля моделей с секретами; параметры генерации (`max_tokens` и т.п.) остаются в ключе
+SECRET_PARAMS = frozenset(
+    (
+        "credentials",
+        "access_token",
+        "password",
+        "user",
+        "api_key",
+        "openai_api_key",
+        "key_file",
+        "key_file_password",
+        "cert_file",
+        "ca_bundle_file",
+    )
+)
+
+
+def llm_identity(llm) -> str:
+    """Модель и параметры генерации `llm` (в т.ч. привязанные через `bind`)."""
+    bound_kwargs = {}
+    while hasattr(llm, "bound"):
+        bound_kwargs = {**getattr(llm, "kwargs", {}), **bound_kwargs}
+        llm = llm.bound
+    try:
+        params = dict(llm._identifying_params)
+    except Exception:
+        params = {"model": getattr(llm, "model_name", None) or getattr(llm, "model", None)}
+    params.update(bound_kwargs)
+    # Креды и прочие секреты не должны попадать в ключ
+    params = {k: v for k, v in params.items() if k not in SECRET_PARAMS}
+    return json.dumps(params, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def make_key(prompt: str, identity: str) -> str:
+    return hashlib.sha256(f"{identity}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+def _cosine_best(query: np.ndarray, candidates: list[tuple[str, bytes]]):
+    if not candidates:
+        return None, 0.0
+    matrix = np.vstack([np.frombuffer(emb, dtype="float32") for _, emb in candidates])
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+    scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+    idx = int(np.argmax(scores))
+    return candidates[idx][0], float(scores[idx])
+
+
+class SQLiteCacheBackend:
+    """Синхронный SQLite-бэкенд, вызывается через `asyncio.to_thread`."""
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                response TEXT NOT NULL,
+                embedding BLOB,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_ns ON llm_cache (namespace)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def nearest(self, namespace: str, embedding: np.ndarray, threshold: float):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT response, embedding FROM llm_cache "
+                "WHERE namespace = ? AND embedding IS NOT NULL AND created_at > ?",
+                (namespace, time.time() - self.ttl),
+            ).fetchall()
+        response, score = _cosine_best(embedding, rows)
+        return response if score >= threshold else None
+
+    def put(self, key: str, namespace: str, response: str, embedding: Optional[bytes]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, response, embedding, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,)
+            )
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+
+class RedisCacheBackend:
+    """Redis-бэкенд: ответы с TTL + ZSET для LRU-вытеснения + HASH эмбедингов."""
+
+    PREFIX = "giga_agent:llm_cache"
+
+    def __init__(self, url: str, ttl: float, max_entries: int):
+        import redis.asyncio as redis
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[str]:
+        response = await self._redis.get(f"{self.PREFIX}:{key}")
+        if response is None:
+            return None
+        await self._redis.zadd(f"{self.PREFIX}:lru", {key: time.time()})
+        return response.decode("utf-8")
+
+    async def nearest(self, namespace: str, embedding: np.ndarray, threshold: float):
+        items = await self._redis.hgetall(f"{self.PREFIX}:emb:{namespace}")
+        if not items:
+            return None
+        key, score = _cosine_best(
+            embedding, [(k.decode(), v) for k, v in items.items()]
+        )
+        if score < threshold:
+            return None
+        response = await self.get(key)
+        if response is None:
+            # Ответ уже истек — чистим эмбединг
+            await self._redis.hdel(f"{self.PREFIX}:emb:{namespace}", key)
+            await self._redis.hdel(f"{self.PREFIX}:ns", key)
+        return response
+
+    async def put(self, key: str, namespace: str, response: str, embedding: Optional[bytes]):
+        pipe = self._redis.pipeline()
+        pipe.set(f"{self.PREFIX}:{key}", response, ex=int(self.ttl))
+        pipe.zadd(f"{self.PREFIX}:lru", {key: time.time()})
+        if embedding is not None:
+            pipe.hset(f"{self.PREFIX}:emb:{namespace}", key, embedding)
+            # По этому хэшу вытеснение находит эмбединг ключа
+            pipe.hset(f"{self.PREFIX}:ns", key, namespace)
+        await pipe.execute()
+        overflow = await self._redis.zcard(f"{self.PREFIX}:lru") - self.max_entries
+        if overflow > 0:
+            stale = await self._redis.zrange(f"{self.PREFIX}:lru", 0, overflow - 1)
+            if stale:
+                namespaces = await self._redis.hmget(f"{self.PREFIX}:ns", stale)
+                pipe = self._redis.pipeline()
+                pipe.delete(*[f"{self.PREFIX}:{k.decode()}" for k in stale])
+                pipe.zrem(f"{self.PREFIX}:lru", *stale)
+                for k, ns in zip(stale, namespaces):
+                    if ns is not None:
+                        pipe.hdel(f"{self.PREFIX}:emb:{ns.decode()}", k)
+                pipe.hdel(f"{self.PREFIX}:ns", *stale)
+                await pipe.execute()
+
+
+class LLMResponseCache:
+    def __init__(self, backend, similarity: float = 0.0):
+        self.backend = backend
+        self.similarity = similarity
+
+    async def _embed(self, prompt: str) -> Optional[np.ndarray]:
+        if not self.similarity:
+            return None
+        from giga_agent.utils.llm import load_embeddings
+
+        try:
+            vector = await load_embeddings().aembed_query(prompt)
+        except Exception:
+            logger.exception("Не удалось получить эмбединг промпта для кэша")
+            return None
+        return np.asarray(vector, dtype="float32")
+
+    async def _backend(self, name: str, *args):
+        method = getattr(self.backend, name)
+        if asyncio.iscoroutinefunction(method):
+            return await method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    async def ainvoke(
+        self, llm, messages, *, site: str, scope: Optional[str] = None, config=None
+    ):
+        """Возвращает ответ `llm` из кэша или вызывает модель и сохраняет ответ."""
+        prompt = normalize_prompt(messages)
+        identity = llm_identity(llm)
+        key = make_key(prompt, identity)
+        namespace = hashlib.sha256(
+            f"{site}\n{scope}\n{identity}".encode("utf-8")
+        ).hexdigest()[:16]
+
+        response = await self._backend("get", key)
+        if response is not None:
+            metrics.inc("llm_cache_requests", site=site, result="hit_exact")
+            return AIMessage(content=response)
+
+        embedding = await self._embed(prompt) if scope is not None else None
+        if embedding is not None:
+            response = await self._backend(
+                "nearest", namespace, embedding, self.similarity
+            )
+            if response is not None:
+                metrics.inc("llm_cache_requests", site=site, result="hit_semantic")
+                return AIMessage(content=response)
+
+        metrics.inc("llm_cache_requests", site=site, result="miss")
+        message = await _ainvoke(llm, messages, config)
+        if isinstance(message.content, str) and message.content:
+            await self._backend(
+                "put",
+                key,
+                namespace,
+                message.content,
+                embedding.tobytes() if embedding is not None else None,
+            )
+        return message
+
+
+_LLM_CACHE_SINGLETON: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Кэш ответов LLM согласно `GIGA_AGENT_LLM_CACHE` или `None`, если он выключен."""
+    global _LLM_CACHE_SINGLETON
+
+    if _LLM_CACHE_SINGLETON is not None:
+        return _LLM_CACHE_SINGLETON
+    if not LLM_CACHE or LLM_CACHE.lower() == "off":
+        return None
+    if LLM_CACHE.startswith("sqlite:///"):
+        backend = SQLiteCacheBackend(
+            LLM_CACHE[len("sqlite:///") :], LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES
+        )
+    elif LLM_CACHE.startswith(("redis://", "rediss://")):
+        backend = RedisCacheBackend(LLM_CACHE, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES)
+    else:
+        raise RuntimeError(
+            f"Неизвестное хранилище GIGA_AGENT_LLM_CACHE: {LLM_CACHE}. "
+            "Используйте sqlite:///path или redis://host:port"
+        )
+    _LLM_CACHE_SINGLETON = LLMResponseCache(backend, similarity=LLM_CACHE_SIMILARITY)
+    return _LLM_CACHE_SINGLETON
+
+
+async def _ainvoke(llm, messages, config=None):
+    # У OpenAIGigaChatWrapper нет ainvoke: синхронный вызов уводим в поток
+    if not hasattr(llm, "ainvoke"):
+        return await asyncio.to_thread(llm.invoke, messages)
+    return await llm.ainvoke(messages, config=config)
+
+
+async def cached_ainvoke(
+    llm, messages, *, site: str, scope: Optional[str] = None, config=None
+):
+    """
+    `llm.ainvoke(messages)` через кэш ответов.
+    `site` — имя места вызова, по нему считается hit-rate.
+    `scope` — владелец данных в промпте (по умолчанию из `cache_scope`).
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return await _ainvoke(llm, messages, config)
+    if scope is None:
+        scope = _scope.get()
+    return await cache.ainvoke(llm, messages, site=site, scope=scope, config=config)
+
+
+def get_cache_stats() -> dict:
+    """Hit-rate кэша по местам вызова."""
+    stats = {}
+    for item in metrics.snapshot().get("llm_cache_requests", []):
+        site = item["labels"]["site"]
+        site_stats = stats.setdefault(
+            site, {"hit_exact": 0, "hit_semantic": 0, "miss": 0}
+        )
+        site_stats[item["labels"]["result"]] += item["value"]
+    for site_stats in stats.values():
+        total = sum(site_stats.values())
+        site_stats["hit_rate"] = (
+            (site_stats["hit_exact"] + site_stats["hit_semantic"]) / total
+            if total
+            else 0.0
+        )
+    return stats
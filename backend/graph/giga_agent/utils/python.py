@@ -1,14 +1,29 @@
-import copy
+import hashlib
 import os
 
 from giga_agent.config import REPL_TOOLS
 
+# Поля состояния, которые нужны инструментам, вызываемым из ядра
+KERNEL_CONTEXT_KEYS = ("kernel_id", "file_ids")
 
-def prepend_code(code: str, state: dict):
-    state = copy.deepcopy(state)
-    state.pop("messages")
+
+def build_kernel_context(state: dict) -> dict:
+    return {key: state[key] for key in KERNEL_CONTEXT_KEYS if key in state}
+
+
+def kernel_bootstrap_version(code: str) -> str:
+    """Версия bootstrap меняется вместе с каталогом инструментов, контекстом ядра и шаблоном."""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()[:16]
+
+
+def kernel_bootstrap_code(context: dict, tools: list) -> str:
+    """
+    Код, который один раз выполняется в ядре: импорты по умолчанию,
+    ToolClient и заглушки для всех инструментов. Ячейки с кодом модели
+    после этого выполняются как есть.
+    """
     tools_code = []
-    for tool in state["tools"]:
+    for tool in tools:
         tools_code.append(
             f"""
 @tool_client.call_tool
@@ -25,13 +40,16 @@ def {tool.__name__}(**kwargs):
 """
         )
     tool_url = os.getenv("TOOL_CLIENT_API", "http://127.0.0.1:8811")
-    state.pop("tools")
     prepend = f"""import importlib
 importlib.invalidate_caches()
+import asyncio
 import pandas as pd
 import numpy as np
 import datetime
 from app.tool_client import ToolClient
+from app.datasets import read_dataset
 tool_client = ToolClient(base_url='{tool_url}')
-tool_client.set_state({repr(state)})"""
-    return prepend + "\n\n".join(tools_code) + code
+tool_client.set_state({repr(context)})
+batch_call = tool_client.batch_call
+abatch_call = tool_client.abatch_call"""
+    return prepend + "\n\n".join(tools_code)
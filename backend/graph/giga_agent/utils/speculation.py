@@ -0,0 +1,115 @@
+"""
+Спекулятивное выполнение инструментов только для чтения.
+
+Пока пользователь подтверждает вызов, инструмент уже выполняется в фоне,
+результат хранится в буфере по ключу (thread_id, tool_call_id):
+- при подтверждении результат забирается из буфера;
+- при отказе задача отменяется, результат выбрасывается.
+
+Узел графа после `interrupt` выполняется заново, поэтому запуск идемпотентен:
+повторный вызов `start` с тем же ключом возвращает уже запущенную задачу.
+Побочные эффекты (запись в ядро, в store) делаются только после подтверждения.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from giga_agent.utils import metrics
+from giga_agent.utils.env import load_project_env
+
+logger = logging.getLogger(__name__)
+
+load_project_env()
+
+DEFAULT_SPECULATIVE_TOOLS = (
+    "search,weather,get_urls,"
+    "get_workflow_runs,list_pull_requests,get_pull_request,"
+    "vk_get_posts,vk_get_comments,vk_get_last_comments"
+)
+# Пустое значение выключает спекулятивное выполнение
+SPECULATIVE_TOOLS = {
+    name.strip()
+    for name in os.getenv(
+        "GIGA_AGENT_SPECULATIVE_TOOLS", DEFAULT_SPECULATIVE_TOOLS
+    ).split(",")
+    if name.strip()
+}
+# Сколько секунд результат ждет подтверждения пользователя
+SPECULATION_TTL = float(os.getenv("GIGA_AGENT_SPECULATION_TTL", 600))
+
+SpeculationKey = Tuple[str, str]
+
+
+def is_speculative(tool_name: Optional[str]) -> bool:
+    return tool_name in SPECULATIVE_TOOLS
+
+
+def speculation_key(config: Optional[dict], tool_call_id: Optional[str]):
+    """Ключ буфера или None, если у запуска нет thread_id или у вызова нет id."""
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    if not thread_id or not tool_call_id:
+        return None
+    return str(thread_id), tool_call_id
+
+
+class SpeculationBuffer:
+    def __init__(self, ttl: float = SPECULATION_TTL):
+        self.ttl = ttl
+        self._tasks: Dict[SpeculationKey, Tuple[asyncio.Task, float]] = {}
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key, (task, started_at) in list(self._tasks.items()):
+            if now - started_at > self.ttl:
+                self._discard(key, "expired")
+
+    def _discard(self, key: SpeculationKey, result: str):
+        item = self._tasks.pop(key, None)
+        if item is None:
+            return
+        task, _ = item
+        if task.done():
+            # Забираем исключение, чтобы asyncio не ругался на непрочитанную ошибку
+            if not task.cancelled():
+                task.exception()
+        else:
+            task.cancel()
+        metrics.inc("tool_speculation", result=result)
+
+    def start(
+        self, key: SpeculationKey, factory: Callable[[], Awaitable]
+    ) -> asyncio.Task:
+        self._evict_expired()
+        if key in self._tasks:
+            return self._tasks[key][0]
+        task = asyncio.create_task(factory())
+        self._tasks[key] = (task, time.monotonic())
+        metrics.inc("tool_speculation", result="started")
+        logger.info("Спекулятивный запуск инструмента: %s", key)
+        return task
+
+    def pop(self, key: SpeculationKey) -> Optional[asyncio.Task]:
+        """Забирает задачу при подтверждении; None — результата в буфере нет."""
+        self._evict_expired()
+        item = self._tasks.pop(key, None)
+        if item is not None and item[0].cancelled():
+            item = None
+        metrics.inc("tool_speculation", result="hit" if item else "miss")
+        return item[0] if item else None
+
+    def discard(self, key: SpeculationKey):
+        """Отменяет задачу при отказе пользователя."""
+        self._discard(key, "discarded")
+
+
+_SPECULATION_BUFFER: Optional[SpeculationBuffer] = None
+
+
+def get_speculation_buffer() -> SpeculationBuffer:
+    global _SPECULATION_BUFFER
+
+    if _SPECULATION_BUFFER is None:
+        _SPECULATION_BUFFER = SpeculationBuffer()
+    return _SPECULATION_BUFFER
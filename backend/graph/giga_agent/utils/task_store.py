@@ -0,0 +1,315 @@
+"""
+Хранилище демо-задач tasks_app (SQLite).
+
+- SQLite в режиме WAL (`synchronous=NORMAL`): чтение списка не блокирует
+  запись, а коммит не ждет fsync всего файла; соединения берутся из пула.
+- Список отдается страницами по ключу `(sorting, id)` (`after` — курсор
+  последней полученной задачи), без OFFSET.
+- `sorting` — дробный индекс: перестановка задачи меняет одну строку
+  (новое значение — середина между соседями), перенумерация всех задач
+  нужна, только когда зазор между соседями исчерпан.
+- `json_data` хранится строкой и не разбирается при выдаче списка: строка
+  вставляется в ответ как есть, разбор — по требованию (`TaskRow.data`).
+- `dump.json` импортируется одной транзакцией.
+"""
+import asyncio
+import json
+import os
+from typing import Iterable, Optional
+from uuid import uuid4
+
+from sqlalchemy import event, insert, update
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import Field, SQLModel, func, or_, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from giga_agent.utils.env import load_project_env
+
+load_project_env()
+
+TASKS_DB = os.getenv("GIGA_AGENT_TASKS_DB", "db/tasks.db")
+TASKS_DB_POOL_SIZE = int(os.getenv("GIGA_AGENT_TASKS_DB_POOL_SIZE", 5))
+TASKS_DB_ECHO = os.getenv("GIGA_AGENT_TASKS_DB_ECHO", "").lower() in ("1", "true")
+DUMP_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "dump.json")
+# Меньше этого зазора между соседями середину не берем, а перенумеровываем
+MIN_SORTING_GAP = 1e-6
+
+
+# --- Модель данных ---
+class Task(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
+    json_data: str = Field(default_factory=lambda: str("{}"))
+    steps: int = Field(default=10, nullable=False)
+    # Дробный индекс; в старых базах колонка INTEGER, SQLite хранит в ней и REAL
+    sorting: float = Field(default=None, nullable=False, index=True)
+    active: bool = Field(default=False, nullable=False)
+
+
+_COLUMNS = (Task.id, Task.json_data, Task.steps, Task.sorting, Task.active)
+
+
+class TaskRow:
+    """Строка списка задач; `json_data` разбирается только при обращении к `data`."""
+
+    __slots__ = ("id", "json_data", "steps", "sorting", "active", "_data")
+
+    def __init__(self, id: str, json_data: str, steps: int, sorting, active: bool):
+        self.id = id
+        self.json_data = json_data or "{}"
+        self.steps = steps
+        self.sorting = sorting
+        self.active = bool(active)
+        self._data = None
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = json.loads(self.json_data)
+        return self._data
+
+    @property
+    def cursor(self) -> str:
+        return f"{self.sorting}:{self.id}"
+
+    def to_json(self) -> str:
+        # json_data уже валидный JSON: вставляем его без разбора и сериализации
+        return (
+            f'{{"id":{json.dumps(self.id)},"json_data":{self.json_data},'
+            f'"steps":{int(self.steps)},"sorting":{json.dumps(self.sorting)},'
+            f'"active":{"true" if self.active else "false"}}}'
+        )
+
+
+def parse_cursor(cursor: str) -> tuple[float, str]:
+    sorting, _, task_id = cursor.partition(":")
+    return float(sorting), task_id
+
+
+def rows_to_json(rows: Iterable[TaskRow]) -> str:
+    return "[" + ",".join(row.to_json() for row in rows) + "]"
+
+
+class TaskStore:
+    def __init__(self, path: str = TASKS_DB, pool_size: int = TASKS_DB_POOL_SIZE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.engine: AsyncEngine = create_async_engine(
+            f"sqlite+aiosqlite:///{path}",
+            echo=TASKS_DB_ECHO,
+            pool_size=pool_size,
+            connect_args={"check_same_thread": False},
+        )
+        event.listen(self.engine.sync_engine, "connect", self._configure_connection)
+        self.session = sessionmaker(
+            bind=self.engine, class_=AsyncSession, expire_on_commit=False
+        )
+
+    @staticmethod
+    def _configure_connection(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+    async def init(self, dump_path: Optional[str] = DUMP_PATH):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all, tables=[Task.__table__])
+        async with self.session() as session:
+            result = await session.execute(select(func.count()).select_from(Task))
+            count_tasks = result.scalar_one()
+        # Если таблица Task пуста, подгружаем JSON-дамп
+        if count_tasks == 0 and dump_path:
+            if os.path.exists(dump_path):
+                with open(dump_path, "r", encoding="utf-8") as f:
+                    data_list = await asyncio.to_thread(json.load, fp=f)
+                await self.bulk_import(data_list)
+            else:
+                print(f"Файл {dump_path} не найден, пропускаем загрузку")
+
+    async def close(self):
+        await self.engine.dispose()
+
+    async def bulk_import(self, items: list[dict]) -> int:
+        """Добавляет задачи из дампа одной транзакцией (executemany)."""
+        async with self.session() as session:
+            next_sorting = await self._max_sorting(session) + 1
+            rows = []
+            for item in items:
+                sorting = item.get("sorting")
+                if sorting is None:
+                    sorting = next_sorting
+                next_sorting = max(next_sorting, sorting) + 1
+                rows.append(
+                    {
+                        # Если в JSON не указан id, сгенерируем новый
+                        "id": item.get("id") or str(uuid4()),
+                        "json_data": json.dumps(
+                            item.get("json_data", {}), ensure_ascii=False
+                        ),
+                        "steps": item.get("steps", 10),
+                        "sorting": sorting,
+                        "active": item.get("active", False),
+                    }
+                )
+            if rows:
+                await session.execute(insert(Task), rows)
+                await session.commit()
+            return len(rows)
+
+    @staticmethod
+    async def _max_sorting(session: AsyncSession) -> float:
+        # max по индексированной колонке — один проход по B-дереву
+        result = await session.execute(select(func.max(Task.sorting)))
+        return result.scalar_one_or_none() or 0
+
+    async def create(self, json_data: dict) -> Task:
+        async with self.session() as session:
+            task = Task(json_data=json.dumps(json_data, ensure_ascii=False))
+            task.sorting = await self._max_sorting(session) + 1
+            session.add(task)
+            await session.commit()
+            await session.refresh(task)
+            return task
+
+    async def list(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        active: Optional[bool] = None,
+    ) -> list[TaskRow]:
+        query = select(*_COLUMNS).order_by(Task.sorting, Task.id)
+        if after:
+            sorting, task_id = parse_cursor(after)
+            # `sorting >= ...` отдельным условием, чтобы SQLite взял диапазон индекса
+            query = query.where(
+                Task.sorting >= sorting,
+                or_(Task.sorting > sorting, Task.id > task_id),
+            )
+        if active is not None:
+            query = query.where(Task.active == active)
+        if limit is not None:
+            query = query.limit(limit)
+        async with self.session() as session:
+            result = await session.execute(query)
+            return [TaskRow(*row) for row in result.all()]
+
+    async def get(self, task_id: str) -> Optional[Task]:
+        async with self.session() as session:
+            return await session.get(Task, task_id)
+
+    async def update(self, task_id: str, **fields) -> Optional[Task]:
+        async with self.session() as session:
+            task = await session.get(Task, task_id)
+            if not task:
+                return None
+            if fields.get("json_data") is not None:
+                task.json_data = json.dumps(fields["json_data"], ensure_ascii=False)
+            for name in ("steps", "sorting", "active"):
+                if fields.get(name) is not None:
+                    setattr(task, name, fields[name])
+            session.add(task)
+            await session.commit()
+            await session.refresh(task)
+            return task
+
+    async def delete(self, task_id: str) -> bool:
+        async with self.session() as session:
+            task = await session.get(Task, task_id)
+            if not task:
+                return False
+            await session.delete(task)
+            await session.commit()
+            return True
+
+    async def _sorting_of(self, session: AsyncSession, task_id: str) -> float:
+        result = await session.execute(
+            select(Task.sorting).where(Task.id == task_id)
+        )
+        sorting = result.scalar_one_or_none()
+        if sorting is None:
+            raise KeyError(task_id)
+        return sorting
+
+    async def _neighbours(
+        self,
+        session: AsyncSession,
+        task_id: str,
+        before_id: Optional[str],
+        after_id: Optional[str],
+    ) -> tuple[Optional[float], Optional[float]]:
+        others = Task.id != task_id
+        if after_id is not None:
+            lower = await self._sorting_of(session, after_id)
+            result = await session.execute(
+                select(func.min(Task.sorting)).where(others, Task.sorting > lower)
+            )
+            return lower, result.scalar_one_or_none()
+        if before_id is not None:
+            upper = await self._sorting_of(session, before_id)
+            result = await session.execute(
+                select(func.max(Task.sorting)).where(others, Task.sorting < upper)
+            )
+            return result.scalar_one_or_none(), upper
+        result = await session.execute(select(func.max(Task.sorting)).where(others))
+        return result.scalar_one_or_none(), None
+
+    async def _rebalance(self, session: AsyncSession):
+        """Перенумеровывает все задачи в 1..n; нужна, когда зазор исчерпан."""
+        result = await session.execute(
+            select(Task.id).order_by(Task.sorting, Task.id)
+        )
+        await session.execute(
+            update(Task),
+            [
+                {"id": task_id, "sorting": index}
+                for index, task_id in enumerate(result.scalars().all(), start=1)
+            ],
+        )
+
+    async def move(
+        self,
+        task_id: str,
+        before_id: Optional[str] = None,
+        after_id: Optional[str] = None,
+    ) -> Optional[Task]:
+        """
+        Ставит задачу сразу после `after_id` или перед `before_id`
+        (без обоих — в конец). Обычно меняется одна строка.
+        """
+        async with self.session() as session:
+            task = await session.get(Task, task_id)
+            if not task:
+                return None
+            lower, upper = await self._neighbours(session, task_id, before_id, after_id)
+            if lower is not None and upper is not None and upper - lower < MIN_SORTING_GAP:
+                await self._rebalance(session)
+                lower, upper = await self._neighbours(
+                    session, task_id, before_id, after_id
+                )
+            if lower is None and upper is None:
+                sorting = 1
+            elif upper is None:
+                sorting = lower + 1
+            elif lower is None:
+                sorting = upper - 1
+            else:
+                sorting = (lower + upper) / 2
+            task.sorting = sorting
+            session.add(task)
+            await session.commit()
+            await session.refresh(task)
+            return task
+
+
+_TASK_STORE_SINGLETON: Optional[TaskStore] = None
+
+
+def get_task_store() -> TaskStore:
+    global _TASK_STORE_SINGLETON
+
+    if _TASK_STORE_SINGLETON is None:
+        _TASK_STORE_SINGLETON = TaskStore()
+    return _TASK_STORE_SINGLETON
@@ -0,0 +1,37 @@
+"""
+Кэш каталога инструментов.
+
+В состоянии графа хранится только версия каталога (хэш JSON-схем), сами схемы
+живут в памяти процесса и не попадают в чекпоинт на каждом шаге.
+Если версия неизвестна (например, после рестарта), каталог заново
+запрашивается у tool server.
+"""
+import hashlib
+import json
+from typing import Dict, Optional, Tuple
+
+_CATALOGUES: Dict[str, list] = {}
+
+
+def catalogue_version(tools: list) -> str:
+    dump = json.dumps(tools, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(dump.encode("utf-8")).hexdigest()[:16]
+
+
+def register_catalogue(tools: list) -> str:
+    version = catalogue_version(tools)
+    _CATALOGUES[version] = tools
+    return version
+
+
+def get_catalogue(version: Optional[str]) -> Optional[list]:
+    return _CATALOGUES.get(version) if version else None
+
+
+async def aget_catalogue(version: Optional[str], tool_client) -> Tuple[str, list]:
+    """Возвращает (версия, инструменты), при промахе загружает каталог с tool server."""
+    tools = get_catalogue(version)
+    if tools is not None:
+        return version, tools
+    tools = await tool_client.get_tools()
+    return register_catalogue(tools), tools
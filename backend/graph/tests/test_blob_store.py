@@ -0,0 +1,104 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from giga_agent.utils import blob_store
+from giga_agent.utils.blob_store import BlobNotFound, FilesystemBlobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FilesystemBlobStore(str(tmp_path / "blobs"))
+
+
+def age(store: FilesystemBlobStore, digest: str, seconds: float):
+    past = time.time() - seconds
+    os.utime(store.path(digest), (past, past))
+
+
+def test_put_deduplicates(store):
+    first = store.put(b"data")
+    assert store.put(b"data") == first
+    assert store.read(first) == b"data"
+    assert store.read(first, 1, 3) == b"at"
+
+
+def test_read_missing_and_invalid_digest(store):
+    with pytest.raises(BlobNotFound):
+        store.read("0" * 64)
+    with pytest.raises(BlobNotFound):
+        store.path("../etc/passwd")
+
+
+def test_gc_removes_only_stale_unreferenced(store):
+    stale = store.put(b"stale")
+    kept = store.put(b"kept")
+    fresh = store.put(b"fresh")
+    age(store, stale, 100)
+    age(store, kept, 100)
+
+    assert store.gc(ttl=50, keep={kept}) == 1
+    assert not store.exists(stale)
+    assert store.exists(kept)
+    assert store.exists(fresh)
+
+
+def test_gc_disabled_without_ttl(store):
+    digest = store.put(b"old")
+    age(store, digest, 100)
+    assert store.gc(ttl=0) == 0
+    assert store.exists(digest)
+
+
+def test_read_extends_lifetime(store):
+    digest = store.put(b"used")
+    age(store, digest, 100)
+    store.read(digest)
+    assert store.gc(ttl=50) == 0
+
+
+class FakeStoreClient:
+    def __init__(self, items: dict):
+        self.items = items
+
+    async def search_items(self, namespace, limit, offset):
+        return {"items": self.items.get(namespace, [])[offset : offset + limit]}
+
+
+class FakeClient:
+    def __init__(self, items: dict):
+        self.store = FakeStoreClient(items)
+
+
+def test_referenced_digests_walks_all_pages(monkeypatch):
+    attachments = [
+        {"value": {"blob": f"a{i}"}} for i in range(blob_store.REFERENCE_PAGE_SIZE + 5)
+    ]
+    html = [{"value": {"blob": "h", "img_blob": "i"}}, {"value": {"data": "legacy"}}]
+    client = FakeClient({("attachments",): attachments, ("html",): html})
+    monkeypatch.setattr(blob_store, "get_client", lambda: client)
+
+    digests = asyncio.run(blob_store.referenced_digests())
+    assert len(digests) == len(attachments) + 2
+    assert {"a0", f"a{len(attachments) - 1}", "h", "i"} <= digests
+
+
+def test_gc_loop_skips_collection_when_references_fail(monkeypatch, store):
+    digest = store.put(b"referenced")
+    age(store, digest, 100)
+
+    async def failing_references():
+        raise ConnectionError("store is down")
+
+    async def stop_after_first_pass(_):
+        raise asyncio.CancelledError
+
+    monkeypatch.setattr(blob_store, "referenced_digests", failing_references)
+    monkeypatch.setattr(blob_store, "get_blob_store", lambda: store)
+    monkeypatch.setattr(blob_store.asyncio, "sleep", stop_after_first_pass)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(blob_store.gc_loop(interval=1, ttl=50))
+    assert store.exists(digest)
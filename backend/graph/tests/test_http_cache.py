@@ -0,0 +1,72 @@
+import hashlib
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from giga_agent.utils.http_cache import BodyLRU, CachedBody, etag_matches
+
+BODY = b"<html>" + b"<p>page</p>" * 500 + b"</html>"
+ETAG = f'"{hashlib.sha256(BODY).hexdigest()}"'
+
+
+@pytest.fixture
+def client():
+    page = CachedBody(BODY, "text/html; charset=utf-8")
+    app = FastAPI()
+
+    @app.get("/page")
+    async def get_page(request: Request):
+        return page.response(request, "public, max-age=3600")
+
+    return TestClient(app)
+
+
+def test_identity_response(client):
+    response = client.get("/page", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["etag"] == ETAG
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert "content-encoding" not in response.headers
+    assert response.content == BODY
+
+
+def test_gzip_variant_etag(client):
+    response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    gzip_etag = response.headers["etag"]
+    assert gzip_etag == f'{ETAG[:-1]}-gzip"'
+    assert response.content == BODY
+
+    response = client.get(
+        "/page", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag}
+    )
+    assert response.status_code == 304
+    # ETag несжатого варианта не подходит для сжатого
+    response = client.get(
+        "/page", headers={"Accept-Encoding": "gzip", "If-None-Match": ETAG}
+    )
+    assert response.status_code == 200
+
+
+def test_small_body_is_not_compressed():
+    body = CachedBody(b"tiny", "text/plain")
+    assert list(body.variants) == ["identity"]
+
+
+def test_etag_matches():
+    assert etag_matches('W/"a", "b"', '"b"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"a"')
+
+
+def test_body_lru_evicts_by_size():
+    cache = BodyLRU(max_bytes=10, name="test")
+    first = CachedBody(b"123456", "text/plain")
+    second = CachedBody(b"abcdef", "text/plain")
+    cache.put("first", first)
+    cache.put("second", second)
+    assert cache.get("first") is None
+    assert cache.get("second") is second
+    assert cache.stats()["bytes"] == 6
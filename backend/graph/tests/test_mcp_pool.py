@@ -0,0 +1,95 @@
+import asyncio
+
+import anyio
+import pytest
+from langchain_core.tools import ToolException
+
+from giga_agent.tool_server.mcp_pool import MCPServerPool, MCPSession
+from giga_agent.utils import metrics
+
+
+class FakeClientSession:
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.calls = []
+
+    async def call_tool(self, name, arguments):
+        self.calls.append((name, arguments))
+        if self.error is not None:
+            raise self.error
+        return f"{name}: ok"
+
+
+def ready_session(pool: MCPServerPool, index: int, client: FakeClientSession) -> MCPSession:
+    """Сессия пула, подключенная к фейковому клиенту без задачи-владельца."""
+    session = pool.sessions[index]
+    session.session = client
+    session._ready = asyncio.Event()
+    session._ready.set()
+    session._broken = asyncio.Event()
+    session._semaphore = asyncio.Semaphore(session.max_concurrency)
+
+    async def wait_ready(timeout=None):
+        return client
+
+    session.wait_ready = wait_ready
+    return session
+
+
+def call(pool: MCPServerPool, *clients: FakeClientSession):
+    async def main():
+        for index, client in enumerate(clients):
+            ready_session(pool, index, client)
+        return await pool.call_tool("echo", {"x": 1})
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def pool():
+    metrics.reset()
+    return MCPServerPool("test", {}, size=2, max_concurrency=4)
+
+
+def calls_by_status():
+    return {
+        row["labels"]["status"]: row["value"]
+        for row in metrics.snapshot().get("mcp_calls", [])
+    }
+
+
+@pytest.mark.parametrize(
+    "error", [anyio.ClosedResourceError(), anyio.BrokenResourceError()]
+)
+def test_retries_on_another_session_when_not_sent(pool, error):
+    first, second = FakeClientSession(error), FakeClientSession()
+    assert call(pool, first, second) == "echo: ok"
+    assert len(first.calls) == 1
+    assert len(second.calls) == 1
+    assert pool.sessions[0]._broken.is_set()
+    assert not pool.sessions[1]._broken.is_set()
+    assert calls_by_status() == {"retry": 1}
+
+
+@pytest.mark.parametrize(
+    "error",
+    [anyio.EndOfStream(), ConnectionResetError(), ToolException("boom")],
+)
+def test_does_not_retry_after_request_was_sent(pool, error):
+    first, second = FakeClientSession(error), FakeClientSession()
+    with pytest.raises(type(error)):
+        call(pool, first, second)
+    assert len(first.calls) == 1
+    assert second.calls == []
+    assert not pool.sessions[1]._broken.is_set()
+    assert calls_by_status() == {"error": 1}
+
+
+def test_retries_only_once(pool):
+    first = FakeClientSession(anyio.ClosedResourceError())
+    second = FakeClientSession(anyio.ClosedResourceError())
+    with pytest.raises(anyio.ClosedResourceError):
+        call(pool, first, second)
+    assert len(first.calls) == 1
+    assert len(second.calls) == 1
+    assert calls_by_status() == {"error": 1}
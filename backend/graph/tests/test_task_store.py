@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from giga_agent.utils.task_store import TaskStore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def with_store(path, action):
+    store = TaskStore(str(path / "tasks.db"), pool_size=1)
+    await store.init(dump_path=None)
+    try:
+        return await action(store)
+    finally:
+        await store.close()
+
+
+async def ordered_ids(store: TaskStore) -> list:
+    return [row.id for row in await store.list()]
+
+
+def test_list_pages_with_cursor(tmp_path):
+    async def action(store):
+        # Одинаковый sorting: порядок страниц держится на id
+        await store.bulk_import(
+            [{"id": f"t{i}", "sorting": 1 if i < 3 else i} for i in range(6)]
+        )
+        pages = []
+        after = None
+        while True:
+            rows = await store.list(limit=2, after=after)
+            if not rows:
+                break
+            pages.append([row.id for row in rows])
+            after = rows[-1].cursor
+        return pages
+
+    assert run(with_store(tmp_path, action)) == [
+        ["t0", "t1"],
+        ["t2", "t3"],
+        ["t4", "t5"],
+    ]
+
+
+def test_list_filters_active(tmp_path):
+    async def action(store):
+        await store.bulk_import(
+            [{"id": "a", "active": True}, {"id": "b"}, {"id": "c", "active": True}]
+        )
+        rows = await store.list(limit=1, active=True)
+        rest = await store.list(after=rows[0].cursor, active=True)
+        return [row.id for row in rows + rest]
+
+    assert run(with_store(tmp_path, action)) == ["a", "c"]
+
+
+def test_invalid_cursor(tmp_path):
+    async def action(store):
+        await store.list(after="not-a-cursor")
+
+    with pytest.raises(ValueError):
+        run(with_store(tmp_path, action))
+
+
+def test_move_changes_only_moved_task(tmp_path):
+    async def action(store):
+        await store.bulk_import([{"id": name} for name in "abcd"])
+        before = {row.id: row.sorting for row in await store.list()}
+        moved = await store.move("d", after_id="a")
+        after = {row.id: row.sorting for row in await store.list()}
+        return moved, before, after, await ordered_ids(store)
+
+    moved, before, after, order = run(with_store(tmp_path, action))
+    assert order == ["a", "d", "b", "c"]
+    assert before["a"] < moved.sorting < before["b"]
+    assert {k: v for k, v in after.items() if k != "d"} == {
+        k: v for k, v in before.items() if k != "d"
+    }
+
+
+def test_move_before_and_to_end(tmp_path):
+    async def action(store):
+        await store.bulk_import([{"id": name} for name in "abc"])
+        await store.move("c", before_id="a")
+        first = await ordered_ids(store)
+        await store.move("c")
+        return first, await ordered_ids(store)
+
+    assert run(with_store(tmp_path, action)) == (["c", "a", "b"], ["a", "b", "c"])
+
+
+def test_move_rebalances_when_gap_is_exhausted(tmp_path):
+    async def action(store):
+        await store.bulk_import(
+            [
+                {"id": "a", "sorting": 1},
+                {"id": "b", "sorting": 1 + 1e-9},
+                {"id": "c", "sorting": 2},
+            ]
+        )
+        await store.move("c", after_id="a")
+        return [(row.id, row.sorting) for row in await store.list()]
+
+    rows = run(with_store(tmp_path, action))
+    assert [task_id for task_id, _ in rows] == ["a", "c", "b"]
+    sortings = [sorting for _, sorting in rows]
+    assert sortings[1] - sortings[0] >= 0.1
+
+
+def test_move_missing(tmp_path):
+    async def action(store):
+        await store.bulk_import([{"id": "a"}])
+        missing = await store.move("nope", after_id="a")
+        try:
+            await store.move("a", after_id="nope")
+        except KeyError:
+            return missing, "KeyError"
+        return missing, None
+
+    assert run(with_store(tmp_path, action)) == (None, "KeyError")
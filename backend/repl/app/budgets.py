@@ -0,0 +1,41 @@
+"""
+Бюджеты выполнения ячеек.
+
+Клиент может запросить свой таймаут (`timeout` в `/code`), сервер ограничивает
+его сверху: REPL_MAX_TIMEOUT для всех или REPL_TENANT_MAX_TIMEOUT для отдельных
+тенантов, например `{"analytics": 3600, "demo": 30}`.
+Тенант задается конфигурацией сервера (REPL_TENANT), а не телом запроса.
+Заголовок `X-Giga-Tenant` учитывается только при REPL_TRUST_TENANT_HEADER=true —
+когда его выставляет доверенный прокси перед REPL и клиент не может его подменить.
+Лимит применяется к итоговому бюджету ячейки, в том числе к увеличенному
+бюджету установки пакетов pip.
+"""
+import json
+import os
+
+from app.run_jupyter import DEFAULT_INTERRUPT_AFTER
+
+TENANT_HEADER = "X-Giga-Tenant"
+MAX_TIMEOUT = float(os.environ.get("REPL_MAX_TIMEOUT", 600))
+# Бюджет фоновой задачи, если клиент не задал свой
+JOB_DEFAULT_TIMEOUT = float(os.environ.get("REPL_JOB_DEFAULT_TIMEOUT", 600))
+TENANT_MAX_TIMEOUT: dict = json.loads(os.environ.get("REPL_TENANT_MAX_TIMEOUT") or "{}")
+TENANT = os.environ.get("REPL_TENANT") or None
+TRUST_TENANT_HEADER = os.environ.get("REPL_TRUST_TENANT_HEADER", "false").lower() == "true"
+
+
+def resolve_tenant(headers) -> str | None:
+    if TRUST_TENANT_HEADER:
+        return headers.get(TENANT_HEADER) or TENANT
+    return TENANT
+
+
+def max_timeout(tenant: str | None) -> float:
+    return float(TENANT_MAX_TIMEOUT.get(tenant, MAX_TIMEOUT))
+
+
+def resolve_timeout(
+    requested: float | None, tenant: str | None, background: bool = False
+) -> float:
+    default = JOB_DEFAULT_TIMEOUT if background else DEFAULT_INTERRUPT_AFTER
+    return min(requested or default, max_timeout(tenant))
@@ -0,0 +1,111 @@
+"""
+Кэш табличных файлов в колоночном формате.
+
+upload_server после загрузки CSV/XLSX один раз разбирает файл и сохраняет
+рядом кэш: Arrow IPC без сжатия.
+В ядре `read_dataset('files/...')` читает кэш вместо повторного разбора:
+Arrow-файл открывается через memory map, поэтому страницы файла общие
+для всех ядер, а числовые колонки без пропусков не копируются.
+
+Кэш лежит в `<каталог файла>/.datasets/` и привязан к размеру и времени
+изменения исходника: после перезаписи файла старый кэш не найдется, а при
+построении нового удаляется.
+"""
+import logging
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = ".datasets"
+TABULAR_EXTENSIONS = {".csv", ".tsv", ".xlsx", ".xls"}
+
+
+def is_tabular(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in TABULAR_EXTENSIONS
+
+
+def cache_path(path: str) -> str:
+    stat = os.stat(path)
+    directory, name = os.path.split(path)
+    return os.path.join(
+        directory, CACHE_DIR_NAME, f"{name}.{stat.st_size}-{stat.st_mtime_ns}.arrow"
+    )
+
+
+def _remove_stale(path: str, keep: str):
+    """Удаляет кэши прежних версий файла (в том числе pickle старого формата)."""
+    directory, name = os.path.split(keep)
+    pattern = re.compile(re.escape(os.path.basename(path)) + r"\.\d+-\d+\.(arrow|pkl)")
+    for entry in os.listdir(directory):
+        if entry != name and pattern.fullmatch(entry):
+            try:
+                os.remove(os.path.join(directory, entry))
+            except OSError:
+                logger.warning("Не удалось удалить старый кэш %s", entry)
+
+
+def _read_source(path: str, **kwargs) -> pd.DataFrame:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xls"):
+        return pd.read_excel(path, **kwargs)
+    if extension == ".tsv":
+        kwargs.setdefault("sep", "\t")
+    return pd.read_csv(path, **kwargs)
+
+
+def build_cache(path: str) -> str | None:
+    """Разбирает файл и сохраняет кэш. Возвращает путь к кэшу или None."""
+    if not is_tabular(path):
+        return None
+    target = cache_path(path)
+    if os.path.exists(target):
+        return target
+    try:
+        df = _read_source(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        # Без сжатия, иначе файл нельзя читать через memory map
+        feather.write_feather(df, tmp, compression="uncompressed")
+        os.replace(tmp, target)
+    except Exception:
+        logger.exception("Не удалось построить кэш для %s", path)
+        return None
+    _remove_stale(path, target)
+    return target
+
+
+def read_dataset(path: str, as_arrow: bool = False, **kwargs):
+    """
+    Читает CSV/XLSX так же, как `pd.read_csv` / `pd.read_excel`, но из кэша,
+    если он есть. С дополнительными параметрами чтения (`sep`, `usecols` и т.п.)
+    файл разбирается заново. `as_arrow=True` возвращает `pyarrow.Table`
+    без копирования данных.
+    """
+    if not kwargs and is_tabular(path):
+        try:
+            cached = cache_path(path)
+        except OSError:
+            cached = None
+        if cached is not None and os.path.exists(cached):
+            table = pa.ipc.open_file(pa.memory_map(cached, "r")).read_all()
+            if as_arrow:
+                return table
+            return table.to_pandas(split_blocks=True)
+    df = _read_source(path, **kwargs)
+    return pa.Table.from_pandas(df) if as_arrow else df
+
+
+if __name__ == "__main__":
+    # Кэш для уже загруженных файлов: python -m app.datasets /files
+    import sys
+
+    for root in sys.argv[1:] or [os.environ.get("FILES_DIR", "files")]:
+        for name in sorted(os.listdir(root)):
+            source = os.path.join(root, name)
+            if os.path.isfile(source) and is_tabular(source):
+                print(source, "->", build_cache(source))
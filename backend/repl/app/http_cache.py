@@ -0,0 +1,264 @@
+"""
+HTTP-кэширование отдачи файлов upload_server.
+
+- ETag — sha256 содержимого (посчитанный один раз для тройки путь/размер/mtime),
+  поэтому он одинаков после перезапуска и на любой реплике;
+  у сжатых копий свой ETag (`"<sha256>-gzip"`, `"<sha256>-br"`);
+  `If-None-Match` / `If-Modified-Since` дают 304.
+- `Range: bytes=...` отдает 206 с нужным куском несжатого файла (для аудио
+  и больших файлов); `If-Range` принимается только с ETag несжатого варианта.
+  starlette 0.37 в FileResponse диапазоны не поддерживает.
+- Текстовые форматы отдаются заранее сжатыми копиями (`.gz`, `.br` при
+  установленном brotli) из `<FILES_DIR>/.compressed/`: файл сжимается один раз
+  при первом запросе.
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+import shutil
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен
+    brotli = None
+
+CHUNK_SIZE = 1024 * 1024
+# Меньше этого размера сжатие не окупает лишний запрос к диску
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+
+# (path, size, mtime_ns) -> sha256 для файлов, которых нет в индексе загрузок
+_digests: dict = {}
+
+
+def is_compressible(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def file_digest(path: str, stat: os.stat_result) -> str:
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(key)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                sha256.update(chunk)
+        digest = _digests[key] = sha256.hexdigest()
+    return digest
+
+
+def strong_etag(digest: str) -> str:
+    return f'"{digest}"'
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Сравнение для If-None-Match: слабое, как требует RFC 9110."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag for candidate in header.split(",")
+    )
+
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Один диапазон `bytes=start-end` -> (start, end) включительно.
+    None — заголовок не разобран или диапазонов несколько: отдаем файл целиком.
+    ValueError — диапазон за пределами файла (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start, _, end = spec.strip().partition("-")
+    if not start:
+        # bytes=-500 — последние 500 байт
+        try:
+            length = int(end)
+        except ValueError:
+            return None
+        if length <= 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    try:
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+async def _iter_range(path: str, start: int, end: int):
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        left = end - start + 1
+        while left > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, left))
+            if not chunk:
+                break
+            left -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _compress(path: str, target: str, encoding: str):
+    tmp = f"{target}.{os.getpid()}.tmp"
+    if encoding == "br":
+        with open(path, "rb") as src:
+            data = brotli.compress(src.read(), quality=9)
+        with open(tmp, "wb") as dst:
+            dst.write(data)
+    else:
+        with open(path, "rb") as src, gzip.open(tmp, "wb", compresslevel=9) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    os.replace(tmp, target)
+
+
+async def compressed_variant(
+    path: str, digest: str, encoding: str, cache_dir: str
+) -> str | None:
+    """Путь к сжатой копии файла; создается при первом обращении."""
+    target = os.path.join(cache_dir, f"{digest}.{'br' if encoding == 'br' else 'gz'}")
+    if not os.path.exists(target):
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            await asyncio.to_thread(_compress, path, target, encoding)
+        except OSError:
+            return None
+    return target
+
+
+def _full_response(
+    request: Request, path: str, media_type: str, headers: dict
+) -> Response:
+    """
+    Файл целиком. Если в запросе был Range, который мы не выполняем (сжатая
+    копия или не совпал If-Range), отдаем поток сами: FileResponse новых
+    версий starlette применил бы диапазон к любому файлу, в том числе сжатому.
+    """
+    if request.headers.get("range") is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    size = os.stat(path).st_size
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(
+        _iter_range(path, 0, size - 1), media_type=media_type, headers=headers
+    )
+
+
+def accepted_encoding(request: Request) -> str | None:
+    accept = request.headers.get("accept-encoding", "")
+    codings = {}
+    for part in accept.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        codings[name.strip().lower()] = q
+    if brotli is not None and codings.get("br", 0) > 0:
+        return "br"
+    if codings.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+async def file_response(
+    request: Request,
+    path: str,
+    media_type: str,
+    digest: str | None = None,
+    headers: dict | None = None,
+    compressed_dir: str | None = None,
+    cache_control: str = "no-cache",
+) -> Response:
+    """Отдает файл с ETag, 304, Range и сжатыми копиями."""
+    stat = await asyncio.to_thread(os.stat, path)
+    if digest is None:
+        digest = await asyncio.to_thread(file_digest, path, stat)
+    headers = {
+        **(headers or {}),
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    compressible = compressed_dir is not None and is_compressible(media_type)
+    if compressible:
+        headers["Vary"] = "Accept-Encoding"
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    identity_etag = strong_etag(digest)
+    # Диапазон продолжает загрузку исходного файла: If-Range сверяется только
+    # с ETag несжатого варианта, иначе куски разных кодировок склеились бы
+    ranged = range_header is not None and (
+        if_range is None or if_range.strip() == identity_etag
+    )
+    encoding = None
+    if compressible and not ranged and stat.st_size >= MIN_COMPRESS_SIZE:
+        encoding = accepted_encoding(request)
+
+    if encoding:
+        # У каждого сжатого варианта свой ETag
+        etag = strong_etag(f"{digest}-{encoding}")
+        if not_modified(request, etag, stat.st_mtime):
+            return Response(status_code=304, headers={**headers, "ETag": etag})
+        variant = await compressed_variant(path, digest, encoding, compressed_dir)
+        if variant is not None:
+            headers["ETag"] = etag
+            headers["Content-Encoding"] = encoding
+            # Диапазоны относятся к исходному файлу, у сжатой копии их нет;
+            # явное "none", иначе FileResponse сам добавит "bytes"
+            headers["Accept-Ranges"] = "none"
+            return _full_response(request, variant, media_type, headers)
+
+    headers["ETag"] = identity_etag
+    if not_modified(request, identity_etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+    if ranged:
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(
+                status_code=416, headers={"Content-Range": f"bytes */{stat.st_size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_range(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+    return _full_response(request, path, media_type, headers)
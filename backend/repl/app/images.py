@@ -0,0 +1,24 @@
+"""
+Обработка изображений для upload_server. Модуль легкий (только PIL), потому
+что импортируется заново в каждом процессе пула.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+
+def make_thumbnail(path: str, max_side: int = 1024) -> bytes:
+    """Уменьшенная JPEG-копия изображения с учетом EXIF-поворота."""
+    image = ImageOps.exif_transpose(Image.open(path))
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    image.convert("RGB").save(
+        buf,
+        format="JPEG",
+        quality=85,
+        optimize=True,
+        progressive=True,
+    )
+    return buf.getvalue()
@@ -0,0 +1,98 @@
+"""
+Фоновые задачи REPL: ячейка выполняется в очереди своего ядра, а клиент
+сразу получает id задачи и потом опрашивает `/jobs/{id}` или читает
+вывод по мере выполнения из `/jobs/{id}/stream`.
+"""
+import asyncio
+import os
+import time
+import uuid
+
+# Сколько секунд хранится завершенная задача
+JOB_TTL = float(os.environ.get("REPL_JOB_TTL", 3600))
+
+FINISHED = ("done", "error", "cancelled")
+
+
+class Job:
+    def __init__(self, kernel_id: str, timeout: float):
+        self.id = str(uuid.uuid4())
+        self.kernel_id = kernel_id
+        self.timeout = timeout
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.output: list[str] = []
+        self.result: dict | None = None
+        self.error: str | None = None
+        self.run = None
+        self.changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    def _notify(self):
+        # Каждый ожидающий держит ссылку на свое событие, поэтому просто меняем его
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def start(self):
+        self.status = "running"
+        self.started_at = time.time()
+        self._notify()
+
+    def append_output(self, text: str):
+        self.output.append(text)
+        self._notify()
+
+    def finish(self, task: asyncio.Task):
+        if task.cancelled():
+            self.status = "cancelled"
+        elif task.exception() is not None:
+            self.status = "error"
+            self.error = repr(task.exception())
+        else:
+            self.status = "done"
+            self.result = task.result()
+        self.finished_at = time.time()
+        self._notify()
+
+    def to_dict(self, include_output: bool = True) -> dict:
+        data = {
+            "job_id": self.id,
+            "kernel_id": self.kernel_id,
+            "status": self.status,
+            "timeout": self.timeout,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+        if include_output:
+            data["output"] = "".join(self.output)
+        return data
+
+
+class JobStore:
+    def __init__(self, ttl: float = JOB_TTL):
+        self.ttl = ttl
+        self.jobs: dict[str, Job] = {}
+
+    def add(self, job: Job):
+        self.cleanup()
+        self.jobs[job.id] = job
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def cleanup(self):
+        now = time.time()
+        for job_id in [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.done and now - job.finished_at > self.ttl
+        ]:
+            del self.jobs[job_id]
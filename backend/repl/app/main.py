@@ -1,16 +1,27 @@
+import asyncio
+import json
+import logging
 import os
 import time
 import uuid
+from typing import Literal
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
+from app import metrics
+from app.budgets import max_timeout, resolve_tenant, resolve_timeout
+from app.jobs import Job, JobStore
 from app.run_jupyter import StatefulKernel
+from app.scheduler import KernelScheduler, ScheduledRun
 
 load_dotenv("../.env")
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 origins = ["*"]
@@ -25,39 +36,271 @@ app.add_middleware(
 
 app.kernels = {}
 app.kernels_last_request = {}
+# Очередь на ядро и общий лимит одновременно выполняющихся ядер
+scheduler = KernelScheduler()
+jobs = JobStore()
 
 STATE_DIR = os.environ.get("STATE_DIR", "kernel_states")
 os.makedirs(STATE_DIR, exist_ok=True)
 
 MAX_IDLE = float(os.environ.get("MAX_KERNEL_LIVE", 300))
 
+# Дедлайн запуска (unix epoch, секунды) от графа / tool server
+DEADLINE_HEADER = "X-Giga-Deadline"
+# Ядро прерывается чуть раньше дедлайна, чтобы ответ успел дойти до клиента
+DEADLINE_MARGIN = float(os.environ.get("DEADLINE_MARGIN", 2))
+
 
 class CodeRequest(BaseModel):
     kernel_id: str
     script: str
+    # Бюджет ячейки в секундах; сервер ограничивает его лимитом тенанта
+    timeout: float | None = Field(default=None, gt=0)
+    # background — выполнить в фоне и сразу вернуть id задачи
+    mode: Literal["sync", "background"] = "sync"
 
 
 async def load_wrapper(kernel_id: str):
     state_file = os.path.join(STATE_DIR, f"{kernel_id}.pkl")
     wrapper = StatefulKernel(state_file=state_file, idle_timeout=MAX_IDLE)
+    wrapper.on_stop = lambda: remove_kernel(kernel_id)
     # Запускаем ядро и (опционально) сразу загружаем предыдущий state
     await wrapper.start()
     return wrapper
 
 
+def remove_kernel(kernel_id: str):
+    """Ядро остановлено (shutdown, простой или смерть): забываем его везде."""
+    app.kernels.pop(kernel_id, None)
+    app.kernels_last_request.pop(kernel_id, None)
+    scheduler.forget(kernel_id)
+    logger.info("Ядро остановлено: kernel_id=%s", kernel_id)
+
+
+async def get_wrapper(kernel_id: str) -> StatefulKernel:
+    # Вызывается внутри очереди ядра, поэтому ядро не создается дважды
+    wrapper = app.kernels.get(kernel_id)
+    if wrapper is None:
+        wrapper = await load_wrapper(kernel_id)
+        app.kernels[kernel_id] = wrapper
+    return wrapper
+
+
+async def stop_run(run: ScheduledRun) -> bool:
+    """
+    Останавливает запуск: выполняющуюся ячейку прерывает в ядре, остальное
+    снимает с очереди. Ядро может еще создаваться (`started` уже выставлен,
+    а get_wrapper не вернулся) — тогда прерывать нечего и задача отменяется.
+    Возвращает True, если задача отменена.
+    """
+    wrapper = app.kernels.get(run.kernel_id) if run.started else None
+    if wrapper is not None:
+        await wrapper.interrupt()
+        return False
+    run.task.cancel()
+    return True
+
+
+def parse_deadline(http_request: Request) -> float | None:
+    try:
+        return float(http_request.headers[DEADLINE_HEADER])
+    except (KeyError, ValueError):
+        return None
+
+
+async def run_until_disconnect(http_request: Request, run: ScheduledRun):
+    """
+    Ждет выполнения ячейки. Если клиент отключился (запуск отменен):
+    - ячейка еще в очереди или ядро еще создается — отменяем запуск;
+    - ячейка выполняется — прерываем ядро и дожидаемся завершения ячейки,
+      чтобы следующий запрос не получил ее сообщения из iopub.
+    """
+
+    async def wait_disconnect():
+        while True:
+            message = await http_request.receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    watcher = asyncio.create_task(wait_disconnect())
+    dequeued = False
+    try:
+        await asyncio.wait([run.task, watcher], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not run.task.done():
+            queued = not run.started
+            dequeued = await stop_run(run)
+            if not dequeued:
+                logger.info("Клиент отключился, прерываем ядро %s", run.kernel_id)
+            elif queued:
+                metrics.inc("repl_runs_cancelled_in_queue")
+    if dequeued:
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    return await run.task
+
+
+def code_response(wrapper: StatefulKernel, output) -> dict:
+    result, err, _, attachments = output
+    return {
+        "result": result,
+        "is_exception": bool(err),
+        "exception": err,
+        "attachments": attachments,
+        "cpu_time": wrapper.last_cpu_time,
+        "wall_time": wrapper.last_wall_time,
+    }
+
+
 @app.post("/code")
-async def code(request: CodeRequest):
-    wrapper = app.kernels.get(request.kernel_id)
+async def code(request: CodeRequest, http_request: Request):
+    tenant = resolve_tenant(http_request.headers)
+    background = request.mode == "background"
+    timeout = resolve_timeout(request.timeout, tenant, background)
+    timeout_cap = max_timeout(tenant)
+    if background:
+        return submit_job(request.kernel_id, request.script, timeout, timeout_cap)
+    deadline = parse_deadline(http_request)
+
+    async def execute():
+        budget = None
+        if deadline is not None:
+            # Бюджет считается после ожидания в очереди
+            budget = deadline - time.time() - DEADLINE_MARGIN
+            if budget <= 0:
+                raise HTTPException(status_code=504, detail="Deadline exceeded")
+        wrapper = await get_wrapper(request.kernel_id)
+        output = await wrapper.execute(
+            request.script,
+            timeout=timeout,
+            timeout_cap=timeout_cap,
+            budget=budget,
+            # Дедлайн доступен в ядре: по нему ToolClient считает таймауты
+            metadata={"deadline": deadline} if deadline is not None else None,
+        )
+        return code_response(wrapper, output)
+
+    run = scheduler.submit(request.kernel_id, execute)
+    response = await run_until_disconnect(http_request, run)
+    app.kernels_last_request[request.kernel_id] = time.time()
+    return response
+
+
+def submit_job(
+    kernel_id: str, script: str, timeout: float, timeout_cap: float
+) -> dict:
+    """Ставит ячейку в очередь ядра как фоновую задачу."""
+    job = Job(kernel_id, timeout)
+
+    async def execute():
+        job.start()
+        wrapper = await get_wrapper(kernel_id)
+        output = await wrapper.execute(
+            script,
+            timeout=timeout,
+            timeout_cap=timeout_cap,
+            on_output=job.append_output,
+        )
+        app.kernels_last_request[kernel_id] = time.time()
+        return code_response(wrapper, output)
+
+    job.run = scheduler.submit(kernel_id, execute, kind="job")
+    job.run.task.add_done_callback(job.finish)
+    jobs.add(job)
+    return job.to_dict(include_output=False)
+
+
+def get_job_or_404(job_id: str) -> Job:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return get_job_or_404(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, offset: int = 0):
+    """
+    Вывод задачи по мере выполнения в формате NDJSON:
+    `{"type": "output", "text": ...}` на каждый кусок stdout/stderr,
+    в конце — `{"type": "result", ...}` с итогом задачи.
+    `offset` — сколько кусков вывода клиент уже получил.
+    """
+    job = get_job_or_404(job_id)
+
+    async def stream():
+        index = offset
+        while True:
+            changed = job.changed
+            while index < len(job.output):
+                yield json.dumps(
+                    {"type": "output", "text": job.output[index]}, ensure_ascii=False
+                ) + "\n"
+                index += 1
+            if job.done:
+                yield json.dumps(
+                    {"type": "result", **job.to_dict(include_output=False)},
+                    ensure_ascii=False,
+                    default=str,
+                ) + "\n"
+                return
+            await changed.wait()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = get_job_or_404(job_id)
+    if not job.done:
+        await stop_run(job.run)
+    return job.to_dict(include_output=False)
+
+
+@app.get("/kernels/{kernel_id}/usage")
+async def kernel_usage(kernel_id: str):
+    """Время CPU ядра: за последнюю ячейку и всего."""
+    wrapper = app.kernels.get(kernel_id)
     if wrapper is None:
-        wrapper = await load_wrapper(request.kernel_id)
-        app.kernels[request.kernel_id] = wrapper
-    result, err, _, attachments = await wrapper.execute(request.script)
+        raise HTTPException(status_code=404, detail="Kernel not found")
+    return {
+        "kernel_id": kernel_id,
+        "cpu_time_total": wrapper.cpu_time_total,
+        "last_cpu_time": wrapper.last_cpu_time,
+        "last_wall_time": wrapper.last_wall_time,
+        "process_cpu_time": wrapper.cpu_seconds() if wrapper.km else None,
+    }
+
+
+class BootstrapRequest(BaseModel):
+    kernel_id: str
+    version: str
+    script: str
+
+
+@app.post("/bootstrap")
+async def bootstrap(request: BootstrapRequest):
+    """Устанавливает в ядро заглушки инструментов, если версия изменилась."""
+
+    async def apply():
+        wrapper = await get_wrapper(request.kernel_id)
+        return await wrapper.bootstrap(request.script, request.version)
+
+    output = await scheduler.run(request.kernel_id, apply, kind="bootstrap")
     app.kernels_last_request[request.kernel_id] = time.time()
+    if output is None:
+        return {"version": request.version, "changed": False, "is_exception": False}
+    result, err, _, _ = output
     return {
+        "version": request.version,
+        "changed": True,
         "result": result,
         "is_exception": bool(err),
         "exception": err,
-        "attachments": attachments,
     }
 
 
@@ -80,6 +323,11 @@ async def shutdown_kernel(request: KernelRequest):
     wrapper = app.kernels.get(request.kernel_id)
     if wrapper is None:
         raise HTTPException(status_code=404, detail="Kernel not found")
-    # Сохраняем и убиваем
-    await wrapper.shutdown()
+    # Сохраняем и убиваем, дождавшись ячеек, уже стоящих в очереди ядра
+    await scheduler.run(request.kernel_id, wrapper.shutdown, kind="shutdown")
     return {"completed": True}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return {"metrics": metrics.snapshot(), "scheduler": scheduler.stats()}
@@ -0,0 +1,91 @@
+"""
+Простые внутрипроцессные метрики (счетчики и гистограммы) для сервиса REPL.
+Тот же формат, что и `giga_agent.utils.metrics` в backend/graph.
+"""
+import threading
+from collections import defaultdict
+from typing import Dict, Sequence, Tuple
+
+# Границы корзин гистограмм по умолчанию, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+_histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], dict] = {}
+
+
+def _labels_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Увеличивает счетчик `name` с метками `labels`."""
+    with _lock:
+        _counters[(name, _labels_key(labels))] += value
+
+
+def observe(name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels):
+    """Добавляет наблюдение `value` в гистограмму `name` с метками `labels`."""
+    key = (name, _labels_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {
+                "buckets": list(buckets),
+                "counts": [0] * (len(buckets) + 1),
+                "count": 0,
+                "sum": 0.0,
+                "max": 0.0,
+            }
+        index = len(histogram["buckets"])
+        for i, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                index = i
+                break
+        histogram["counts"][index] += 1
+        histogram["count"] += 1
+        histogram["sum"] += value
+        histogram["max"] = max(histogram["max"], value)
+
+
+def get(name: str, **labels) -> float:
+    with _lock:
+        return _counters.get((name, _labels_key(labels)), 0)
+
+
+def snapshot() -> dict:
+    """
+    Возвращает все метрики в виде
+    `{name: [{"labels": {...}, "value": ...}, ...]}`;
+    для гистограмм вместо `value` — `count`, `sum`, `max`, `avg` и
+    `buckets` (накопленное число наблюдений `<=` границы, как в Prometheus).
+    """
+    result = defaultdict(list)
+    with _lock:
+        for (name, labels), value in _counters.items():
+            result[name].append({"labels": dict(labels), "value": value})
+        for (name, labels), histogram in _histograms.items():
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(
+                histogram["buckets"] + ["+Inf"], histogram["counts"]
+            ):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            result[name].append(
+                {
+                    "labels": dict(labels),
+                    "count": histogram["count"],
+                    "sum": histogram["sum"],
+                    "max": histogram["max"],
+                    "avg": histogram["sum"] / histogram["count"],
+                    "buckets": buckets,
+                }
+            )
+    return dict(result)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
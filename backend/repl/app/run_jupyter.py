@@ -4,11 +4,25 @@ import logging
 import os
 import re
 import time
+from typing import Callable
 
 import jupyter_client
 
+from app import metrics
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - без psutil читаем /proc
+    psutil = None
+
 logger = logging.getLogger(__name__)
 
+# Через сколько секунд ячейка прерывается, если запрос не задал свой бюджет
+DEFAULT_INTERRUPT_AFTER = float(os.environ.get("REPL_DEFAULT_TIMEOUT", 30))
+# Бюджет для ячеек с установкой пакетов через pip
+PIP_INTERRUPT_AFTER = 600
+CPU_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
 ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
 
 
@@ -24,6 +38,8 @@ async def async_run_code(
     iopub_timeout=40,
     wait_for_ready_timeout=30,
     shutdown_kernel=False,
+    metadata=None,
+    on_output=None,
 ):
     assert iopub_timeout > interrupt_after
     try:
@@ -66,48 +82,70 @@ async def async_run_code(
         async def run():
             kc = km.client()
             kc.start_channels()
-            await kc.wait_for_ready(timeout=wait_for_ready_timeout)
-            msg_id = kc.execute(code)
-            execute_result = {}
-            error_traceback = None
-            stream_text_list = []
-            attachments = []
-            while True:
-                message = await get_iopub_msg_with_death_detection(
-                    kc, timeout=iopub_timeout
-                )
-                if logger.isEnabledFor(logging.DEBUG):
-                    logger.debug(json.dumps(message, indent=2, default=str))
-                assert message["parent_header"]["msg_id"] == msg_id
-                msg_type = message["msg_type"]
-                if msg_type == "status":
-                    if message["content"]["execution_state"] == "idle":
-                        break
-                elif msg_type == "stream":
-                    stream_name = message["content"]["name"]
-                    stream_text = message["content"]["text"]
-                    stream_text_list.append(stream_text)
-                elif msg_type == "execute_result":
-                    execute_result = message["content"]["data"]
-                elif msg_type == "error":
-                    error_traceback_lines = message["content"]["traceback"]
-                    error_traceback = "\n".join(error_traceback_lines)
-                    error_traceback = ansi_escape.sub("", error_traceback)
-                elif msg_type == "execute_input":
-                    pass
-                elif msg_type == "display_data":
-                    attachments.append(message["content"]["data"])
+            try:
+                await kc.wait_for_ready(timeout=wait_for_ready_timeout)
+                if metadata:
+                    # Метаданные запроса (например, дедлайн) видны в ядре через
+                    # get_ipython().kernel.get_parent()["metadata"]
+                    msg = kc.session.msg(
+                        "execute_request",
+                        {
+                            "code": code,
+                            "silent": False,
+                            "store_history": True,
+                            "user_expressions": {},
+                            "allow_stdin": kc.allow_stdin,
+                            "stop_on_error": True,
+                        },
+                        metadata=metadata,
+                    )
+                    kc.shell_channel.send(msg)
+                    msg_id = msg["header"]["msg_id"]
                 else:
-                    assert False, f"Unknown message_type: {msg_type}"
-
-            kc.stop_channels()
-
-            return (
-                "".join(stream_text_list) + execute_result.get("text/plain", ""),
-                error_traceback,
-                "".join(stream_text_list),
-                attachments,
-            )
+                    msg_id = kc.execute(code)
+                execute_result = {}
+                error_traceback = None
+                stream_text_list = []
+                attachments = []
+                while True:
+                    message = await get_iopub_msg_with_death_detection(
+                        kc, timeout=iopub_timeout
+                    )
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(json.dumps(message, indent=2, default=str))
+                    assert message["parent_header"]["msg_id"] == msg_id
+                    msg_type = message["msg_type"]
+                    if msg_type == "status":
+                        if message["content"]["execution_state"] == "idle":
+                            break
+                    elif msg_type == "stream":
+                        stream_name = message["content"]["name"]
+                        stream_text = message["content"]["text"]
+                        stream_text_list.append(stream_text)
+                        if on_output is not None:
+                            on_output(stream_text)
+                    elif msg_type == "execute_result":
+                        execute_result = message["content"]["data"]
+                    elif msg_type == "error":
+                        error_traceback_lines = message["content"]["traceback"]
+                        error_traceback = "\n".join(error_traceback_lines)
+                        error_traceback = ansi_escape.sub("", error_traceback)
+                    elif msg_type == "execute_input":
+                        pass
+                    elif msg_type == "display_data":
+                        attachments.append(message["content"]["data"])
+                    else:
+                        assert False, f"Unknown message_type: {msg_type}"
+
+                return (
+                    "".join(stream_text_list) + execute_result.get("text/plain", ""),
+                    error_traceback,
+                    "".join(stream_text_list),
+                    attachments,
+                )
+            finally:
+                # Каналы закрываются и при отмене задачи
+                kc.stop_channels()
 
         if interrupt_after:
             run_task = asyncio.create_task(run())
@@ -129,10 +167,30 @@ async def async_run_code(
             await km.shutdown_kernel()
 
 
+def process_cpu_seconds(pid: int) -> float | None:
+    """Процессорное время процесса вместе с дочерними (например, `!pip`)."""
+    if psutil is not None:
+        try:
+            times = psutil.Process(pid).cpu_times()
+            return times.user + times.system + times.children_user + times.children_system
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Имя процесса в скобках может содержать пробелы
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime, stime, cutime, cstime — поля 14-17 stat
+        ticks = sum(int(value) for value in fields[11:15])
+        return ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
 class StatefulKernel:
     """
     Обёртка над AsyncKernelManager, которая:
-    - при старте — запускает ядро и загружает состояние из файла (если есть)
+    - при старте — запускает ядро и загружает состояние из файла (если есть),
+      затем повторно применяет bootstrap-код (заглушки инструментов и т.п.)
     - при каждом execute — обновляет метку last_used
     - фоновым таском следит за простоями и по таймауту:
         * сохраняет состояние в файл
@@ -150,9 +208,19 @@ class StatefulKernel:
         self.idle_timeout = idle_timeout
         print(state_file)
 
+        self.bootstrap_file = os.path.splitext(state_file)[0] + ".bootstrap.json"
+
         self.km: jupyter_client.AsyncKernelManager | None = None
         self.last_used: float | None = None
         self._idle_task: asyncio.Task | None = None
+        self.bootstrap_version: str | None = None
+        self.kernel_id = os.path.splitext(os.path.basename(state_file))[0]
+        self.last_cpu_time: float | None = None
+        self.last_wall_time: float | None = None
+        # Суммарное время CPU ячеек за время жизни обертки (переживает перезапуск ядра)
+        self.cpu_time_total = 0.0
+        # Вызывается после остановки ядра: по shutdown, простою или смерти ядра
+        self.on_stop: Callable[[], None] | None = None
 
     def _rewrite_pip_commands(self, code: str) -> tuple[str, bool]:
         """
@@ -216,32 +284,107 @@ class StatefulKernel:
                 load_code = f"import dill; dill.load_session('{self.state_file}')"
                 await async_run_code(self.km, load_code)
 
+            # 3) Восстанавливаем bootstrap: заглушки могут не пережить dill
+            if os.path.exists(self.bootstrap_file):
+                with open(self.bootstrap_file, "r", encoding="utf-8") as f:
+                    bootstrap = json.load(f)
+                await async_run_code(self.km, bootstrap["code"], shutdown_kernel=False)
+                self.bootstrap_version = bootstrap["version"]
+
         # Запускаем watcher простоя, если ещё не запущен
         if self._idle_task is None:
             self._idle_task = asyncio.create_task(self._idle_watcher())
 
-    async def execute(self, code: str):
+    async def execute(
+        self,
+        code: str,
+        timeout: float | None = None,
+        timeout_cap: float | None = None,
+        budget: float | None = None,
+        metadata: dict | None = None,
+        on_output=None,
+    ):
+        """
+        `timeout` — бюджет ячейки в секундах (по умолчанию REPL_DEFAULT_TIMEOUT),
+        `timeout_cap` — лимит тенанта, ограничивает и бюджет установки pip,
+        `budget` — сколько осталось до дедлайна запуска: ядро прерывается не позже.
+        `metadata` уходит в execute_request и доступна в ядре,
+        `on_output` получает stdout/stderr по мере выполнения.
+        Время CPU и wall time ячейки сохраняются в `last_cpu_time` / `last_wall_time`.
+        """
         # Убедиться, что ядро запущено и состояние загружено
         await self.start()
         # Обновить метку активности
         self.last_used = time.time()
         # Переписать потенциально небезопасные команды установки pip в привязанные к ядру
         rewritten_code, contains_pip = self._rewrite_pip_commands(code)
-
-        # Для pip-установок отключаем авто-интеррапт и увеличиваем таймауты
+        interrupt_after = timeout or DEFAULT_INTERRUPT_AFTER
         if contains_pip:
-            result = await async_run_code(
+            # Установка пакетов долгая: для нее свой бюджет
+            interrupt_after = max(interrupt_after, PIP_INTERRUPT_AFTER)
+        if timeout_cap is not None:
+            interrupt_after = min(interrupt_after, timeout_cap)
+        if budget is not None:
+            interrupt_after = max(0.1, min(interrupt_after, budget))
+
+        cpu_before = self.cpu_seconds()
+        started = time.perf_counter()
+        try:
+            return await async_run_code(
                 self.km,
                 rewritten_code,
-                iopub_timeout=600,
-                wait_for_ready_timeout=60,
+                interrupt_after=interrupt_after,
+                iopub_timeout=interrupt_after + 10,
+                wait_for_ready_timeout=60 if contains_pip else 30,
                 shutdown_kernel=False,
+                metadata=metadata,
+                on_output=on_output,
             )
-        else:
-            # Выполнить код через async_run_code с настройками по умолчанию
-            result = await async_run_code(
-                self.km, rewritten_code, shutdown_kernel=False
-            )
+        except KernelDeath:
+            # Процесс ядра уже мертв: сохранять нечего, только освобождаем ресурсы
+            logger.warning("Ядро %s умерло во время выполнения", self.kernel_id)
+            try:
+                await self.km.shutdown_kernel(now=True)
+            except Exception:
+                logger.exception("Не удалось остановить умершее ядро")
+            self._stopped()
+            raise
+        finally:
+            self.last_wall_time = time.perf_counter() - started
+            cpu_after = self.cpu_seconds()
+            self.last_cpu_time = None
+            if cpu_before is not None and cpu_after is not None:
+                self.last_cpu_time = max(0.0, cpu_after - cpu_before)
+                self.cpu_time_total += self.last_cpu_time
+                metrics.observe("repl_cpu_seconds", self.last_cpu_time, CPU_BUCKETS)
+
+    def cpu_seconds(self) -> float | None:
+        """Процессорное время процесса ядра с момента его запуска."""
+        try:
+            pid = self.km.provisioner.process.pid
+        except AttributeError:
+            return None
+        return process_cpu_seconds(pid)
+
+    async def interrupt(self):
+        """Прерывает выполняющуюся ячейку (например, когда запуск отменен)."""
+        if self.km is not None:
+            await self.km.interrupt_kernel()
+
+    async def bootstrap(self, code: str, version: str):
+        """
+        Выполняет bootstrap-код один раз на версию и сохраняет его,
+        чтобы применить заново после перезапуска ядра.
+        """
+        await self.start()
+        self.last_used = time.time()
+        if version == self.bootstrap_version:
+            return None
+        result = await async_run_code(self.km, code, shutdown_kernel=False)
+        if not result[1]:
+            with open(self.bootstrap_file, "w", encoding="utf-8") as f:
+                json.dump({"version": version, "code": code}, f, ensure_ascii=False)
+            self.bootstrap_version = version
         return result
 
     async def shutdown(self):
@@ -256,13 +399,18 @@ class StatefulKernel:
 
             # Останавливаем само ядро
             await self.km.shutdown_kernel(now=True)
+        self._stopped()
 
+    def _stopped(self):
         # Сбросить всё, чтобы при следующем start() поднялось заново
         self.km = None
         self.last_used = None
+        self.bootstrap_version = None
         if self._idle_task:
             self._idle_task.cancel()
             self._idle_task = None
+        if self.on_stop is not None:
+            self.on_stop()
 
     async def _idle_watcher(self):
         while True:
@@ -0,0 +1,129 @@
+"""
+Планировщик выполнения кода в ядрах.
+
+- У каждого ядра своя FIFO-очередь: ячейки одного ядра выполняются строго
+  по одной, иначе параллельные запросы читают iopub друг друга.
+- Одновременно выполняются не больше `REPL_MAX_CONCURRENT_KERNELS` ядер
+  (по умолчанию — число ядер CPU); ожидающие ячейки слота не занимают.
+- Время ожидания в очереди и время выполнения пишутся в гистограммы
+  `repl_queue_wait_seconds` и `repl_exec_seconds`; kernel_id в метки не
+  входит (ядер неограниченно много), он пишется в лог.
+- `forget` вызывается, когда ядро остановлено (shutdown, простой, смерть):
+  очередь ядра удаляется, как только в ней не останется ячеек.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Set
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_KERNELS = int(
+    os.environ.get("REPL_MAX_CONCURRENT_KERNELS") or os.cpu_count() or 1
+)
+# Ячейки бывают долгими, поэтому корзины до 10 минут
+EXEC_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class ScheduledRun:
+    """Запрос в очереди ядра: `started` выставляется, когда код начал выполняться."""
+
+    def __init__(self, kernel_id: str):
+        self.kernel_id = kernel_id
+        self.started = False
+        self.task: asyncio.Task | None = None
+
+
+class KernelScheduler:
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_KERNELS):
+        self.max_concurrent = max_concurrent
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._queued: Dict[str, int] = defaultdict(int)
+        # Остановленные ядра, чьи очереди удаляются после последней ячейки
+        self._forgotten: Set[str] = set()
+        self.running = 0
+
+    async def _run(
+        self, run: ScheduledRun, factory: Callable[[], Awaitable], kind: str
+    ):
+        kernel_id = run.kernel_id
+        enqueued = time.perf_counter()
+        lock = self._locks.setdefault(kernel_id, asyncio.Lock())
+        self._queued[kernel_id] += 1
+        try:
+            # Сначала очередь ядра, потом общий слот: пока ячейка ждет
+            # предыдущую в своем ядре, она не мешает другим ядрам
+            async with lock, self._semaphore:
+                self._queued[kernel_id] -= 1
+                run.started = True
+                started = time.perf_counter()
+                metrics.observe("repl_queue_wait_seconds", started - enqueued)
+                self.running += 1
+                try:
+                    return await factory()
+                finally:
+                    self.running -= 1
+                    elapsed = time.perf_counter() - started
+                    metrics.observe(
+                        "repl_exec_seconds", elapsed, EXEC_BUCKETS, kind=kind
+                    )
+                    logger.debug(
+                        "kernel_id=%s kind=%s queue_wait=%.3f exec=%.3f",
+                        kernel_id,
+                        kind,
+                        started - enqueued,
+                        elapsed,
+                    )
+        finally:
+            if not run.started:
+                # Отменен, не дождавшись очереди
+                self._queued[kernel_id] -= 1
+            if not self._queued[kernel_id]:
+                self._queued.pop(kernel_id, None)
+                if kernel_id in self._forgotten:
+                    self._drop(kernel_id)
+
+    def submit(
+        self, kernel_id: str, factory: Callable[[], Awaitable], kind: str = "code"
+    ) -> ScheduledRun:
+        """Ставит выполнение в очередь ядра и сразу возвращает его описание."""
+        run = ScheduledRun(kernel_id)
+        run.task = asyncio.create_task(self._run(run, factory, kind))
+        return run
+
+    async def run(
+        self, kernel_id: str, factory: Callable[[], Awaitable], kind: str = "code"
+    ):
+        return await self.submit(kernel_id, factory, kind).task
+
+    def forget(self, kernel_id: str):
+        """
+        Убирает очередь ядра после его остановки. Если в очереди еще есть
+        ячейки (или ядро останавливается изнутри своей же ячейки), очередь
+        удаляется после последней из них.
+        """
+        lock = self._locks.get(kernel_id)
+        if lock is None:
+            return
+        if lock.locked() or self._queued.get(kernel_id):
+            self._forgotten.add(kernel_id)
+        else:
+            self._drop(kernel_id)
+
+    def _drop(self, kernel_id: str):
+        self._forgotten.discard(kernel_id)
+        lock = self._locks.get(kernel_id)
+        if lock is not None and not lock.locked():
+            del self._locks[kernel_id]
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queued": dict(self._queued),
+        }
@@ -1,12 +1,21 @@
 import asyncio
 import functools
 import json
+import os
+import threading
+import time
 from typing import Any
 
 import aiohttp
 import requests
 from pydantic import BaseModel
 
+# Сколько вызовов инструментов из ядра выполняется одновременно
+TOOL_CLIENT_CONCURRENCY = int(os.getenv("TOOL_CLIENT_CONCURRENCY", 8))
+# Лимит на один вызов, если у запуска нет дедлайна или до него дольше
+TOOL_CALL_TIMEOUT = 600.0
+DEADLINE_HEADER = "X-Giga-Deadline"
+
 
 class ToolExecuteException(Exception):
     pass
@@ -16,6 +25,82 @@ class ToolNotFoundException(Exception):
     pass
 
 
+class ToolDeadlineExceeded(ToolExecuteException):
+    pass
+
+
+def _current_deadline() -> float | None:
+    """
+    Дедлайн запуска, с которым выполняется текущая ячейка: REPL передает его
+    в метаданных execute_request. Читается в потоке ячейки при вызове инструмента.
+    """
+    try:
+        from IPython import get_ipython
+
+        parent = get_ipython().kernel.get_parent()
+        deadline = (parent.get("metadata") or {}).get("deadline")
+        return float(deadline) if deadline is not None else None
+    except Exception:
+        return None
+
+
+def _request_options(deadline: float | None) -> dict:
+    """Заголовок дедлайна и таймаут запроса по остатку времени."""
+    if deadline is None:
+        return {"headers": {}, "timeout": TOOL_CALL_TIMEOUT}
+    left = deadline - time.time()
+    if left <= 0:
+        raise ToolDeadlineExceeded("Время выполнения запуска истекло")
+    return {
+        "headers": {DEADLINE_HEADER: f"{deadline:.3f}"},
+        "timeout": min(TOOL_CALL_TIMEOUT, left),
+    }
+
+
+class _BackgroundLoop:
+    """
+    Отдельный event loop в фоновом потоке с общей aiohttp-сессией.
+    В ядре уже крутится свой loop, поэтому синхронные `batch_call`
+    и асинхронные `acall` выполняют запросы здесь, переиспользуя соединения.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+        self._session: aiohttp.ClientSession | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="tool-client-loop", daemon=True
+                ).start()
+        return self._loop
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+
+    async def session(self) -> tuple[aiohttp.ClientSession, asyncio.Semaphore]:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=600.0),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session, self._semaphore
+
+
+_runner = _BackgroundLoop(TOOL_CLIENT_CONCURRENCY)
+_http = requests.Session()
+
+
+def _tool_name(tool) -> str:
+    return tool if isinstance(tool, str) else tool.__name__
+
+
 class ToolClient(BaseModel):
     base_url: str
     state: Any = {}
@@ -23,12 +108,15 @@ class ToolClient(BaseModel):
     def set_state(self, state):
         self.state = state
 
-    async def aexecute(self, tool_name, kwargs):
-        async with aiohttp.ClientSession() as session:
+    async def _apost(self, tool_name, kwargs, deadline=None):
+        options = _request_options(deadline)
+        session, semaphore = await _runner.session()
+        async with semaphore:
             async with session.post(
                 f"{self.base_url}/{tool_name}",
-                json=kwargs,
-                timeout=600.0,
+                json={"kwargs": kwargs, "state": self.state},
+                headers=options["headers"],
+                timeout=aiohttp.ClientTimeout(total=options["timeout"]),
             ) as res:
                 if res.status == 200:
                     data = (await res.json())['data']
@@ -42,11 +130,104 @@ class ToolClient(BaseModel):
                 else:
                     raise ToolExecuteException((await res.json()))
 
+    async def aexecute(self, tool_name, kwargs):
+        return await asyncio.wrap_future(
+            _runner.submit(self._apost(tool_name, kwargs, _current_deadline()))
+        )
+
+    async def _abatch(self, tool_name, kwargs_list, return_exceptions, deadline=None):
+        """
+        Один запрос к `/batch` tool server: вызовы выполняются на сервере
+        параллельно, результаты приходят построчно (NDJSON) в исходном порядке.
+        """
+        options = _request_options(deadline)
+        session, semaphore = await _runner.session()
+        async with semaphore:
+            async with session.post(
+                f"{self.base_url}/batch",
+                json={
+                    "items": [
+                        {"tool": tool_name, "kwargs": kwargs} for kwargs in kwargs_list
+                    ],
+                    "state": self.state,
+                },
+                headers=options["headers"],
+                timeout=aiohttp.ClientTimeout(total=options["timeout"]),
+            ) as res:
+                if res.status == 404:
+                    batch_supported = False
+                elif res.status != 200:
+                    raise ToolExecuteException((await res.text()))
+                else:
+                    batch_supported = True
+                    results = []
+                    # Строки с большими результатами длиннее лимита readline у aiohttp
+                    buffer = b""
+                    async for chunk in res.content.iter_any():
+                        buffer += chunk
+                        *lines, buffer = buffer.split(b"\n")
+                        for line in lines:
+                            if line.strip():
+                                results.append(self._batch_item_result(json.loads(line)))
+        if not batch_supported:
+            # Старый tool server без /batch — отдельный запрос на каждый вызов
+            return await asyncio.gather(
+                *[self._apost(tool_name, kwargs, deadline) for kwargs in kwargs_list],
+                return_exceptions=return_exceptions,
+            )
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    @staticmethod
+    def _batch_item_result(item):
+        if item["status"] == 200:
+            data = item["data"]
+            try:
+                data = json.loads(data)
+            except Exception:
+                pass
+            return data
+        elif item["status"] == 404:
+            return ToolNotFoundException(item["error"])
+        else:
+            return ToolExecuteException(item["error"])
+
+    async def abatch_call(self, tool, kwargs_list, return_exceptions=False):
+        """
+        Асинхронно вызывает инструмент для каждого набора аргументов
+        одним запросом к `/batch`. Результаты возвращаются в порядке `kwargs_list`.
+        """
+        return await asyncio.wrap_future(
+            _runner.submit(
+                self._abatch(
+                    _tool_name(tool),
+                    list(kwargs_list),
+                    return_exceptions,
+                    _current_deadline(),
+                )
+            )
+        )
+
+    def batch_call(self, tool, kwargs_list, return_exceptions=False):
+        """Синхронная версия `abatch_call`: можно вызывать из обычного кода ячейки."""
+        return _runner.submit(
+            self._abatch(
+                _tool_name(tool),
+                list(kwargs_list),
+                return_exceptions,
+                _current_deadline(),
+            )
+        ).result()
+
     def execute(self, tool_name, kwargs):
         url = f"{self.base_url}/{tool_name}"
+        options = _request_options(_current_deadline())
         try:
-            response = requests.post(
-                url, json={"kwargs": kwargs, "state": self.state}, timeout=600.0
+            response = _http.post(
+                url, json={"kwargs": kwargs, "state": self.state}, **options
             )
         except requests.RequestException as e:
             # Ошибка сети или таймаут
@@ -80,6 +261,8 @@ class ToolClient(BaseModel):
         - берёт имя функции как название инструмента,
         - собирает все именованные аргументы в dict,
         - вызывает self.execute(tool_name, kwargs) и возвращает результат.
+        Асинхронный вызов: `await func.acall(**kwargs)`,
+        пакетный: `func.batch([kwargs, ...])` / `await func.abatch([kwargs, ...])`.
         """
 
         @functools.wraps(func)
@@ -92,4 +275,10 @@ class ToolClient(BaseModel):
             tool_name = func.__name__
             return self.execute(tool_name, kwargs)
 
+        async def acall(**kwargs):
+            return await self.aexecute(func.__name__, kwargs)
+
+        wrapper.acall = acall
+        wrapper.batch = functools.partial(self.batch_call, func.__name__)
+        wrapper.abatch = functools.partial(self.abatch_call, func.__name__)
         return wrapper
@@ -1,21 +1,98 @@
-import io
+import asyncio
+import hashlib
+import json
 import mimetypes
+import multiprocessing
 import os
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
-import requests
 
-from fastapi import FastAPI, HTTPException, File, UploadFile, Response
+import httpx
+from fastapi import (
+    BackgroundTasks,
+    FastAPI,
+    HTTPException,
+    File,
+    Request,
+    UploadFile,
+    Response,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
 from langchain_gigachat import GigaChat
 from dotenv import load_dotenv
 
-from PIL import Image, ImageOps
+from app.datasets import build_cache, is_tabular
+from app.http_cache import file_response
+from app.images import make_thumbnail
 
 load_dotenv("../../.env")
 
-app = FastAPI()
+FILES_DIR = os.environ.get("FILES_DIR", "files")
+os.makedirs(FILES_DIR, exist_ok=True)
+# Индекс загрузок: sha256 файлов по путям и id изображений в LangGraph API по sha256 —
+# повторно загруженное изображение не сжимается и не отправляется заново
+INDEX_PATH = os.path.join(FILES_DIR, ".index.json")
+UPLOAD_TMP_DIR = os.path.join(FILES_DIR, ".uploads")
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+# Сжатые копии текстовых файлов для отдачи с Content-Encoding
+COMPRESSED_DIR = os.path.join(FILES_DIR, ".compressed")
+CHUNK_SIZE = 1024 * 1024
+THUMBNAIL_WORKERS = int(os.environ.get("UPLOAD_THUMBNAIL_WORKERS", 2))
+
+
+class UploadState:
+    def __init__(self):
+        self.http: httpx.AsyncClient | None = None
+        self.thumbnails: ProcessPoolExecutor | None = None
+        # path -> запись индекса: sha256 известен, пока размер и mtime файла те же
+        self.paths: dict = {}
+        # sha256 -> id изображения в LangGraph API
+        self.file_ids: dict = {}
+        self.index_lock = asyncio.Lock()
+
+
+state = UploadState()
+
+
+def load_index() -> tuple[dict, dict]:
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}, {}
+    paths = {
+        path: entry
+        for path, entry in index.get("paths", {}).items()
+        if os.path.exists(path)
+    }
+    return paths, index.get("file_ids", {})
+
+
+def save_index(index: dict):
+    tmp = f"{INDEX_PATH}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp, INDEX_PATH)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    state.paths, state.file_ids = load_index()
+    # Один пул соединений к LangGraph API на весь процесс
+    state.http = httpx.AsyncClient(timeout=60)
+    # Разбор и сжатие изображений — CPU, выносим из event loop в процессы
+    # spawn: fork процесса с потоками (to_thread, uvicorn) может зависнуть
+    state.thumbnails = ProcessPoolExecutor(
+        max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+    yield
+    await state.http.aclose()
+    state.thumbnails.shutdown(cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
@@ -27,9 +104,6 @@ app.add_middleware(
     allow_headers=["*"],  # какие заголовки
 )
 
-FILES_DIR = os.environ.get("FILES_DIR", "files")
-os.makedirs(FILES_DIR, exist_ok=True)
-
 llm = GigaChat(
     profanity_check=False,
     verify_ssl_certs=False,
@@ -57,6 +131,38 @@ def uniquify(path):
     return path
 
 
+async def save_upload(file: UploadFile) -> tuple[str, str]:
+    """Пишет файл во временный путь по частям, считая sha256 на лету."""
+    tmp_path = os.path.join(UPLOAD_TMP_DIR, str(uuid.uuid4()))
+    digest = hashlib.sha256()
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        while contents := await file.read(CHUNK_SIZE):
+            digest.update(contents)
+            await asyncio.to_thread(f.write, contents)
+    except BaseException:
+        f.close()
+        os.remove(tmp_path)
+        raise
+    await asyncio.to_thread(f.close)
+    return tmp_path, digest.hexdigest()
+
+
+async def forward_image(path: str) -> str | None:
+    """Сжимает изображение и отправляет его в LangGraph API, возвращает id."""
+    api_url_base = os.getenv("LANGGRAPH_API_URL", "").rstrip("/")
+    if not api_url_base:
+        raise RuntimeError("LANGGRAPH_API_URL is not set")
+    loop = asyncio.get_running_loop()
+    thumbnail = await loop.run_in_executor(state.thumbnails, make_thumbnail, path)
+    response = await state.http.post(
+        f"{api_url_base}/upload/image/",
+        files={"file": (f"{uuid.uuid4()}.jpg", thumbnail, "image/jpeg")},
+    )
+    response.raise_for_status()
+    return response.json().get("id")
+
+
 @app.options("/upload")
 def upload_options():
     return Response(
@@ -70,58 +176,68 @@ def upload_options():
 
 
 @app.post("/upload")
-def upload(file: UploadFile = File(...)):
+async def upload(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     try:
-        path = uniquify(os.path.join(FILES_DIR, file.filename))
-        with open(path, "wb") as f:
-            while contents := file.file.read(1024 * 1024):
-                f.write(contents)
-        if file.content_type.startswith("image/"):
-            image = ImageOps.exif_transpose(Image.open(path))
-            max_side = 1024
-            if max(image.size) > max_side:
-                image.thumbnail((max_side, max_side), Image.LANCZOS)
-
-            buf = io.BytesIO()
-            image.convert("RGB").save(
-                buf,
-                format="JPEG",
-                quality=85,
-                optimize=True,
-                progressive=True,
-            )
-            buf.seek(0)
-            api_url_base = os.getenv("LANGGRAPH_API_URL", "").rstrip("/")
-            if not api_url_base:
-                raise RuntimeError("LANGGRAPH_API_URL is not set")
-            url = f"{api_url_base}/upload/image/"
-            response = requests.post(
-                url,
-                files={
-                    "file": (
-                        f"{uuid.uuid4()}.jpg",
-                        buf,
-                        "image/jpeg",
-                    )
-                },
-                timeout=60,
-            )
-            response.raise_for_status()
-            data = response.json()
-            return {"path": path, "file_id": data.get("id")}
-    except Exception as e:
-        raise e
+        tmp_path, sha256 = await save_upload(file)
     finally:
-        file.file.close()
+        await file.close()
+    # Файл всегда сохраняется под именем пользователя: прежняя копия того же
+    # содержимого могла быть изменена кодом в ядре
+    async with state.index_lock:
+        path = uniquify(os.path.join(FILES_DIR, file.filename))
+        os.replace(tmp_path, path)
+        stat = os.stat(path)
+        state.paths[path] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+    if is_tabular(path):
+        # Колоночный кэш строится после ответа, ядра читают его через read_dataset
+        background_tasks.add_task(build_cache, path)
+    response = {"path": path, "sha256": sha256}
+    if (file.content_type or "").startswith("image/"):
+        # id в LangGraph API привязан к содержимому, его можно отдать повторно
+        file_id = state.file_ids.get(sha256)
+        response["deduplicated"] = file_id is not None
+        if file_id is None:
+            file_id = state.file_ids[sha256] = await forward_image(path)
+        response["file_id"] = file_id
+    async with state.index_lock:
+        await asyncio.to_thread(
+            save_index, {"paths": dict(state.paths), "file_ids": dict(state.file_ids)}
+        )
+    return response
+
 
-    return {"path": path}
+def indexed_digest(path: str) -> str | None:
+    """
+    sha256 файла из индекса загрузок. Код в ядре может перезаписать файл,
+    поэтому хэш верен, только пока размер и mtime совпадают с записанными при
+    загрузке; иначе None и file_response посчитает хэш заново.
+    """
+    entry = state.paths.get(path)
+    if entry is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != (entry.get("size"), entry.get("mtime_ns")):
+        return None
+    return entry["sha256"]
 
 
 @app.get("/files/{filename}")
-def download_file(filename: str):
+async def download_file(filename: str, request: Request):
     # Нормализуем путь и защищаемся от path traversal
     file_path = os.path.normpath(os.path.join(FILES_DIR, filename))
-    if not file_path.startswith(FILES_DIR) or not os.path.isfile(file_path):
+    if (
+        not file_path.startswith(FILES_DIR)
+        or not os.path.isfile(file_path)
+        # Служебные файлы (индекс, кэш таблиц, временные загрузки) не отдаем
+        or os.path.relpath(file_path, FILES_DIR).startswith(".")
+    ):
         raise HTTPException(status_code=404, detail="Файл не найден")
 
     # Определяем MIME-тип по расширению
@@ -135,10 +251,13 @@ def download_file(filename: str):
     else:
         disposition = "attachment"
 
-    return FileResponse(
-        path=file_path,
-        media_type=mime_type,
+    return await file_response(
+        request,
+        file_path,
+        mime_type,
+        digest=indexed_digest(file_path),
         headers={
             "Content-Disposition": f'{disposition}; filename="{os.path.basename(file_path)}"'
         },
+        compressed_dir=COMPRESSED_DIR,
     )
@@ -0,0 +1,151 @@
+import hashlib
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.http_cache import file_response, parse_range
+
+BODY = b"".join(f"line {i}\n".encode() for i in range(1000))
+DIGEST = hashlib.sha256(BODY).hexdigest()
+IDENTITY_ETAG = f'"{DIGEST}"'
+GZIP_ETAG = f'"{DIGEST}-gzip"'
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(BODY)
+    compressed_dir = str(tmp_path / ".compressed")
+    app = FastAPI()
+
+    @app.get("/file")
+    async def get_file(request: Request):
+        return await file_response(
+            request, str(path), "text/plain", compressed_dir=compressed_dir
+        )
+
+    return TestClient(app)
+
+
+def test_identity_etag_and_not_modified(client):
+    response = client.get("/file", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["etag"] == IDENTITY_ETAG
+    assert "content-encoding" not in response.headers
+    assert response.content == BODY
+
+    response = client.get(
+        "/file",
+        headers={"Accept-Encoding": "identity", "If-None-Match": IDENTITY_ETAG},
+    )
+    assert response.status_code == 304
+
+
+def test_gzip_variant_has_own_etag(client):
+    response = client.get("/file", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == GZIP_ETAG
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["accept-ranges"] == "none"
+    assert response.content == BODY
+
+    # ETag несжатого варианта не подтверждает сжатую копию
+    response = client.get(
+        "/file", headers={"Accept-Encoding": "gzip", "If-None-Match": IDENTITY_ETAG}
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] == GZIP_ETAG
+
+    response = client.get(
+        "/file", headers={"Accept-Encoding": "gzip", "If-None-Match": GZIP_ETAG}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == GZIP_ETAG
+
+
+def test_range_is_served_from_identity(client):
+    response = client.get(
+        "/file", headers={"Accept-Encoding": "gzip", "Range": "bytes=10-19"}
+    )
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == IDENTITY_ETAG
+    assert response.headers["content-range"] == f"bytes 10-19/{len(BODY)}"
+    assert response.content == BODY[10:20]
+
+
+def test_suffix_range(client):
+    response = client.get("/file", headers={"Range": "bytes=-5"})
+    assert response.status_code == 206
+    assert response.content == BODY[-5:]
+
+
+def test_if_range_matches_identity_only(client):
+    response = client.get(
+        "/file",
+        headers={
+            "Accept-Encoding": "identity",
+            "Range": "bytes=0-9",
+            "If-Range": IDENTITY_ETAG,
+        },
+    )
+    assert response.status_code == 206
+    assert response.content == BODY[:10]
+
+    # ETag сжатой копии в If-Range — диапазон не применяется, файл целиком
+    response = client.get(
+        "/file",
+        headers={
+            "Accept-Encoding": "identity",
+            "Range": "bytes=0-9",
+            "If-Range": GZIP_ETAG,
+        },
+    )
+    assert response.status_code == 200
+    assert "content-range" not in response.headers
+    assert response.content == BODY
+
+
+def test_stale_if_range_with_gzip_returns_whole_variant(client):
+    response = client.get(
+        "/file",
+        headers={
+            "Accept-Encoding": "gzip",
+            "Range": "bytes=0-9",
+            "If-Range": '"stale"',
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == GZIP_ETAG
+    assert response.content == BODY
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/file", headers={"Range": f"bytes={len(BODY)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(BODY)}"
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-9", (0, 9)),
+        ("bytes=90-", (90, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=95-200", (95, 99)),
+        ("bytes=0-1,5-6", None),
+        ("items=0-1", None),
+        ("bytes=a-b", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=5-1", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from "react";
 import styled from "styled-components";
 import { StoreClient } from "@langchain/langgraph-sdk/client";
+import { blobUrl } from "./GraphImage.tsx";
 
 const Placeholder = styled.div`
   width: 100%;
@@ -43,7 +44,13 @@ const AudioPlayer: React.FC<HTMLPageProps> = ({ id, alt }) => {
       controls={true}
       style={{ marginTop: "5px", marginBottom: "5px", display: "block" }}
     >
-      <source src={`data:audio/mp3;base64, ${attachment.data}`} />
+      <source
+        src={
+          attachment.blob
+            ? blobUrl(attachment.blob, "audio/mp3")
+            : `data:audio/mp3;base64, ${attachment.data}`
+        }
+      />
     </audio>
   );
 };
@@ -58,6 +58,9 @@ const SelectorButton = styled.button<{ $selected: boolean, isGraph: boolean }>`
   }
 `;
 
+export const blobUrl = (hash: string, type: string) =>
+  `/graph/blobs/${hash}?type=${encodeURIComponent(type)}`;
+
 interface GraphImageProps {
   id: string;
   alt?: string;
@@ -75,8 +78,19 @@ const GraphImage: React.FC<GraphImageProps> = ({ id, alt }) => {
   useEffect(() => {
     client
       .getItem(["attachments"], id)
-      .then((res) => {
-        setAttachment(res?.value);
+      .then(async (res) => {
+        const value: any = res?.value;
+        // Новые вложения хранят только sha256, данные графика берем из blob store
+        if (
+          value?.blob &&
+          value.type === "application/vnd.plotly.v1+json" &&
+          value.data === undefined
+        ) {
+          const resp = await fetch(blobUrl(value.blob, value.type));
+          if (!resp.ok) throw new Error(resp.statusText);
+          value.data = await resp.json();
+        }
+        setAttachment(value);
       })
       .catch(() => {
         setError(true);
@@ -148,7 +162,11 @@ const GraphImage: React.FC<GraphImageProps> = ({ id, alt }) => {
         </SelectorButton>
         <div style={{ display: "flex" }}>
           <img
-            src={`data:image/png;base64,${attachment["data"]}`}
+            src={
+              attachment["blob"]
+                ? blobUrl(attachment["blob"], "image/png")
+                : `data:image/png;base64,${attachment["data"]}`
+            }
             alt={`attachment-${attachment["file_id"]}`}
             style={{
               maxWidth: "100%",